@@ -47,11 +47,40 @@ poetry install
 echo "📦 Installing Gunicorn and Gevent..."
 poetry add gunicorn gevent
 
-# Step 6: Run Flask App using Gunicorn (with Gevent workers)
+# Step 5b: Apply database migrations, then create the admin user once; the processes started
+# below skip this bootstrap, so (re)starting a worker does no database writes
+echo "🗄️ Applying database migrations..."
+export AUTO_BOOTSTRAP=false
+poetry run flask db upgrade
+poetry run flask bootstrap
+
+# Step 5c: Workers write their metrics here so /metrics can add them up; start from a clean slate
+export PROMETHEUS_MULTIPROC_DIR="/home/$USER/proxy_manager/data/metrics"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Step 6: Run Flask App using Gunicorn (with Gevent workers); gunicorn.conf.py preloads the app
+# and proxy pool in the master, so workers are forked ready to serve
 echo "🚀 Starting Flask app using Gunicorn..."
-poetry run gunicorn --workers=6 --worker-class=gevent --worker-connections=1000 \
-  --max-requests=10000 --max-requests-jitter=1000 --backlog=2048 --bind 127.0.0.1:5000 \
-  --timeout=30 "proxy_manager:create_app()" &
+poetry run gunicorn -c gunicorn.conf.py proxy_manager.wsgi:app &
+
+# Step 6a: Keep proxy health and latency fresh in the background
+echo "🩺 Starting proxy health checker..."
+poetry run flask health-check --loop &
+
+# Step 6b: Optionally serve /api/proxy/request from the async forwarding engine
+ASYNC_LOCATION=""
+if [ "$ASYNC_ENGINE" = "true" ]; then
+    echo "🚀 Starting async forwarding engine using Uvicorn..."
+    poetry install -E async
+    poetry run uvicorn proxy_manager.asgi:app --host 127.0.0.1 --port 5001 --workers 2 &
+    ASYNC_LOCATION="location = /api/proxy/request {
+        proxy_pass http://127.0.0.1:5001;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+    }"
+fi
 
 # Step 7: Configure NGINX Dynamically
 echo "🔧 Configuring NGINX..."
@@ -63,6 +92,8 @@ server {
     listen 80;
     server_name $DOMAIN;
 
+    $ASYNC_LOCATION
+
     location / {
         proxy_pass http://127.0.0.1:5000;
         proxy_set_header Host \$host;
@@ -78,6 +109,8 @@ server {
     ssl_certificate /etc/letsencrypt/live/$DOMAIN/fullchain.pem;
     ssl_certificate_key /etc/letsencrypt/live/$DOMAIN/privkey.pem;
 
+    $ASYNC_LOCATION
+
     location / {
         proxy_pass http://127.0.0.1:5000;
         proxy_set_header Host \$host;
@@ -0,0 +1,48 @@
+"""
+Gunicorn settings for deploy.sh
+
+The app is preloaded in the master (proxy_manager.wsgi) and workers are forked
+from it, so starting or recycling a worker (--max-requests) costs a fork
+instead of importing the app, building it and loading the proxy pool. Run
+`flask db upgrade` and `flask bootstrap` before starting, with
+AUTO_BOOTSTRAP=false so the app doesn't repeat the bootstrap.
+
+Command-line flags and GUNICORN_CMD_ARGS still override these.
+"""
+import gc
+import os
+
+bind = os.getenv('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', 6))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+preload_app = True
+
+if worker_class == 'gevent':
+    # The app is imported in the master, so patch before it creates any sockets, locks or threads
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def on_starting(server):
+    # Workers of the previous run may have been killed mid-request; their in-flight counts are stale
+    from proxy_manager.services.shared import shared_state
+    shared_state.reset_inflight()
+
+
+def when_ready(server):
+    # Objects built by the preload are never freed; keeping them out of the collector's reach
+    # stops it from touching (and so copying) the pages the workers share with the master
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges from the multiprocess metrics directory
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
@@ -0,0 +1,55 @@
+"""initial schema
+
+Revision ID: 3f2a9c1d4b7e
+Revises: 
+Create Date: 2026-10-18 20:12:04.118233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d4b7e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created before migrations existed already have these tables (db.create_all)
+    existing = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'user' not in existing:
+        op.create_table('user',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=80), nullable=False),
+        sa.Column('password_hash', sa.String(length=256), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('username')
+        )
+
+    if 'proxy' not in existing:
+        op.create_table('proxy',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('webshare_id', sa.String(length=50), nullable=True),
+        sa.Column('ip', sa.String(length=50), nullable=False),
+        sa.Column('port', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=50), nullable=False),
+        sa.Column('password', sa.String(length=50), nullable=False),
+        sa.Column('proxy_type', sa.String(length=20), nullable=True),
+        sa.Column('last_used', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('success_count', sa.Integer(), nullable=True),
+        sa.Column('failure_count', sa.Integer(), nullable=True),
+        sa.Column('country_code', sa.String(length=2), nullable=True),
+        sa.Column('city_name', sa.String(length=100), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('webshare_id')
+        )
+
+
+def downgrade():
+    op.drop_table('proxy')
+    op.drop_table('user')
@@ -0,0 +1,40 @@
+"""add proxy health columns
+
+Revision ID: 8b41d6e0c2a5
+Revises: 3f2a9c1d4b7e
+Create Date: 2026-10-18 20:14:37.502811
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41d6e0c2a5'
+down_revision = '3f2a9c1d4b7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('proxy')}
+    with op.batch_alter_table('proxy', schema=None) as batch_op:
+        if 'is_healthy' not in columns:
+            batch_op.add_column(sa.Column('is_healthy', sa.Boolean(), nullable=True))
+        if 'connect_ms' not in columns:
+            batch_op.add_column(sa.Column('connect_ms', sa.Float(), nullable=True))
+        if 'ttfb_ms' not in columns:
+            batch_op.add_column(sa.Column('ttfb_ms', sa.Float(), nullable=True))
+        if 'last_checked' not in columns:
+            batch_op.add_column(sa.Column('last_checked', sa.DateTime(timezone=True), nullable=True))
+        if 'last_check_error' not in columns:
+            batch_op.add_column(sa.Column('last_check_error', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('proxy', schema=None) as batch_op:
+        batch_op.drop_column('last_check_error')
+        batch_op.drop_column('last_checked')
+        batch_op.drop_column('ttfb_ms')
+        batch_op.drop_column('connect_ms')
+        batch_op.drop_column('is_healthy')
@@ -0,0 +1,26 @@
+"""add proxy last_checked index
+
+Revision ID: a9e4c71d5f20
+Revises: f3a8c2d61b07
+Create Date: 2026-10-18 23:52:17.604381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e4c71d5f20'
+down_revision = 'f3a8c2d61b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    indexes = {i['name'] for i in sa.inspect(op.get_bind()).get_indexes('proxy')}
+    if 'ix_proxy_last_checked' not in indexes:
+        op.create_index('ix_proxy_last_checked', 'proxy', ['last_checked'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_proxy_last_checked', table_name='proxy')
@@ -0,0 +1,33 @@
+"""add generation
+
+Revision ID: b6d2f8e4a913
+Revises: a9e4c71d5f20
+Create Date: 2026-10-19 00:21:43.815207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2f8e4a913'
+down_revision = 'a9e4c71d5f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if 'generation' not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            'generation',
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('value', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+    if not bind.execute(sa.text("SELECT 1 FROM generation WHERE name = 'credentials'")).first():
+        op.execute("INSERT INTO generation (name, value) VALUES ('credentials', 0)")
+
+
+def downgrade():
+    op.drop_table('generation')
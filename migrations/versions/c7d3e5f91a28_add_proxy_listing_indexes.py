@@ -0,0 +1,48 @@
+"""add proxy listing indexes
+
+Revision ID: c7d3e5f91a28
+Revises: 8b41d6e0c2a5
+Create Date: 2026-10-18 21:03:52.640917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d3e5f91a28'
+down_revision = '8b41d6e0c2a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    indexes = {i['name'] for i in sa.inspect(bind).get_indexes('proxy')}
+
+    if 'ix_proxy_ip_port' not in indexes:
+        # add_proxy only checked for duplicates before inserting, so racing imports
+        # may have stored the same (ip, port) twice. Which row to keep (credentials,
+        # usage counts, active flag) is the operator's call, so stop and list them.
+        duplicates = bind.execute(sa.text(
+            'SELECT ip, port, COUNT(*) FROM proxy GROUP BY ip, port HAVING COUNT(*) > 1 ORDER BY ip, port'
+        )).all()
+        if duplicates:
+            listed = ', '.join(f"{ip}:{port} ({count} rows)" for ip, port, count in duplicates[:20])
+            if len(duplicates) > 20:
+                listed += f", and {len(duplicates) - 20} more"
+            raise RuntimeError(
+                f"Cannot add the unique (ip, port) index: {len(duplicates)} proxies are stored more than once: "
+                f"{listed}. Delete or merge the extra rows, then run the upgrade again."
+            )
+        op.create_index('ix_proxy_ip_port', 'proxy', ['ip', 'port'], unique=True)
+    if 'ix_proxy_active_type' not in indexes:
+        op.create_index('ix_proxy_active_type', 'proxy', ['is_active', 'proxy_type'], unique=False)
+    if 'ix_proxy_type_country' not in indexes:
+        op.create_index('ix_proxy_type_country', 'proxy', ['proxy_type', 'country_code'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_proxy_type_country', table_name='proxy')
+    op.drop_index('ix_proxy_active_type', table_name='proxy')
+    op.drop_index('ix_proxy_ip_port', table_name='proxy')
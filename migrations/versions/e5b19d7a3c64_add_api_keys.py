@@ -0,0 +1,42 @@
+"""add api keys
+
+Revision ID: e5b19d7a3c64
+Revises: c7d3e5f91a28
+Create Date: 2026-10-18 22:14:06.318452
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b19d7a3c64'
+down_revision = 'c7d3e5f91a28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if 'api_key' in sa.inspect(bind).get_table_names():
+        # Already created by db.create_all() on startup
+        return
+
+    op.create_table(
+        'api_key',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=80), nullable=False),
+        sa.Column('description', sa.String(length=255), nullable=True),
+        sa.Column('key_hash', sa.String(length=64), nullable=False),
+        sa.Column('prefix', sa.String(length=12), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_api_key_key_hash'), 'api_key', ['key_hash'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_api_key_key_hash'), table_name='api_key')
+    op.drop_table('api_key')
@@ -0,0 +1,34 @@
+"""add proxy updated_at
+
+Revision ID: f3a8c2d61b07
+Revises: e5b19d7a3c64
+Create Date: 2026-10-18 22:41:09.318254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8c2d61b07'
+down_revision = 'e5b19d7a3c64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    columns = {c['name'] for c in sa.inspect(bind).get_columns('proxy')}
+    with op.batch_alter_table('proxy', schema=None) as batch_op:
+        if 'updated_at' not in columns:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+
+    indexes = {i['name'] for i in sa.inspect(bind).get_indexes('proxy')}
+    if 'ix_proxy_updated_at' not in indexes:
+        op.create_index('ix_proxy_updated_at', 'proxy', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_proxy_updated_at', table_name='proxy')
+    with op.batch_alter_table('proxy', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -1,19 +1,18 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from dotenv import load_dotenv
 import os
 import threading
 from flask_wtf.csrf import CSRFProtect
-from sqlalchemy.pool import QueuePool
+from proxy_manager.database import configure_engine, database_url, engine_options
+from proxy_manager.log import configure_logging
 
 load_dotenv()
 
 csrf = CSRFProtect()
 
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
 init_lock = threading.Lock()    
 
@@ -26,29 +25,194 @@ def create_app():
     data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data'))
     os.makedirs(data_dir, exist_ok=True)
     
-    # Database configuration with absolute path
-    database_path = os.path.join(data_dir, 'proxies.db')
-    
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
-    # Set SQLAlchemy connection pool settings
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'pool_size': 20,  # Increase from default (5)
-        'pool_timeout': 30,  # Seconds before timing out
-        'pool_recycle': 3600,  # Recycle connections after 1 hour
-        'max_overflow': 10  # Allow additional connections beyond pool_size
-    }
+    # Storage backend: DATABASE_URL (SQLite or PostgreSQL), defaulting to data/proxies.db
+    database_uri = database_url(data_dir)
+    is_sqlite = database_uri.startswith('sqlite')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    
+    # Connection pool per worker process. SQLite serialises writers, so it gets a small pool
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 5 if is_sqlite else 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 5 if is_sqlite else 20))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    # Milliseconds a SQLite writer waits for the lock held by another worker
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_uri, app.config)
+    
+    # Seconds between checks of the database for proxy pool changes
+    app.config['PROXY_POOL_REFRESH_INTERVAL'] = float(os.getenv('PROXY_POOL_REFRESH_INTERVAL', 5))
+    
+    # Usage counters are batched: flushed every N seconds or after N events
+    app.config['USAGE_FLUSH_INTERVAL'] = float(os.getenv('USAGE_FLUSH_INTERVAL', 2))
+    app.config['USAGE_FLUSH_THRESHOLD'] = int(os.getenv('USAGE_FLUSH_THRESHOLD', 500))
+    
+    # Keep-alive sessions to upstream proxies
+    app.config['PROXY_SESSION_MAX'] = int(os.getenv('PROXY_SESSION_MAX', 256))
+    app.config['PROXY_SESSION_POOL_SIZE'] = int(os.getenv('PROXY_SESSION_POOL_SIZE', 10))
+    app.config['PROXY_SESSION_IDLE_TIMEOUT'] = float(os.getenv('PROXY_SESSION_IDLE_TIMEOUT', 300))
+    
+    # In-flight limits for the async forwarding engine (proxy_manager.asgi)
+    app.config['ASYNC_GLOBAL_CONCURRENCY'] = int(os.getenv('ASYNC_GLOBAL_CONCURRENCY', 10000))
+    app.config['ASYNC_PER_PROXY_CONCURRENCY'] = int(os.getenv('ASYNC_PER_PROXY_CONCURRENCY', 100))
+    
+    # Hedged requests (X-Proxy-Hedge): default delay in ms or as a latency percentile, and max parallel attempts
+    app.config['PROXY_HEDGE_DELAY'] = os.getenv('PROXY_HEDGE_DELAY', 'p95')
+    app.config['PROXY_HEDGE_MAX'] = int(os.getenv('PROXY_HEDGE_MAX', 3))
+    
+    # Bytes per chunk when relaying upstream bodies (X-Proxy-Stream)
+    app.config['PROXY_STREAM_CHUNK_SIZE'] = int(os.getenv('PROXY_STREAM_CHUNK_SIZE', 64 * 1024))
+    
+    # Proxy selection: weighted, p2c (power of two choices), round_robin or random
+    app.config['PROXY_SELECTION_STRATEGY'] = os.getenv('PROXY_SELECTION_STRATEGY', 'weighted')
+    app.config['PROXY_HEALTH_DECAY'] = float(os.getenv('PROXY_HEALTH_DECAY', 0.1))
+    
+    # Circuit breaker: consecutive failures before a proxy is quarantined, and cooldowns in seconds
+    app.config['BREAKER_FAILURE_THRESHOLD'] = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+    app.config['BREAKER_COOLDOWN'] = float(os.getenv('BREAKER_COOLDOWN', 30))
+    app.config['BREAKER_MAX_COOLDOWN'] = float(os.getenv('BREAKER_MAX_COOLDOWN', 600))
+    
+    # Background health checks (flask health-check): probe target, timeout, parallel probes, probes/s
+    app.config['HEALTH_CHECK_URL'] = os.getenv('HEALTH_CHECK_URL', 'http://www.gstatic.com/generate_204')
+    app.config['HEALTH_CHECK_TIMEOUT'] = float(os.getenv('HEALTH_CHECK_TIMEOUT', 10))
+    app.config['HEALTH_CHECK_CONCURRENCY'] = int(os.getenv('HEALTH_CHECK_CONCURRENCY', 100))
+    app.config['HEALTH_CHECK_RATE'] = float(os.getenv('HEALTH_CHECK_RATE', 100))
+    app.config['HEALTH_CHECK_INTERVAL'] = float(os.getenv('HEALTH_CHECK_INTERVAL', 300))
+    
+    # Rate limits (requests/s) and in-flight caps before an attempt is sent; 0 is off.
+    # Type limits take 'residential=50,datacenter=200' or one number for every type.
+    # Rates and type/subnet caps are per worker; the per-proxy cap is global with shared state
+    app.config['PROXY_RATE_LIMIT'] = float(os.getenv('PROXY_RATE_LIMIT', 0))
+    app.config['PROXY_RATE_BURST'] = float(os.getenv('PROXY_RATE_BURST')) if os.getenv('PROXY_RATE_BURST') else None
+    app.config['PROXY_MAX_INFLIGHT'] = int(os.getenv('PROXY_MAX_INFLIGHT', 0))
+    app.config['PROXY_TYPE_RATE_LIMIT'] = os.getenv('PROXY_TYPE_RATE_LIMIT', '')
+    app.config['PROXY_TYPE_MAX_INFLIGHT'] = os.getenv('PROXY_TYPE_MAX_INFLIGHT', '')
+    app.config['PROXY_SUBNET_RATE_LIMIT'] = float(os.getenv('PROXY_SUBNET_RATE_LIMIT', 0))
+    app.config['PROXY_SUBNET_MAX_INFLIGHT'] = int(os.getenv('PROXY_SUBNET_MAX_INFLIGHT', 0))
+    app.config['PROXY_SUBNET_PREFIX'] = int(os.getenv('PROXY_SUBNET_PREFIX', 24))
+    # Seconds an attempt may wait for a slot when every proxy is saturated (0: fail right away)
+    app.config['PROXY_QUEUE_TIMEOUT'] = float(os.getenv('PROXY_QUEUE_TIMEOUT', 0))
+    
+    # Sticky sessions (X-Proxy-Session): idle seconds before a pin expires, and pins kept per worker
+    app.config['STICKY_SESSION_TTL'] = float(os.getenv('STICKY_SESSION_TTL', 1800))
+    app.config['STICKY_SESSION_MAX'] = int(os.getenv('STICKY_SESSION_MAX', 100000))
+    
+    # State shared by all workers (cursors, breakers, in-flight counts, usage deltas):
+    # redis://host:6379/0, memory:// (single host), or empty for per-worker state
+    app.config['SHARED_STATE_URL'] = os.getenv('SHARED_STATE_URL', '')
+    app.config['SHARED_STATE_PREFIX'] = os.getenv('SHARED_STATE_PREFIX', 'proxy_manager')
+    app.config['SHARED_STATE_SYNC_INTERVAL'] = float(os.getenv('SHARED_STATE_SYNC_INTERVAL', 0.5))
+    
+    # Request logging: level, json or text, share of per-request INFO lines kept, and the
+    # in-memory queue size (lines are dropped when stdout can't keep up)
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO').upper()
+    app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'json')
+    app.config['LOG_SAMPLE_RATE'] = float(os.getenv('LOG_SAMPLE_RATE', 0.01))
+    app.config['LOG_QUEUE_SIZE'] = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    
+    # Prometheus /metrics: per-proxy series (one set per proxy id)
+    app.config['METRICS_PER_PROXY'] = os.getenv('METRICS_PER_PROXY', 'true').lower() == 'true'
+    
+    # Verified credentials (Basic auth and API keys) are cached this many seconds, up to this many per worker;
+    # password changes and revoked keys reach every worker within SHARED_STATE_SYNC_INTERVAL regardless
+    app.config['AUTH_CACHE_TTL'] = float(os.getenv('AUTH_CACHE_TTL', 300))
+    app.config['AUTH_CACHE_MAX'] = int(os.getenv('AUTH_CACHE_MAX', 10000))
+    
+    # /api/proxy/batch: most requests per call, and requests in flight per call (default and cap)
+    app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', 1000))
+    app.config['BATCH_CONCURRENCY'] = int(os.getenv('BATCH_CONCURRENCY', 10))
+    app.config['BATCH_MAX_CONCURRENCY'] = int(os.getenv('BATCH_MAX_CONCURRENCY', 50))
+    
+    # Response cache for GET/HEAD (opt in per request with X-Proxy-Cache): memory per worker, largest
+    # response kept, disk tier shared by the workers (relative to data/, empty to turn it off) and
+    # the request headers that are part of the cache key
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    app.config['RESPONSE_CACHE_MAX_ITEM_BYTES'] = int(os.getenv('RESPONSE_CACHE_MAX_ITEM_BYTES', 2 * 1024 * 1024))
+    response_cache_dir = os.getenv('RESPONSE_CACHE_DIR', '')
+    app.config['RESPONSE_CACHE_DIR'] = os.path.join(data_dir, response_cache_dir) if response_cache_dir else ''
+    app.config['RESPONSE_CACHE_DISK_MAX_BYTES'] = int(os.getenv('RESPONSE_CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))
+    app.config['RESPONSE_CACHE_VARY'] = os.getenv('RESPONSE_CACHE_VARY',
+                                                  'Accept,Accept-Encoding,Accept-Language,Authorization,Cookie')
+    
+    # Geo targeting (X-Proxy-Country/City/Region): where to look when no proxy matches, in order, and
+    # an optional MaxMind/DB-IP .mmdb file to fill in proxy locations on import (flask geo-enrich)
+    app.config['GEO_FALLBACK'] = os.getenv('GEO_FALLBACK', 'city,country,region,any')
+    app.config['GEOIP_DATABASE'] = os.getenv('GEOIP_DATABASE', '')
+    
+    # Webshare proxy list sync (flask webshare-sync, POST /api/proxies/sync): API key and URL, list mode,
+    # page size and pages fetched at once, type given to new proxies and rows per write batch
+    app.config['WEBSHARE_API_KEY'] = os.getenv('WEBSHARE_API_KEY', '')
+    app.config['WEBSHARE_API_URL'] = os.getenv('WEBSHARE_API_URL', 'https://proxy.webshare.io/api/v2/')
+    app.config['WEBSHARE_MODE'] = os.getenv('WEBSHARE_MODE', 'direct')
+    app.config['WEBSHARE_PAGE_SIZE'] = int(os.getenv('WEBSHARE_PAGE_SIZE', 100))
+    app.config['WEBSHARE_CONCURRENCY'] = int(os.getenv('WEBSHARE_CONCURRENCY', 4))
+    app.config['WEBSHARE_PROXY_TYPE'] = os.getenv('WEBSHARE_PROXY_TYPE', 'datacenter')
+    app.config['WEBSHARE_SYNC_BATCH'] = int(os.getenv('WEBSHARE_SYNC_BATCH', 1000))
+    app.config['WEBSHARE_SYNC_INTERVAL'] = float(os.getenv('WEBSHARE_SYNC_INTERVAL', 3600))
+    
+    # Create tables and the admin user on startup. Turn off where `flask bootstrap` runs once before the
+    # workers start (deploy.sh), so recycled workers don't each repeat it
+    app.config['AUTO_BOOTSTRAP'] = os.getenv('AUTO_BOOTSTRAP', 'true').lower() == 'true'
     
     # Initialize extensions
     csrf.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    with app.app_context():
+        configure_engine(db.engine, app.config)
     login_manager.init_app(app)
     login_manager.login_view = 'ui.login'
     
+    configure_logging(app)
+    
+    from proxy_manager.services.shared import shared_state
+    shared_state.init_app(app)
+    
+    from proxy_manager.services.credentials import credential_cache, watch_credentials
+    credential_cache.init_app(app)
+    watch_credentials(db.session)
+    
+    from proxy_manager.services.selection import proxy_selector
+    proxy_selector.init_app(app)
+    
+    from proxy_manager.services.breaker import proxy_breakers
+    proxy_breakers.init_app(app)
+    
+    from proxy_manager.services.limits import proxy_limiter
+    proxy_limiter.init_app(app)
+    
+    from proxy_manager.services.affinity import session_affinity
+    session_affinity.init_app(app)
+    
+    from proxy_manager.services.health import health_checker
+    health_checker.init_app(app)
+    
+    from proxy_manager.cli import register_commands
+    register_commands(app)
+    
+    from proxy_manager.services.pool import proxy_pool
+    proxy_pool.init_app(app)
+    
+    from proxy_manager.services.usage import usage_recorder
+    usage_recorder.init_app(app)
+    
+    from proxy_manager.services.sessions import session_pool
+    session_pool.init_app(app)
+    
+    from proxy_manager.services.metrics import proxy_metrics
+    proxy_metrics.init_app(app)
+    
+    from proxy_manager.services.cache import response_cache
+    response_cache.init_app(app)
+    
+    from proxy_manager.services.geo import geo_locator
+    geo_locator.init_app(app)
+    
+    from proxy_manager.services.webshare import webshare_sync
+    webshare_sync.init_app(app)
+    
     # Register blueprints
     from proxy_manager.api.routes import api
     app.register_blueprint(api, url_prefix='/api')
@@ -56,7 +220,23 @@ def create_app():
     from proxy_manager.ui.routes import ui
     app.register_blueprint(ui)
     
-    # Create database and admin user with lock
+    from proxy_manager.api.metrics import metrics
+    app.register_blueprint(metrics)
+    
+    if app.config['AUTO_BOOTSTRAP']:
+        bootstrap(app)
+    
+    return app
+
+
+def bootstrap(app):
+    """
+    Create missing tables and the admin user.
+    
+    Runs from create_app() unless AUTO_BOOTSTRAP is false; deployments run it
+    once with `flask bootstrap` instead, so that starting a worker does no
+    writes and no password hashing.
+    """
     with init_lock:
         with app.app_context():
             db.create_all()
@@ -76,5 +256,3 @@ def create_app():
                 except Exception as e:
                     db.session.rollback()
                     print(f"Error creating admin user: {str(e)}")
-    
-    return app
\ No newline at end of file
@@ -1,7 +1,10 @@
 from functools import wraps
-from flask import request, jsonify
+from flask import g, request, jsonify
+import hmac
 import os
+from proxy_manager.models.api_key import ApiKey
 from proxy_manager.models.user import User
+from proxy_manager.services.credentials import credential_cache
 
 def require_auth(f):
     @wraps(f)
@@ -13,16 +16,69 @@ def require_auth(f):
     return decorated
 
 def check_auth(username, password):
+    if credential_cache.get('user', username, password) is not None:
+        return True
     user = User.query.filter_by(username=username).first()
-    if user:
-        return user.check_password(password)
+    if user and user.check_password(password):
+        credential_cache.put(user.id, 'user', username, password)
+        return True
     return False
 
+def request_api_key(headers=None):
+    """
+    API key sent as X-API-Key, or as a bearer token for clients that can only set Authorization
+    
+    Args:
+        headers (Mapping, optional): Case-insensitive request headers (default: the current Flask request's)
+    """
+    headers = request.headers if headers is None else headers
+    if api_key_in_authorization(headers):
+        return headers['Authorization'].partition(' ')[2].strip()
+    return headers.get('X-API-Key')
+
+def api_key_in_authorization(headers):
+    """
+    Whether the API key came as a bearer token; Authorization is then ours and must not be forwarded upstream
+    """
+    return not headers.get('X-API-Key') and headers.get('Authorization', '').partition(' ')[0].lower() == 'bearer'
+
+def check_api_key(api_key):
+    """
+    Verify an API key: the API_KEY environment variable or an active, unexpired key from the api_key table
+
+    Returns:
+        dict: Key metadata (id, name; id is None for API_KEY), or None if the key is not valid
+    """
+    if not api_key:
+        return None
+    info = credential_cache.get('api_key', api_key)
+    if info is not None:
+        return info
+    return verify_api_key(api_key)
+
+def verify_api_key(api_key):
+    """
+    check_api_key() without the cache lookup: checks the key itself and caches it if valid
+    """
+    env_key = os.getenv('API_KEY')
+    until = None
+    if env_key and hmac.compare_digest(api_key.encode('utf-8', 'surrogateescape'), env_key.encode('utf-8', 'surrogateescape')):
+        info = {'id': None, 'name': 'API_KEY'}
+    else:
+        record = ApiKey.query.filter_by(key_hash=ApiKey.hash_key(api_key)).first()
+        if record is None or not record.is_valid():
+            return None
+        info = {'id': record.id, 'name': record.name}
+        until = record.expires_timestamp
+    credential_cache.put(info, 'api_key', api_key, until=until)
+    return info
+
 def require_api_key(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        api_key = request.headers.get('X-API-Key')
-        if not api_key or api_key != os.getenv('API_KEY'):
+        info = check_api_key(request_api_key())
+        if info is None:
             return jsonify({"error": "Invalid or missing API key"}), 401
+        g.api_key = info
         return f(*args, **kwargs)
     return decorated
\ No newline at end of file
@@ -0,0 +1,22 @@
+from flask import Blueprint, Response
+
+from proxy_manager.services.metrics import proxy_metrics
+from proxy_manager.api.auth import require_api_key
+
+metrics = Blueprint('metrics', __name__)
+
+@metrics.route('/metrics', methods=['GET'])
+@require_api_key
+def export_metrics():
+    """
+    Prometheus scrape endpoint
+
+    Takes the API key as X-API-Key or as a bearer token, which is what
+    Prometheus sends with `authorization: {credentials: <API_KEY>}`.
+
+    Returns:
+        Request counts, latency histograms, retries, fallbacks, selection time,
+        response cache results and per-proxy attempt summaries in the Prometheus text format
+    """
+    body, content_type = proxy_metrics.render()
+    return Response(body, content_type=content_type)
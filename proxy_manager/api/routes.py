@@ -1,14 +1,57 @@
-from flask import Blueprint, request, jsonify
+import json
+import time
+
+import requests
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from proxy_manager.services.proxy_service import ProxyService
-from proxy_manager.api.auth import require_api_key, require_auth
+from proxy_manager.services.sessions import session_pool
+from proxy_manager.services.usage import usage_recorder
+from proxy_manager.services.hedging import parse_hedge
+from proxy_manager.services.breaker import proxy_breakers
+from proxy_manager.services.shared import shared_state
+from proxy_manager.services.limits import proxy_limiter
+from proxy_manager.services.affinity import session_affinity
+from proxy_manager.services.metrics import proxy_metrics
+from proxy_manager.services.cache import CACHEABLE_METHODS, parse_cache_ttl, response_cache
+from proxy_manager.services.batch import parse_batch, run_batch
+from proxy_manager.services.envelope import negotiate, pack
+from proxy_manager.services.credentials import credential_cache
+from proxy_manager.services.geo import parse_geo, parse_geo_headers
+from proxy_manager.services.webshare import webshare_sync
+from proxy_manager.log import request_log
+from proxy_manager.api.auth import api_key_in_authorization, require_api_key, require_auth
 
 api = Blueprint('api', __name__)
 
 @api.route('/proxy', methods=['GET'])
 @require_auth
 def get_proxy():
+    """
+    Get a random active proxy
+
+    Args:
+        type (str, optional): Filter by proxy type (datacenter or residential)
+        session (str, optional): Sticky session id (or the X-Proxy-Session header): the same id gets
+                                 the same proxy until it is quarantined
+        country (str, optional): Two-letter country code (or the X-Proxy-Country header)
+        city (str, optional): City name (or X-Proxy-City)
+        region (str, optional): Continent code such as EU or NA (or X-Proxy-Region)
+        fallback (str, optional): Where to look when nothing matches, e.g. 'city,country' (or
+                                  X-Proxy-Geo-Fallback; default GEO_FALLBACK: city, country, region, any)
+    """
     proxy_type = request.args.get('type')
-    proxy = ProxyService.get_random_proxy(proxy_type)
+    session = request.headers.get('X-Proxy-Session') or request.args.get('session')
+    try:
+        geo = parse_geo(
+            request.args.get('country') or request.headers.get('X-Proxy-Country'),
+            request.args.get('city') or request.headers.get('X-Proxy-City'),
+            request.args.get('region') or request.headers.get('X-Proxy-Region'),
+            request.args.get('fallback') or request.headers.get('X-Proxy-Geo-Fallback'),
+            current_app.config['GEO_FALLBACK']
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    proxy = ProxyService.get_random_proxy(proxy_type, session, geo)
     if not proxy:
         return jsonify({"error": "No proxies available"}), 404
     
@@ -18,25 +61,100 @@ def get_proxy():
 @require_api_key
 def list_proxies():
     """
-    Get a list of all active proxies.
-    
+    Get a page of active proxies, ordered by id.
+
     Args:
         type (str, optional): Filter by proxy type (datacenter or residential)
-    
+        limit (int, optional): Page size, 1 to 1000 (default 100)
+        cursor (int, optional): `next_cursor` from the previous page
+
     Returns:
-        JSON response with a list of proxies
+        JSON response with a list of proxies and the cursor of the next page (null on the last page)
     """
     proxy_type = request.args.get('type')
-    active_proxies = ProxyService.get_proxies(proxy_type)
-    
-    if not active_proxies:
+    try:
+        limit = int(request.args.get('limit', 100))
+        cursor = request.args.get('cursor')
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+    if not 1 <= limit <= 1000:
+        return jsonify({"error": "limit must be between 1 and 1000"}), 400
+
+    active_proxies, next_cursor = ProxyService.get_proxy_page(proxy_type, cursor, limit)
+
+    if not active_proxies and cursor is None:
         return jsonify({"error": "No proxies available"}), 404
-    
+
     proxies_list = [proxy.to_dict() for proxy in active_proxies]
-    
+
     return jsonify({
         "count": len(proxies_list),
-        "proxies": proxies_list
+        "proxies": proxies_list,
+        "next_cursor": next_cursor
+    })
+
+@api.route('/proxies/sync', methods=['POST'])
+@require_api_key
+def sync_proxies():
+    """
+    Sync proxies with the Webshare proxy list: new proxies are added, changed ones updated
+    and the ones no longer listed deactivated
+    
+    Returns:
+        JSON response with the counts of fetched, added, updated, deactivated, unchanged, skipped
+        and conflicting proxies and the elapsed seconds
+    """
+    if not webshare_sync.enabled:
+        return jsonify({"error": "WEBSHARE_API_KEY is not set"}), 400
+    try:
+        counts = webshare_sync.sync()
+    except requests.RequestException as e:
+        request_log.warning("Webshare sync failed", extra={'error': str(e)})
+        return jsonify({"error": f"Could not read the Webshare proxy list: {e}"}), 502
+    return jsonify(counts)
+
+@api.route('/stats', methods=['GET'])
+@require_api_key
+def stats():
+    """
+    Runtime counters for this worker process
+    
+    Returns:
+        JSON response with upstream session pool, usage recorder, breaker, shared state,
+        rate/concurrency limit (saturation), sticky session, response cache and credential cache stats
+    """
+    return jsonify({
+        "sessions": session_pool.stats(),
+        "usage": usage_recorder.stats(),
+        "breakers": proxy_breakers.stats(),
+        "shared_state": shared_state.stats(),
+        "limits": proxy_limiter.stats(),
+        "sticky_sessions": session_affinity.stats(),
+        "cache": response_cache.stats(),
+        "auth": credential_cache.stats()
+    })
+
+@api.route('/proxies/breakers', methods=['GET'])
+@require_api_key
+def list_breakers():
+    """
+    Circuit breaker state of quarantined proxies in this worker process
+    
+    Args:
+        state (str, optional): Only 'open' or 'half_open' breakers
+    
+    Returns:
+        JSON response with the proxies whose breaker is not closed
+    """
+    state = request.args.get('state')
+    if state and state not in ['open', 'half_open']:
+        return jsonify({"error": "Invalid state. Must be 'open' or 'half_open'"}), 400
+    
+    breakers = proxy_breakers.to_list(state)
+    return jsonify({
+        "count": len(breakers),
+        "breakers": breakers
     })
 
 @api.route('/proxy/import', methods=['POST'])
@@ -46,14 +164,45 @@ def import_proxies():
         return jsonify({"error": "No file provided"}), 400
     
     file = request.files['file']
-    content = file.read().decode('utf-8')
     
     proxy_type = request.form.get('proxy_type', 'datacenter')
     if proxy_type not in ['datacenter', 'residential']:
         return jsonify({"error": "Invalid proxy type"}), 400
     
-    added = ProxyService.import_proxies(content, proxy_type)
-    return jsonify({"message": f"Successfully imported {added} proxies"})
+    # Read the upload line by line rather than into memory
+    counts = ProxyService.import_proxies(file.stream, proxy_type)
+    return jsonify({
+        "message": f"Successfully imported {counts['added']} proxies",
+        **counts
+    })
+
+# Headers that describe a single hop and must not be relayed
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade'
+}
+
+def stream_response(upstream, proxy, note=None):
+    """
+    Relay an upstream response as-is: original status and headers, body bytes
+    piped through in chunks without decoding or buffering
+    """
+    chunk_size = current_app.config['PROXY_STREAM_CHUNK_SIZE']
+
+    def generate():
+        try:
+            # decode_content=False keeps gzip/br bodies matching their Content-Encoding
+            for chunk in upstream.raw.stream(chunk_size, decode_content=False):
+                yield chunk
+        finally:
+            upstream.close()
+
+    headers = [(k, v) for k, v in upstream.raw.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+    headers.append(('X-Proxy-Used', proxy.address))
+    headers.append(('X-Proxy-Type', proxy.proxy_type))
+    if note:
+        headers.append(('X-Proxy-Note', note))
+    return Response(generate(), status=upstream.status_code, headers=headers, direct_passthrough=True)
 
 @api.route('/proxy/request', methods=['GET', 'POST'])
 @require_api_key
@@ -64,15 +213,46 @@ def proxy_request():
     Query Parameters:
         url (str): Target URL to request
         method (str): HTTP method to use (default: GET)
+        envelope (str, optional): Response envelope, 'json' (default), 'msgpack' or 'frame' (see Returns);
+                                  takes precedence over the Accept header
         
     Headers:
         X-Proxy-Type (str, optional): Type of proxy to use ('datacenter' or 'residential', default: 'residential').
                                      If no proxies of specified type are available, will fall back to the other type
                                      only if the specific type wasn't explicitly requested.
+        X-Proxy-Hedge (int, optional): Race up to this many attempts through different proxies and
+                                       return the first response (default: 1, no hedging).
+        X-Proxy-Hedge-Delay (str, optional): Wait before each extra attempt, in milliseconds ('300')
+                                             or as a recent latency percentile ('p95', the default).
+        X-Proxy-Stream (str, optional): 'true' to relay the upstream response as-is (status, headers and
+                                        raw body bytes streamed in chunks) instead of the JSON envelope.
+                                        The proxy used is reported in the X-Proxy-Used response header.
+        X-Proxy-Session (str, optional): Sticky session id. Requests with the same id go through the same
+                                         proxy (for logins and cookies) until it fails or is quarantined,
+                                         then move to another one and stay there. Not forwarded; disables hedging.
+        X-Proxy-Country (str, optional): Use a proxy in this country (two-letter code). Not forwarded.
+        X-Proxy-City (str, optional): Use a proxy in this city. Not forwarded.
+        X-Proxy-Region (str, optional): Use a proxy on this continent (AF, AS, EU, NA, SA, OC, AN). Not forwarded.
+        X-Proxy-Geo-Fallback (str, optional): Where to look when no healthy proxy matches, in order, among city,
+                                              country, region and any (default GEO_FALLBACK, all four); e.g.
+                                              'city,country' to fail rather than leave the country. Widening is
+                                              reported in "note".
+        X-Proxy-Cache (str, optional): 'true' to serve GET/HEAD responses from the response cache, for as long
+                                       as the upstream Cache-Control allows. Identical requests in flight at the
+                                       same time share one upstream request. Not used for streams.
+        X-Proxy-Cache-TTL (float, optional): Cache the response for this many seconds instead, whatever its
+                                             Cache-Control says (implies X-Proxy-Cache).
+        Accept (str, optional): application/msgpack or application/vnd.proxy-manager.frame selects a binary
+                                envelope (and is then not forwarded).
+        X-Proxy-Keep-Encoding (str, optional): 'true' to return the body still compressed as the target sent
+                                               it, with its Content-Encoding header (binary envelopes only).
     
     Returns:
-        Proxied response including status code, headers, content, and proxy information
+        Proxied response including status code, headers, content, and proxy information.
+        json: the body decoded to text in "content". msgpack: the same map with "content" as raw bytes.
+        frame: a 4-byte big-endian length, that much JSON (the envelope without "content"), then the body bytes.
     """
+    started = time.monotonic()
     target_url = request.args.get('url')
     if not target_url:
         return jsonify({"error": "URL parameter is required"}), 400
@@ -84,9 +264,22 @@ def proxy_request():
     params = dict(request.args)
     params.pop('url', None)
     params.pop('method', None)
+    params.pop('envelope', None)
 
-    headers = {k: v for k, v in request.headers.items()
-              if k.lower() not in ['host', 'x-api-key']}
+    try:
+        envelope, body, from_accept = negotiate(request.headers.get('Accept'), request.args.get('envelope'),
+                                                request.headers.get('X-Proxy-Keep-Encoding'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    skipped = ['host', 'x-api-key', 'x-proxy-session', 'x-proxy-cache', 'x-proxy-cache-ttl', 'x-proxy-keep-encoding',
+               'x-proxy-country', 'x-proxy-city', 'x-proxy-region', 'x-proxy-geo-fallback']
+    if from_accept:
+        skipped.append('accept')
+    if api_key_in_authorization(request.headers):
+        skipped.append('authorization')
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in skipped}
+    session = request.headers.get('X-Proxy-Session')
     
     # Get proxy type from headers if specified, default to residential
     proxy_type = request.headers.get('X-Proxy-Type')
@@ -98,23 +291,137 @@ def proxy_request():
         # Ensure consistent casing
         proxy_type = proxy_type.lower()
     
-    print(f"API request received. URL: {target_url}, Method: {method}, Requested proxy type: {proxy_type}")
+    try:
+        geo = parse_geo_headers(request.headers, current_app.config['GEO_FALLBACK'])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        hedge, hedge_delay = parse_hedge(
+            request.headers.get('X-Proxy-Hedge'),
+            request.headers.get('X-Proxy-Hedge-Delay'),
+            default_delay=current_app.config['PROXY_HEDGE_DELAY'],
+            max_count=current_app.config['PROXY_HEDGE_MAX']
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid hedge settings. X-Proxy-Hedge must be a positive integer and X-Proxy-Hedge-Delay milliseconds or a percentile like 'p95'"}), 400
+    
+    try:
+        use_cache, cache_ttl = parse_cache_ttl(request.headers.get('X-Proxy-Cache'), request.headers.get('X-Proxy-Cache-TTL'))
+    except ValueError:
+        return jsonify({"error": "Invalid X-Proxy-Cache-TTL. Must be a non-negative number of seconds"}), 400
+    
+    request_log.info("API request received", extra={'url': target_url, 'method': method, 'proxy_type': proxy_type})
     
     data = request.get_data() if method in ['POST', 'PUT', 'PATCH'] else None
 
-    response_data, status_code = ProxyService.make_request(
-        url=target_url,
-        method=method,
-        params=params,
-        headers=headers,
-        data=data,
-        max_retries=3,
-        timeout=30,
-        proxy_type=proxy_type
-    )
-
-    # If we have a note in the response about proxy type fallback, log it
-    if 'note' in response_data:
-        print(f"Proxy type note: {response_data['note']}")
-
-    return jsonify(response_data), status_code
\ No newline at end of file
+    if request.headers.get('X-Proxy-Stream', '').lower() in ['1', 'true', 'yes']:
+        upstream, error = ProxyService.stream_request(
+            url=target_url,
+            method=method,
+            params=params,
+            headers=headers,
+            data=data,
+            max_retries=3,
+            timeout=30,
+            proxy_type=proxy_type,
+            session=session,
+            geo=geo
+        )
+        if error:
+            response_data, status_code = error
+            proxy_metrics.request('stream', status_code, time.monotonic() - started)
+            return jsonify(response_data), status_code
+        proxy_metrics.request('stream', upstream[0].status_code, time.monotonic() - started)
+        return stream_response(*upstream)
+
+    def forward():
+        return ProxyService.make_request(
+            url=target_url,
+            method=method,
+            params=params,
+            headers=headers,
+            data=data,
+            max_retries=3,
+            timeout=30,
+            proxy_type=proxy_type,
+            hedge=hedge,
+            hedge_delay=hedge_delay,
+            session=session,
+            body=body,
+            geo=geo
+        )
+
+    if use_cache and method in CACHEABLE_METHODS:
+        key = response_cache.key(method, target_url, params, headers, proxy_type, body, geo)
+        (response_data, status_code), cache_result = response_cache.fetch(key, forward, cache_ttl)
+        # Coalesced requests share the leader's dict
+        response_data = dict(response_data, cache=cache_result)
+        proxy_metrics.cache(cache_result, response_cache.body_size(response_data) if cache_result != 'miss' else 0)
+    else:
+        response_data, status_code = forward()
+
+    elapsed = time.monotonic() - started
+    proxy_metrics.request('sync', status_code, elapsed)
+    request_log.info("API request completed", extra={'url': target_url, 'status': status_code, 'seconds': round(elapsed, 4),
+                                                     'proxy': response_data.get('proxy_used'),
+                                                     'note': response_data.get('note')})
+
+    if envelope != 'json':
+        payload, content_type = pack(response_data, envelope)
+        return Response(payload, status=status_code, content_type=content_type)
+    return jsonify(response_data), status_code
+
+@api.route('/proxy/batch', methods=['POST'])
+@require_api_key
+def proxy_batch():
+    """
+    Forward many requests through the pool in one call
+    
+    Body (JSON):
+        requests (list): Request specs, each with
+            url (str): Target URL
+            method (str, optional): HTTP method (default: GET)
+            params (dict, optional): Query parameters
+            headers (dict, optional): Headers to send upstream
+            data (str, optional): Request body for POST, PUT and PATCH
+            proxy_type (str, optional): 'datacenter' or 'residential' (default: the X-Proxy-Type header, else residential)
+            session (str, optional): Sticky session id, as X-Proxy-Session
+            country, city, region, geo_fallback (str, optional): As X-Proxy-Country, X-Proxy-City,
+                                                                 X-Proxy-Region and X-Proxy-Geo-Fallback
+            cache (bool, optional) / cache_ttl (float, optional): As X-Proxy-Cache / X-Proxy-Cache-TTL
+            id (any, optional): Echoed back in the result
+        concurrency (int, optional): Requests in flight at once (default BATCH_CONCURRENCY, capped at
+                                     BATCH_MAX_CONCURRENCY)
+    
+    Returns:
+        NDJSON stream, one line per request as soon as it completes: the /api/proxy/request envelope
+        (status_code, headers, content, proxy_used, ...) or its error, plus "index" (position in
+        "requests") and "id" if given
+    """
+    proxy_type = (request.headers.get('X-Proxy-Type') or 'residential').lower()
+    try:
+        items, concurrency = parse_batch(
+            request.get_json(silent=True),
+            default_proxy_type=proxy_type,
+            max_items=current_app.config['BATCH_MAX_ITEMS'],
+            default_concurrency=current_app.config['BATCH_CONCURRENCY'],
+            max_concurrency=current_app.config['BATCH_MAX_CONCURRENCY'],
+            default_fallback=current_app.config['GEO_FALLBACK']
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    request_log.info("Batch request received", extra={'requests': len(items), 'concurrency': concurrency})
+    app = current_app._get_current_object()
+    
+    def generate():
+        started = time.monotonic()
+        completed = 0
+        for result in run_batch(app, items, concurrency):
+            completed += 1
+            yield json.dumps(result) + '\n'
+        request_log.info("Batch request completed", extra={'requests': completed,
+                                                           'seconds': round(time.monotonic() - started, 4)})
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -0,0 +1,188 @@
+"""
+ASGI entry point serving /api/proxy/request on the async forwarding engine.
+
+Run it next to the gunicorn app and route just that path to it, e.g.
+
+    uvicorn proxy_manager.asgi:app --host 127.0.0.1 --port 5001 --workers 2
+
+Every other route (and the sync /api/proxy/request) stays on the Flask app,
+which remains the fallback if this server is not running.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import Headers
+
+from proxy_manager import create_app
+from proxy_manager.api.auth import api_key_in_authorization, request_api_key, verify_api_key
+from proxy_manager.services.async_engine import AsyncForwarder
+from proxy_manager.services.cache import CACHEABLE_METHODS, parse_cache_ttl, response_cache
+from proxy_manager.services.credentials import credential_cache
+from proxy_manager.services.envelope import negotiate, pack
+from proxy_manager.services.geo import parse_geo_headers
+from proxy_manager.services.hedging import parse_hedge
+from proxy_manager.services.metrics import proxy_metrics
+
+ALLOWED_METHODS = ['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD']
+# Hop-by-hop and framing headers are recomputed by the upstream client
+SKIPPED_HEADERS = {'host', 'x-api-key', 'x-proxy-session', 'x-proxy-cache', 'x-proxy-cache-ttl', 'x-proxy-keep-encoding',
+                   'x-proxy-country', 'x-proxy-city', 'x-proxy-region', 'x-proxy-geo-fallback', 'content-length', 'transfer-encoding', 'connection'}
+
+flask_app = create_app()
+forwarder = AsyncForwarder(flask_app)
+
+
+async def _send_json(send, data, status_code):
+    await _send_body(send, json.dumps(data).encode('utf-8'), 'application/json', status_code)
+
+
+async def _send_body(send, body, content_type, status_code):
+    await send({
+        'type': 'http.response.start',
+        'status': status_code,
+        'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await forwarder.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await forwarder.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def _verify_api_key(api_key):
+    with flask_app.app_context():
+        return verify_api_key(api_key)
+
+
+async def _authenticate(headers):
+    api_key = request_api_key(Headers(list(headers.items())))
+    if not api_key:
+        return None
+    info = credential_cache.get('api_key', api_key)
+    if info is None:
+        # Not verified recently: the database lookup runs off the event loop
+        info = await asyncio.get_running_loop().run_in_executor(None, _verify_api_key, api_key)
+    return info
+
+
+async def proxy_request(scope, receive, send):
+    headers = {}
+    for key, value in scope['headers']:
+        headers[key.decode('latin-1').title()] = value.decode('latin-1')
+
+    if await _authenticate(headers) is None:
+        return await _send_json(send, {"error": "Invalid or missing API key"}, 401)
+
+    # First value wins, like dict(request.args) in the Flask route
+    params = {}
+    for key, value in parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True):
+        params.setdefault(key, value)
+
+    target_url = params.pop('url', None)
+    if not target_url:
+        return await _send_json(send, {"error": "URL parameter is required"}, 400)
+
+    method = params.pop('method', 'GET').upper()
+    if method not in ALLOWED_METHODS:
+        return await _send_json(send, {"error": "Invalid HTTP method"}, 400)
+
+    try:
+        envelope, body_mode, from_accept = negotiate(headers.get('Accept'), params.pop('envelope', None),
+                                                     headers.get('X-Proxy-Keep-Encoding'))
+    except ValueError as e:
+        return await _send_json(send, {"error": str(e)}, 400)
+
+    proxy_type = headers.get('X-Proxy-Type')
+    if not proxy_type:
+        proxy_type = 'residential'
+    elif proxy_type.lower() not in ['datacenter', 'residential']:
+        return await _send_json(send, {"error": "Invalid proxy type. Must be 'datacenter' or 'residential'"}, 400)
+    else:
+        proxy_type = proxy_type.lower()
+
+    try:
+        geo = parse_geo_headers(headers, flask_app.config['GEO_FALLBACK'])
+    except ValueError as e:
+        return await _send_json(send, {"error": str(e)}, 400)
+
+    try:
+        hedge, hedge_delay = parse_hedge(
+            headers.get('X-Proxy-Hedge'),
+            headers.get('X-Proxy-Hedge-Delay'),
+            default_delay=flask_app.config['PROXY_HEDGE_DELAY'],
+            max_count=flask_app.config['PROXY_HEDGE_MAX']
+        )
+    except ValueError:
+        return await _send_json(send, {"error": "Invalid hedge settings. X-Proxy-Hedge must be a positive integer and X-Proxy-Hedge-Delay milliseconds or a percentile like 'p95'"}, 400)
+
+    try:
+        use_cache, cache_ttl = parse_cache_ttl(headers.get('X-Proxy-Cache'), headers.get('X-Proxy-Cache-Ttl'))
+    except ValueError:
+        return await _send_json(send, {"error": "Invalid X-Proxy-Cache-TTL. Must be a non-negative number of seconds"}, 400)
+
+    started = time.monotonic()
+    body = await _read_body(receive)
+    data = body if method in ['POST', 'PUT', 'PATCH'] else None
+    # A bearer token that was our API key stays here
+    bearer = api_key_in_authorization(Headers(list(headers.items())))
+    forward_headers = {k: v for k, v in headers.items()
+                       if k.lower() not in SKIPPED_HEADERS and not (from_accept and k == 'Accept')
+                       and not (bearer and k.lower() == 'authorization')}
+
+    def forward():
+        return forwarder.forward(
+            url=target_url,
+            method=method,
+            params=params,
+            headers=forward_headers,
+            data=data,
+            max_retries=3,
+            timeout=30,
+            proxy_type=proxy_type,
+            hedge=hedge,
+            hedge_delay=hedge_delay,
+            session=headers.get('X-Proxy-Session'),
+            body=body_mode,
+            geo=geo
+        )
+
+    if use_cache and method in CACHEABLE_METHODS:
+        key = response_cache.key(method, target_url, params, forward_headers, proxy_type, body_mode, geo)
+        (response_data, status_code), cache_result = await response_cache.fetch_async(key, forward, cache_ttl)
+        response_data = dict(response_data, cache=cache_result)
+        proxy_metrics.cache(cache_result, response_cache.body_size(response_data) if cache_result != 'miss' else 0)
+    else:
+        response_data, status_code = await forward()
+    proxy_metrics.request('async', status_code, time.monotonic() - started)
+    payload, content_type = pack(response_data, envelope)
+    await _send_body(send, payload, content_type, status_code)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] == '/api/proxy/request' and scope['method'] in ('GET', 'POST'):
+        return await proxy_request(scope, receive, send)
+    await _send_json(send, {"error": "Not found"}, 404)
@@ -0,0 +1,745 @@
+"""
+Benchmarks for the proxy selection, forwarding, import, listing, sync and worker startup paths
+
+    python -m proxy_manager.bench run --proxies 1000,10000,100000 --output bench.json
+    python -m proxy_manager.bench compare before.json after.json
+    python -m proxy_manager.bench provider-stub --size 1000 --port 8099
+
+`run` starts a stand-in forward proxy (with optional latency and failure
+injection) and a target server in this process, then benchmarks a fresh app
+on a temporary SQLite database in one child process per pool size, so every
+size starts from the same state and its memory is measured on its own.
+
+Seeded proxies get distinct addresses across 127.0.0.0/8. Linux routes all
+of them to loopback, so they all reach the stand-in proxy, which listens on
+every interface for that reason. It only ever relays to the local target,
+whatever URL it is asked for.
+
+The startup path times how long a new worker takes to serve its first
+forwarded request: started cold (import, create_app, bootstrap, and the pool
+loaded on first use, as every recycled worker did before gunicorn.conf.py) and
+forked from a parent that already did all that (proxy_manager.wsgi preloaded).
+
+`provider-stub` serves a stand-in for the Webshare list API, for trying
+WEBSHARE_API_URL / flask webshare-sync locally; `run` uses it for the sync path.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PATHS = ('import', 'selection', 'forward', 'listing', 'sync', 'startup')
+API_KEY = 'bench'
+# Not relayed by the stand-in proxy
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authorization', 'proxy-connection', 'te', 'trailer',
+               'transfer-encoding', 'upgrade', 'content-length', 'host'}
+# Metrics compared by `compare`, and whether a higher value is better
+COMPARED = {'per_second': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False,
+            'db_writes_per_request': False, 'rss_growth_mb': False, 'ready_ms': False}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class TargetHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with the same body
+    """
+    protocol_version = 'HTTP/1.1'
+    body = b''
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(self.body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInProxyHandler(BaseHTTPRequestHandler):
+    """
+    Plain HTTP forward proxy that relays to the target server over keep-alive
+    connections, after `latency` (+ up to `jitter`) seconds, and answers 502
+    instead for a `failure_rate` share of requests
+    """
+    protocol_version = 'HTTP/1.1'
+    target = None
+    latency = 0.0
+    jitter = 0.0
+    failure_rate = 0.0
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+    _local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(*self.target, timeout=30)
+        return conn
+
+    def _fail(self):
+        self.send_response(502)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _relay(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        with self.rng_lock:
+            delay = self.latency + self.rng.random() * self.jitter
+            failed = self.rng.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return self._fail()
+
+        url = urlsplit(self.path)
+        path = (url.path or '/') + (f"?{url.query}" if url.query else '')
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+        try:
+            conn = self._connection()
+            conn.request(self.command, path, body, headers)
+            response = conn.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            self._local.conn = None
+            return self._fail()
+
+        self.send_response(response.status)
+        for key, value in response.getheaders():
+            if key.lower() not in HOP_HEADERS:
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _relay
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_standins(body_bytes=1024, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, seed=0):
+    """
+    Start the target server and stand-in proxy in background threads
+
+    Returns:
+        tuple: (target server, proxy server); call shutdown() on both when done
+    """
+    target_handler = type('Target', (TargetHandler,), {'body': os.urandom(body_bytes)})
+    target = _Server(('127.0.0.1', 0), target_handler)
+    proxy_handler = type('StandInProxy', (StandInProxyHandler,), {
+        'target': ('127.0.0.1', target.server_port),
+        'latency': latency_ms / 1000,
+        'jitter': jitter_ms / 1000,
+        'failure_rate': failure_rate,
+        'rng': random.Random(seed),
+        '_local': threading.local()
+    })
+    proxy = _Server(('0.0.0.0', 0), proxy_handler)
+    for server in (target, proxy):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return target, proxy
+
+
+class ProviderStubHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the Webshare list API: GET [/s<size>][/r<round>]/api/v2/proxy/list/?page=&page_size=
+
+    Lists `size` generated proxies. From round 1 on, a `churn` share of them is
+    gone, another share has a new password and as many new ones are added, so a
+    sync from round 0 to round 1 has a known diff.
+    """
+    protocol_version = 'HTTP/1.1'
+    size = 1000
+    churn = 0.01
+    api_key = API_KEY
+    _lists = {}
+    _lists_lock = threading.Lock()
+    _path = re.compile(r'^(?:/s(\d+))?(?:/r(\d+))?/api/v2/proxy/list/$')
+
+    @classmethod
+    def listing(cls, size, round_):
+        with cls._lists_lock:
+            if (size, round_) not in cls._lists:
+                every = max(1, int(round(1 / cls.churn))) if cls.churn else 0
+                items = []
+                for i in range(1, size + 1 + (size // every if every and round_ else 0)):
+                    if every and round_ and i <= size and i % every == 0:
+                        continue
+                    changed = every and round_ and i % every == 1
+                    items.append({
+                        'id': f"d-{i}",
+                        'username': f"user{i}",
+                        'password': f"secret{i}-{round_}" if changed else f"secret{i}",
+                        'proxy_address': f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+                        'port': 6000 + i % 1000,
+                        'valid': True,
+                        'country_code': ('US', 'DE', 'GB', 'FR', 'JP')[i % 5],
+                        'city_name': None
+                    })
+                cls._lists[(size, round_)] = items
+            return cls._lists[(size, round_)]
+
+    def _json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        match = self._path.match(url.path)
+        if not match:
+            return self._json(404, {'detail': 'Not found.'})
+        if self.headers.get('Authorization') != f"Token {self.api_key}":
+            return self._json(401, {'detail': 'Invalid token.'})
+        query = parse_qs(url.query)
+        try:
+            page = int(query.get('page', ['1'])[0])
+            page_size = int(query.get('page_size', ['25'])[0])
+        except ValueError:
+            return self._json(400, {'detail': 'Invalid page.'})
+        items = self.listing(int(match.group(1) or self.size), int(match.group(2) or 0))
+        start = (page - 1) * page_size
+        if page < 1 or page_size < 1 or (start >= len(items) and page > 1):
+            return self._json(404, {'detail': 'Invalid page.'})
+        more = start + page_size < len(items)
+        link = lambda number: f"http://{self.headers.get('Host')}{url.path}?page={number}&page_size={page_size}"
+        self._json(200, {
+            'count': len(items),
+            'next': link(page + 1) if more else None,
+            'previous': link(page - 1) if page > 1 else None,
+            'results': items[start:start + page_size]
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_provider_stub(port=0, size=1000, churn=0.01, api_key=API_KEY):
+    handler = type('ProviderStub', (ProviderStubHandler,), {
+        'size': size, 'churn': churn, 'api_key': api_key, '_lists': {}, '_lists_lock': threading.Lock()
+    })
+    server = _Server(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def proxy_lines(count, port):
+    """
+    `count` distinct proxies, all on `port`, spread over 127.0.0.0/8 from 127.0.0.1
+    """
+    for i in range(1, count + 1):
+        yield f"127.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}:{port}:bench:bench"
+
+
+def percentile(ordered, q):
+    # Nearest rank on an already sorted list
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def summarize(latencies, seconds):
+    """
+    Throughput and latency percentiles (milliseconds) of one path
+    """
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 4) if value is not None else None
+    return {
+        'requests': len(ordered),
+        'seconds': round(seconds, 4),
+        'per_second': round(len(ordered) / seconds, 2) if seconds else None,
+        'p50_ms': ms(percentile(ordered, 50)),
+        'p95_ms': ms(percentile(ordered, 95)),
+        'p99_ms': ms(percentile(ordered, 99)),
+        'max_ms': ms(ordered[-1] if ordered else None)
+    }
+
+
+def rss_mb():
+    """
+    Current resident memory of this process, or None where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+class WriteCounter:
+    """
+    Counts INSERT/UPDATE/DELETE statements (and rows, for executemany) sent to the database
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.statements = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            with self._lock:
+                self.statements += 1
+                self.rows += len(parameters) if executemany else 1
+
+    def snapshot(self):
+        with self._lock:
+            return self.statements, self.rows
+
+
+class Measured:
+    """
+    DB writes and memory growth over one benchmarked path
+    """
+
+    def __init__(self, writes):
+        self.writes = writes
+
+    def __enter__(self):
+        self.started_writes = self.writes.snapshot()
+        self.started_rss = rss_mb()
+        self.result = {}
+        return self
+
+    def __exit__(self, *exc):
+        statements, rows = self.writes.snapshot()
+        statements -= self.started_writes[0]
+        rows -= self.started_writes[1]
+        requests = self.result.get('requests') or 0
+        self.result.update({
+            'db_writes': statements,
+            'db_rows_written': rows,
+            'db_writes_per_request': round(statements / requests, 4) if requests else None,
+            'rss_mb': rss_mb(),
+            'rss_growth_mb': round(rss_mb() - self.started_rss, 1) if self.started_rss is not None else None
+        })
+
+
+def bench_import(app, writes, size, proxy_port):
+    from proxy_manager.services.pool import proxy_pool
+    from proxy_manager.services.proxy_service import ProxyService
+
+    with app.app_context(), Measured(writes) as measured:
+        started = time.perf_counter()
+        counts = ProxyService.import_proxies(proxy_lines(size, proxy_port), 'residential')
+        seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        proxy_pool.snapshot()
+        pool_seconds = time.perf_counter() - started
+        # One "request" per imported line
+        measured.result.update({
+            'requests': size,
+            'seconds': round(seconds, 4),
+            'per_second': round(size / seconds, 2) if seconds else None,
+            'added': counts['added'],
+            'pool_build_seconds': round(pool_seconds, 4)
+        })
+    return measured.result
+
+
+def bench_selection(app, writes, iterations):
+    from proxy_manager.services.proxy_service import ProxyService
+
+    latencies = []
+    failed = 0
+    with app.app_context(), Measured(writes) as measured:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t = time.perf_counter()
+            plan, error = ProxyService.plan_request('residential', 3)
+            latencies.append(time.perf_counter() - t)
+            failed += error is not None
+        measured.result.update(summarize(latencies, time.perf_counter() - started), errors=failed)
+    return measured.result
+
+
+def _timed_get(clients, app, path, headers):
+    client = getattr(clients, 'client', None)
+    if client is None:
+        client = clients.client = app.test_client()
+    started = time.perf_counter()
+    response = client.get(path, headers=headers)
+    response.close()
+    return time.perf_counter() - started, response.status_code
+
+
+def bench_forward(app, writes, target_port, requests, concurrency):
+    from proxy_manager.services.usage import usage_recorder
+
+    path = f"/api/proxy/request?url=http://127.0.0.1:{target_port}/bench"
+    headers = {'X-API-Key': API_KEY}
+    clients = threading.local()
+    statuses = {}
+    with ThreadPoolExecutor(concurrency) as executor:
+        # Warm up sessions and connections
+        list(executor.map(lambda _: _timed_get(clients, app, path, headers), range(concurrency * 4)))
+        usage_recorder.flush()
+
+        with Measured(writes) as measured:
+            started = time.perf_counter()
+            results = list(executor.map(lambda _: _timed_get(clients, app, path, headers), range(requests)))
+            seconds = time.perf_counter() - started
+            # Usage counters are batched; their writes belong to these requests
+            usage_recorder.flush()
+            for _, status in results:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            measured.result.update(summarize([latency for latency, _ in results], seconds), statuses=statuses)
+    return measured.result
+
+
+def bench_listing(app, writes, pages, limit):
+    client = app.test_client()
+    headers = {'X-API-Key': API_KEY}
+    latencies = []
+    cursor = None
+    with Measured(writes) as measured:
+        started = time.perf_counter()
+        for _ in range(pages):
+            query = f"/api/proxies?limit={limit}" + (f"&cursor={cursor}" if cursor else '')
+            t = time.perf_counter()
+            response = client.get(query, headers=headers)
+            latencies.append(time.perf_counter() - t)
+            # Start over after the last page
+            cursor = response.get_json().get('next_cursor')
+        measured.result.update(summarize(latencies, time.perf_counter() - started), page_size=limit)
+    return measured.result
+
+
+def bench_sync(app, writes, provider_port, size):
+    """
+    Initial load of `size` provider proxies, the sync after one round of churn, then a sync with nothing to do
+    """
+    from proxy_manager.services.pool import proxy_pool
+    from proxy_manager.services.webshare import WebshareClient, webshare_sync
+
+    results = {}
+    for name, round_ in (('sync_initial', 0), ('sync_incremental', 1), ('sync_unchanged', 1)):
+        client = WebshareClient(API_KEY, f"http://127.0.0.1:{provider_port}/s{size}/r{round_}/api/v2/")
+        with app.app_context(), Measured(writes) as measured:
+            counts = webshare_sync.sync(client)
+            # The local pool picks the changes up on its next read
+            started = time.perf_counter()
+            proxy_pool.snapshot()
+            measured.result.update(counts, requests=counts['fetched'], seconds=counts['elapsed'],
+                                   per_second=round(counts['fetched'] / counts['elapsed'], 2) if counts['elapsed'] else None,
+                                   pool_refresh_seconds=round(time.perf_counter() - started, 4))
+        results[name] = measured.result
+    return results
+
+
+def bench_startup(args):
+    """
+    Time to the first forwarded request of a worker started cold and of one forked after a preload
+    """
+    imported = time.time()
+    from proxy_manager import bootstrap, create_app
+    from proxy_manager.services.pool import proxy_pool
+
+    app = create_app()
+    built = time.time()
+    # What create_app() did in every worker before AUTO_BOOTSTRAP=false
+    bootstrap(app)
+    bootstrapped = time.time()
+    with app.app_context():
+        proxy_pool.warm()
+    loaded = time.time()
+
+    path = f"/api/proxy/request?url=http://127.0.0.1:{args.target_port}/bench"
+    headers = {'X-API-Key': API_KEY}
+
+    # This process now holds what proxy_manager.wsgi leaves in the gunicorn master; fork a "worker" from it
+    read_end, write_end = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        response = app.test_client().get(path, headers=headers)
+        os.write(write_end, json.dumps([time.perf_counter() - forked, response.status_code]).encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        forked_seconds, forked_status = json.loads(f.read())
+    os.waitpid(pid, 0)
+
+    # The cold worker's own first request; its pool load was timed above
+    started = time.perf_counter()
+    response = app.test_client().get(path, headers=headers)
+    first_request = time.perf_counter() - started
+    ms = lambda seconds: round(seconds * 1000, 2)
+    return {
+        'startup_cold': {
+            'ready_ms': ms(loaded - args.spawned_at + first_request),
+            'process_start_ms': ms(imported - args.spawned_at),
+            'create_app_ms': ms(built - imported),
+            'bootstrap_ms': ms(bootstrapped - built),
+            'pool_load_ms': ms(loaded - bootstrapped),
+            'first_request_ms': ms(first_request),
+            'status': response.status_code
+        },
+        'startup_preloaded': {
+            'ready_ms': ms(forked_seconds),
+            'status': forked_status
+        }
+    }
+
+
+def worker(args):
+    """
+    Benchmark one pool size in this (fresh) process and write the result as JSON to args.result
+    """
+    if args.spawned_at is not None:
+        with open(args.result, 'w') as f:
+            json.dump({'paths': bench_startup(args)}, f)
+        return
+
+    from proxy_manager import create_app, db
+
+    started_rss = rss_mb()
+    app = create_app()
+    with app.app_context():
+        writes = WriteCounter(db.engine)
+    result = {'proxies': args.size, 'paths': {}, 'memory': {'startup_rss_mb': started_rss, 'app_rss_mb': rss_mb()}}
+    paths = result['paths']
+
+    paths['import'] = bench_import(app, writes, args.size, args.proxy_port)
+    if 'selection' in args.paths:
+        paths['selection'] = bench_selection(app, writes, args.selection_iterations)
+    if 'forward' in args.paths:
+        paths['forward'] = bench_forward(app, writes, args.target_port, args.requests, args.concurrency)
+    if 'listing' in args.paths:
+        paths['listing'] = bench_listing(app, writes, args.listing_pages, args.page_size)
+    if 'sync' in args.paths:
+        paths.update(bench_sync(app, writes, args.provider_port, args.size))
+    if 'import' not in args.paths:
+        # Seeding always imports, but it was not asked for
+        del paths['import']
+
+    result['memory'].update(rss_mb=rss_mb(), peak_rss_mb=peak_rss_mb())
+    with open(args.result, 'w') as f:
+        json.dump(result, f)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args):
+    """
+    Benchmark each pool size in a child process and write the combined JSON report
+    """
+    target, proxy = start_standins(args.body_bytes, args.proxy_latency_ms, args.proxy_jitter_ms,
+                                   args.proxy_failure_rate, args.seed)
+    provider = start_provider_stub(churn=args.churn)
+    report = {
+        'revision': _git_revision(),
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('func', 'output')},
+        'results': []
+    }
+    scratch = tempfile.mkdtemp(prefix='proxy-manager-bench-')
+    try:
+        for size in args.proxies:
+            database = os.path.join(scratch, f"bench-{size}.db")
+            result_path = os.path.join(scratch, f"result-{size}.json")
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", API_KEY=API_KEY, LOG_LEVEL='WARNING')
+            # Metrics files of a running deployment are not ours to write to
+            env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+            command = [sys.executable, '-m', 'proxy_manager.bench', 'worker', '--size', str(size),
+                       '--proxy-port', str(proxy.server_port), '--target-port', str(target.server_port),
+                       '--provider-port', str(provider.server_port),
+                       '--paths', ','.join(args.paths), '--selection-iterations', str(args.selection_iterations),
+                       '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+                       '--listing-pages', str(args.listing_pages), '--page-size', str(args.page_size),
+                       '--result', result_path]
+            cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            print(f"Benchmarking {size} proxies...", file=sys.stderr)
+            subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL, cwd=cwd)
+            with open(result_path) as f:
+                result = json.load(f)
+            if 'startup' in args.paths:
+                # A fresh process on the database seeded above, set up the way deploy.sh runs workers
+                env['AUTO_BOOTSTRAP'] = 'false'
+                subprocess.run(command + ['--spawned-at', repr(time.time())], env=env, check=True,
+                               stdout=subprocess.DEVNULL, cwd=cwd)
+                with open(result_path) as f:
+                    result['paths'].update(json.load(f)['paths'])
+            report['results'].append(result)
+            for name, path in result['paths'].items():
+                if 'ready_ms' in path:
+                    print(f"  {name:<16} first request served after {path['ready_ms']} ms", file=sys.stderr)
+                    continue
+                print(f"  {name:<16} {path.get('per_second')}/s  p50 {path.get('p50_ms')} ms  "
+                      f"p99 {path.get('p99_ms')} ms  {path.get('db_writes_per_request')} writes/req", file=sys.stderr)
+    finally:
+        target.shutdown()
+        proxy.shutdown()
+        provider.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def compare(args):
+    """
+    Print how each metric moved between two reports; exit 1 if one got worse by more than --fail-above percent
+    """
+    with open(args.before) as f:
+        before = {r['proxies']: r for r in json.load(f)['results']}
+    with open(args.after) as f:
+        after = {r['proxies']: r for r in json.load(f)['results']}
+
+    regressed = False
+    for size in sorted(set(before) & set(after)):
+        for name in before[size]['paths']:
+            old_path, new_path = before[size]['paths'][name], after[size]['paths'].get(name)
+            if not new_path:
+                continue
+            for metric, higher_is_better in COMPARED.items():
+                old, new = old_path.get(metric), new_path.get(metric)
+                if old is None or new is None:
+                    continue
+                change = (new - old) / old * 100 if old else 0.0
+                worse = -change if higher_is_better else change
+                flag = ''
+                if args.fail_above is not None and worse > args.fail_above:
+                    flag, regressed = '  REGRESSION', True
+                print(f"{size:>8} {name:<16} {metric:<22} {old:>12} -> {new:<12} {change:+.1f}%{flag}")
+    if regressed:
+        sys.exit(1)
+
+
+def provider_stub(args):
+    server = start_provider_stub(args.port, args.size, args.churn, args.api_key)
+    print(f"WEBSHARE_API_URL=http://127.0.0.1:{server.server_port}/api/v2/ WEBSHARE_API_KEY={args.api_key}",
+          file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(',') if size.strip()]
+
+
+def _paths(value):
+    paths = [path.strip() for path in value.split(',') if path.strip()]
+    for path in paths:
+        if path not in PATHS:
+            raise argparse.ArgumentTypeError(f"unknown path '{path}', expected some of {', '.join(PATHS)}")
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m proxy_manager.bench', description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--paths', type=_paths, default=list(PATHS), help='Paths to benchmark (default: all)')
+    options.add_argument('--selection-iterations', type=int, default=20000, help='Proxy selections to time')
+    options.add_argument('--requests', type=int, default=2000, help='Forwarded requests to time')
+    options.add_argument('--concurrency', type=int, default=16, help='Forwarded requests in flight')
+    options.add_argument('--listing-pages', type=int, default=200, help='Listing pages to fetch')
+    options.add_argument('--page-size', type=int, default=100, help='Proxies per listing page')
+
+    run_parser = commands.add_parser('run', parents=[options], help='Run the benchmarks')
+    run_parser.add_argument('--proxies', type=_sizes, default=[1000, 10000, 100000],
+                            help='Comma-separated pool sizes (default: 1000,10000,100000)')
+    run_parser.add_argument('--body-bytes', type=int, default=1024, help='Size of the target response')
+    run_parser.add_argument('--proxy-latency-ms', type=float, default=0.0, help='Delay added by the stand-in proxy')
+    run_parser.add_argument('--proxy-jitter-ms', type=float, default=0.0, help='Random extra delay, up to this')
+    run_parser.add_argument('--proxy-failure-rate', type=float, default=0.0,
+                            help='Share of requests the stand-in proxy answers with 502')
+    run_parser.add_argument('--seed', type=int, default=0, help='Seed for the latency and failure injection')
+    run_parser.add_argument('--churn', type=float, default=0.01,
+                            help='Share of provider proxies removed, changed and added between syncs')
+    run_parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    run_parser.set_defaults(func=run)
+
+    worker_parser = commands.add_parser('worker', parents=[options], help=argparse.SUPPRESS)
+    worker_parser.add_argument('--size', type=int, required=True)
+    worker_parser.add_argument('--proxy-port', type=int, required=True)
+    worker_parser.add_argument('--target-port', type=int, required=True)
+    worker_parser.add_argument('--provider-port', type=int, required=True)
+    worker_parser.add_argument('--result', required=True)
+    # Set by `run` for the startup path: when it launched this process (time.time())
+    worker_parser.add_argument('--spawned-at', type=float)
+    worker_parser.set_defaults(func=worker)
+
+    compare_parser = commands.add_parser('compare', help='Compare two JSON reports')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--fail-above', type=float,
+                                help='Exit with status 1 if a metric got worse by more than this many percent')
+    compare_parser.set_defaults(func=compare)
+
+    stub_parser = commands.add_parser('provider-stub', help='Serve a stand-in Webshare list API until interrupted')
+    stub_parser.add_argument('--port', type=int, default=8099)
+    stub_parser.add_argument('--size', type=int, default=1000, help='Proxies listed (override with /s<size>/ in the URL)')
+    stub_parser.add_argument('--churn', type=float, default=0.01,
+                             help='Share removed, changed and added from round 1 on (/r1/ in the URL)')
+    stub_parser.add_argument('--api-key', default=API_KEY, help='Token the stub accepts')
+    stub_parser.set_defaults(func=provider_stub)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
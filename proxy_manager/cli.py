@@ -0,0 +1,176 @@
+import time
+from datetime import datetime, timezone
+
+import click
+
+
+class MigrateCommands(click.Command):
+    """
+    Stands in for Flask-Migrate's `flask db` group until it is used.
+
+    Flask-Migrate pulls in Alembic, which is a fifth of an app's import time
+    and only needed for migrations, so workers and other commands never load it.
+    """
+
+    def __init__(self, app):
+        super().__init__('db', help='Perform database migrations.')
+        self.app = app
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask_migrate import Migrate
+        from proxy_manager import db
+
+        # Registers the real group under app.cli as 'db', replacing this one; it parses the arguments
+        # and is the command click then invokes
+        Migrate(self.app, db, render_as_batch=True)
+        return self.app.cli.commands['db'].make_context(info_name, args, parent=parent, **extra)
+
+
+def register_commands(app):
+    app.cli.add_command(MigrateCommands(app))
+
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Create missing tables and the admin user (run once before starting workers with AUTO_BOOTSTRAP=false)."""
+        from proxy_manager import bootstrap
+
+        bootstrap(app)
+        click.echo("Database ready")
+
+    @app.cli.command('health-check')
+    @click.option('--url', help='Test URL to fetch through each proxy (default: HEALTH_CHECK_URL)')
+    @click.option('--active-only', is_flag=True, help='Only probe active proxies')
+    @click.option('--loop', is_flag=True, help='Keep sweeping every --interval seconds')
+    @click.option('--interval', type=float, help='Seconds between sweeps (default: HEALTH_CHECK_INTERVAL)')
+    def health_check(url, active_only, loop, interval):
+        """Probe every proxy and store its health and latency."""
+        from proxy_manager.services.health import health_checker
+
+        if url:
+            health_checker.test_url = url
+        interval = interval or app.config['HEALTH_CHECK_INTERVAL']
+
+        while True:
+            summary = health_checker.sweep(active_only=active_only)
+            click.echo(
+                f"Checked {summary['checked']} proxies in {summary['elapsed']:.1f}s: "
+                f"{summary['healthy']} healthy, {summary['unhealthy']} unhealthy"
+            )
+            if not loop:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('webshare-sync')
+    @click.option('--loop', is_flag=True, help='Keep syncing every --interval seconds')
+    @click.option('--interval', type=float, help='Seconds between syncs (default: WEBSHARE_SYNC_INTERVAL)')
+    def webshare_sync_command(loop, interval):
+        """Sync proxies with the Webshare proxy list (inserts, updates and deactivations only)."""
+        import requests
+        from proxy_manager.services.webshare import webshare_sync
+
+        if not webshare_sync.enabled:
+            raise click.ClickException("WEBSHARE_API_KEY is not set")
+        interval = interval or app.config['WEBSHARE_SYNC_INTERVAL']
+
+        while True:
+            try:
+                counts = webshare_sync.sync()
+                click.echo(
+                    f"Synced {counts['fetched']} listed proxies in {counts['elapsed']:.1f}s: "
+                    f"{counts['added']} added, {counts['updated']} updated, {counts['deactivated']} deactivated, "
+                    f"{counts['unchanged']} unchanged, {counts['skipped']} skipped, {counts['conflicts']} conflicts"
+                )
+            except requests.RequestException as e:
+                if not loop:
+                    raise click.ClickException(f"Could not read the Webshare proxy list: {e}")
+                click.echo(f"Could not read the Webshare proxy list: {e}", err=True)
+            if not loop:
+                break
+            time.sleep(interval)
+
+    @app.cli.group('api-key')
+    def api_key():
+        """Manage the API keys accepted by the API (besides API_KEY)."""
+
+    @api_key.command('create')
+    @click.argument('name')
+    @click.option('--description', help='What the key is for')
+    @click.option('--expires-days', type=float, help='Days until the key stops working (default: never)')
+    def create_api_key(name, description, expires_days):
+        """Create a key and print it. It is shown only once."""
+        from datetime import datetime, timedelta, timezone
+        from proxy_manager import db
+        from proxy_manager.models.api_key import ApiKey
+
+        expires_at = datetime.now(timezone.utc) + timedelta(days=expires_days) if expires_days else None
+        record, key = ApiKey.generate(name, description, expires_at)
+        db.session.add(record)
+        db.session.commit()
+        click.echo(f"Created API key {record.id} ({name}):")
+        click.echo(key)
+
+    @api_key.command('list')
+    def list_api_keys():
+        """List keys with their metadata (never the keys themselves)."""
+        from proxy_manager.models.api_key import ApiKey
+
+        for record in ApiKey.query.order_by(ApiKey.id).all():
+            state = 'active' if record.is_valid() else ('expired' if record.is_active else 'revoked')
+            expires = record.expires_at.isoformat() if record.expires_at else 'never'
+            click.echo(f"{record.id}\t{record.prefix}...\t{state}\texpires {expires}\t{record.name}"
+                       f"{' - ' + record.description if record.description else ''}")
+
+    @api_key.command('revoke')
+    @click.argument('key_id', type=int)
+    def revoke_api_key(key_id):
+        """Disable a key. Workers stop accepting it within SHARED_STATE_SYNC_INTERVAL."""
+        from proxy_manager import db
+        from proxy_manager.models.api_key import ApiKey
+
+        record = db.session.get(ApiKey, key_id)
+        if record is None:
+            raise click.ClickException(f"No API key with id {key_id}")
+        record.is_active = False
+        db.session.commit()
+        click.echo(f"Revoked API key {key_id} ({record.name})")
+
+    @app.cli.command('geo-enrich')
+    @click.option('--all', 'overwrite', is_flag=True, help='Look up every proxy, not only those without a country')
+    def geo_enrich(overwrite):
+        """Fill in proxy countries and cities from GEOIP_DATABASE."""
+        from proxy_manager import db
+        from proxy_manager.models.proxy import Proxy
+        from proxy_manager.services.geo import geo_locator
+        from proxy_manager.services.pool import proxy_pool
+
+        if not geo_locator.enabled:
+            raise click.ClickException("GEOIP_DATABASE is not set")
+        query = Proxy.query if overwrite else Proxy.query.filter(Proxy.country_code.is_(None))
+        updated = 0
+        # The running workers' pools reload rows whose updated_at moved past the newest they have seen
+        now = datetime.now(timezone.utc)
+        for proxy in query.yield_per(1000):
+            country_code, city_name = geo_locator.lookup(proxy.ip)
+            if country_code and (country_code, city_name) != (proxy.country_code, proxy.city_name):
+                proxy.country_code, proxy.city_name = country_code, city_name
+                proxy.updated_at = now
+                updated += 1
+        db.session.commit()
+        if updated:
+            proxy_pool.invalidate()
+        click.echo(f"Located {updated} proxies")
+
+    @app.cli.command('set-password')
+    @click.argument('username')
+    @click.password_option()
+    def set_password(username, password):
+        """Change a user's password; cached logins with the old one are dropped."""
+        from proxy_manager import db
+        from proxy_manager.models.user import User
+
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"No user named {username}")
+        user.set_password(password)
+        db.session.commit()
+        click.echo(f"Password changed for {username}")
@@ -0,0 +1,84 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def database_url(data_dir):
+    """
+    Resolve DATABASE_URL, defaulting to data/proxies.db
+
+    Relative SQLite paths (e.g. sqlite:///proxies.db from .env.example) are
+    placed in the data directory, where the database has always lived.
+    """
+    url = os.getenv('DATABASE_URL') or 'sqlite:///proxies.db'
+    # Some hosts still hand out the postgres:// scheme, which SQLAlchemy 1.4+ rejects
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite':
+        database = parsed.database
+        if database and database != ':memory:' and not database.startswith('file:') and not os.path.isabs(database):
+            url = parsed.set(database=os.path.join(data_dir, database)).render_as_string(hide_password=False)
+    return url
+
+
+def engine_options(url, config):
+    """
+    SQLAlchemy engine options suited to the backend
+
+    SQLite allows one writer at a time per file, so a big pool per worker
+    only adds connections waiting on the same lock; a few connections with a
+    busy timeout are enough. Server databases get a regular pool, sized per
+    gunicorn worker, with pre-ping so connections dropped by the server or a
+    pooler are replaced transparently.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == 'sqlite':
+        if parsed.database in (None, '', ':memory:'):
+            # In-memory databases get a single static connection from Flask-SQLAlchemy
+            return {}
+        return {
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'connect_args': {
+                # Seconds the driver waits on a locked database before raising
+                'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000,
+                # Connections are shared between threads (and greenlets) by the pool
+                'check_same_thread': False,
+            },
+        }
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def configure_engine(engine, config):
+    """
+    Engine setup that can't be passed as engine options: a fresh connection
+    pool after fork, and per-connection SQLite settings
+    """
+    # A process forked from one that already used the engine (gunicorn preload_app) must not share its
+    # connections; close=False leaves them to the parent
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+    if engine.dialect.name != 'sqlite':
+        return
+
+    busy_timeout = int(config['SQLITE_BUSY_TIMEOUT'])
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run alongside the single writer; NORMAL only fsyncs at checkpoints
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        cursor.close()
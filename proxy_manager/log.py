@@ -0,0 +1,127 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Per-request events on the forwarding hot path
+request_log = logging.getLogger('proxy_manager.requests')
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message and the `extra=` fields
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keep a random `rate` share of records below WARNING; warnings and errors always pass
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class LogWriter:
+    """
+    Log records are put on an in-memory queue by the request handling code
+    and written to stdout by a background thread, so a slow or blocked stdout
+    never stalls a request. The queue is bounded: when it is full, records
+    are dropped and counted rather than waited on.
+    """
+
+    def __init__(self):
+        self.queue = None
+        self.listener = None
+        self.handler = None
+        self.dropped = 0
+
+    def configure(self, level='INFO', fmt='json', sample_rate=1.0, queue_size=10000):
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == 'json' else
+                            logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+        self.stop()
+        self.queue = queue.Queue(queue_size)
+        self.handler = _DroppingQueueHandler(self.queue, self)
+        self.handler.addFilter(SampleFilter(sample_rate))
+        self.listener = QueueListener(self.queue, output, respect_handler_level=True)
+
+        logger = logging.getLogger('proxy_manager')
+        logger.handlers = [self.handler]
+        logger.setLevel(level)
+        logger.propagate = False
+        self.listener.start()
+
+    def stop(self):
+        """
+        Write out what is queued and stop the writer thread
+        """
+        if self.listener is not None:
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass
+            self.listener = None
+
+    def _restart_after_fork(self):
+        # The writer thread does not survive fork(); each worker gets its own, on a fresh queue
+        if self.listener is not None:
+            self.queue = queue.Queue(self.queue.maxsize)
+            self.handler.queue = self.listener.queue = self.queue
+            self.listener._thread = None
+            self.listener.start()
+
+
+class _DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue, owner):
+        super().__init__(log_queue)
+        self.owner = owner
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.owner.dropped += 1
+
+
+log_writer = LogWriter()
+
+atexit.register(log_writer.stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=log_writer._restart_after_fork)
+
+
+def configure_logging(app):
+    log_writer.configure(
+        level=app.config['LOG_LEVEL'],
+        fmt=app.config['LOG_FORMAT'],
+        sample_rate=app.config['LOG_SAMPLE_RATE'],
+        queue_size=app.config['LOG_QUEUE_SIZE']
+    )
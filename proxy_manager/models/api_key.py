@@ -0,0 +1,60 @@
+import hashlib
+import secrets
+from datetime import datetime, timezone
+from proxy_manager import db
+
+class ApiKey(db.Model):
+    __tablename__ = 'api_key'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    description = db.Column(db.String(255))
+    # SHA-256 of the key; keys are random, so a fast hash is enough and lookups are one index probe
+    key_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    # First characters of the key, to tell keys apart in listings
+    prefix = db.Column(db.String(12), nullable=False)
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    expires_at = db.Column(db.DateTime(timezone=True))
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    @classmethod
+    def generate(cls, name, description=None, expires_at=None):
+        """
+        Create a key. The plain key is only returned here; the database keeps its hash.
+
+        Returns:
+            tuple: (ApiKey, plain key)
+        """
+        key = 'pm_' + secrets.token_urlsafe(32)
+        record = cls(name=name, description=description, key_hash=cls.hash_key(key), prefix=key[:11],
+                     expires_at=expires_at)
+        return record, key
+
+    @property
+    def expires_timestamp(self):
+        if self.expires_at is None:
+            return None
+        expires_at = self.expires_at
+        # SQLite hands back naive datetimes
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at.timestamp()
+
+    def is_valid(self, now=None):
+        expires_at = self.expires_timestamp
+        return self.is_active and (expires_at is None or expires_at > (now or datetime.now(timezone.utc).timestamp()))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'prefix': self.prefix,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
@@ -0,0 +1,20 @@
+from proxy_manager import db
+
+# Named counters bumped in the same transaction as a change that caches in other processes must not outlive
+class Generation(db.Model):
+    __tablename__ = 'generation'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def bump(cls, connection, name):
+        table = cls.__table__
+        result = connection.execute(table.update().where(table.c.name == name).values(value=table.c.value + 1))
+        if not result.rowcount:
+            connection.execute(table.insert().values(name=name, value=1))
+
+    @classmethod
+    def read(cls, connection, name):
+        table = cls.__table__
+        return connection.execute(db.select(table.c.value).where(table.c.name == name)).scalar() or 0
@@ -2,6 +2,16 @@ from datetime import datetime, timezone
 from proxy_manager import db
 
 class Proxy(db.Model):
+    __table_args__ = (
+        # Selection and listing filter on these; (ip, port) is also what imports de-duplicate on
+        db.Index('ix_proxy_active_type', 'is_active', 'proxy_type'),
+        db.Index('ix_proxy_type_country', 'proxy_type', 'country_code'),
+        db.Index('ix_proxy_ip_port', 'ip', 'port', unique=True),
+        # The pools reload rows changed or health checked since their last check (see ProxyPool)
+        db.Index('ix_proxy_updated_at', 'updated_at'),
+        db.Index('ix_proxy_last_checked', 'last_checked'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     webshare_id = db.Column(db.String(50), unique=True) 
     ip = db.Column(db.String(50), nullable=False)
@@ -16,6 +26,14 @@ class Proxy(db.Model):
     country_code = db.Column(db.String(2))  
     city_name = db.Column(db.String(100))   
     created_at = db.Column(db.DateTime(timezone=True)) 
+    # Filled in by the background health checker
+    is_healthy = db.Column(db.Boolean)
+    connect_ms = db.Column(db.Float)
+    ttfb_ms = db.Column(db.Float)
+    last_checked = db.Column(db.DateTime(timezone=True))
+    last_check_error = db.Column(db.String(255))
+    # Set when the address, credentials, location or active flag change in place (provider sync)
+    updated_at = db.Column(db.DateTime(timezone=True))
 
     @property
     def failure_rate(self):
@@ -39,5 +57,9 @@ class Proxy(db.Model):
             'failure_rate': self.failure_rate,
             'country_code': self.country_code,
             'city_name': self.city_name,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'is_healthy': self.is_healthy,
+            'connect_ms': self.connect_ms,
+            'ttfb_ms': self.ttfb_ms,
+            'last_checked': self.last_checked.isoformat() if self.last_checked else None
         }
\ No newline at end of file
@@ -0,0 +1,214 @@
+import bisect
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from proxy_manager.services.shared import shared_state
+
+
+def session_hash(session_id):
+    # Stable across processes, unlike hash(), so every worker agrees on ring positions
+    return struct.unpack('<Q', hashlib.blake2b(session_id.encode(), digest_size=8).digest())[0]
+
+
+_POINTS = struct.Struct('<16I')
+
+
+class HashRing:
+    """
+    Consistent hash ring over the proxy ids of one pool bucket. Each proxy
+    owns 16 points, so adding or removing a proxy only moves the sessions
+    next to its points (about 1/n of them).
+
+    The ring holds bucket positions, not records: it stays valid for any
+    bucket with the same ids in the same order, e.g. after a health check
+    swaps in a new pool snapshot.
+    """
+    __slots__ = ('ids', 'index', '_points')
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.index = {proxy_id: i for i, proxy_id in enumerate(ids)}
+        # Point and bucket position packed in one int, so the ring is a single sorted list
+        points = []
+        for i, proxy_id in enumerate(ids):
+            digest = hashlib.blake2b(b'%d' % proxy_id, digest_size=64).digest()
+            points.extend([point << 24 | i for point in _POINTS.unpack(digest)])
+        points.sort()
+        self._points = points
+
+    def walk(self, key_hash, limit):
+        """
+        Up to `limit` distinct bucket positions clockwise from a key: its owner first, then the failover order
+        """
+        n = len(self._points)
+        start = bisect.bisect(self._points, (key_hash >> 32) << 24)
+        seen = set()
+        for step in range(n):
+            i = self._points[(start + step) % n] & 0xFFFFFF
+            if i in seen:
+                continue
+            seen.add(i)
+            yield i
+            if len(seen) >= limit:
+                return
+
+
+class SessionAffinity:
+    """
+    Sticky sessions: requests with the same session id go through the same proxy.
+
+    A new session gets the proxy that owns its position on a consistent hash
+    ring over the bucket, which is the same in every worker. Once a proxy has
+    served the session, the session is pinned to it for `ttl` idle seconds, so
+    it stays there when proxies are added or removed. If the pinned proxy is
+    quarantined or fails, the session moves along its ring to the next healthy
+    proxy and is re-pinned to whichever one serves it.
+
+    Pins live in an LRU table of at most `max_entries` sessions, keyed by a
+    64-bit hash of the session id, so lookups are O(1) and memory is bounded
+    however many session ids clients make up. A session pushed out of the
+    table falls back to its ring position, which is where it was pinned unless
+    it failed over. With Redis shared state the pins are kept in Redis instead
+    and re-pins are seen by every worker.
+    """
+
+    def __init__(self, ttl=1800.0, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._pins = OrderedDict()
+        self._rings = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.new = 0
+        self.failovers = 0
+        self.repinned = 0
+        self.evicted = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('STICKY_SESSION_TTL', self.ttl)
+        self.max_entries = app.config.get('STICKY_SESSION_MAX', self.max_entries)
+
+    def reset_rings(self):
+        """
+        Forget which bucket tuples the rings were built for (rings and pins are kept)
+        """
+        with self._lock:
+            self._buckets = {}
+
+    def _ring(self, candidates):
+        entry = self._buckets.get(id(candidates))
+        if entry is not None and entry[0] is candidates:
+            return entry[1]
+        # A new snapshot usually has the same proxies: only rebuild when they changed
+        ids = tuple(record.id for record in candidates)
+        ring = self._rings.get(ids)
+        if ring is None:
+            ring = HashRing(ids)
+        with self._lock:
+            # Bounded in case buckets are built outside the pool
+            if len(self._rings) > 16:
+                self._rings.clear()
+            if len(self._buckets) > 256:
+                self._buckets.clear()
+            self._rings[ids] = ring
+            self._buckets[id(candidates)] = (candidates, ring)
+        return ring
+
+    def pinned(self, session_id):
+        """
+        Proxy id the session is pinned to, or None
+        """
+        key_hash = session_hash(session_id)
+        proxy_id = shared_state.pinned(key_hash)
+        if proxy_id is not None:
+            return proxy_id or None
+        with self._lock:
+            entry = self._pins.get(key_hash)
+            if entry is None:
+                return None
+            proxy_id, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._pins[key_hash]
+                return None
+            return proxy_id
+
+    def pin(self, session_id, proxy_id):
+        """
+        Pin the session to a proxy, or renew its pin, for another `ttl` seconds
+        """
+        key_hash = session_hash(session_id)
+        previous = shared_state.pin(key_hash, proxy_id, self.ttl)
+        if previous is not None:
+            if previous and previous != proxy_id:
+                self.repinned += 1
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pins.get(key_hash)
+            if entry is not None and entry[0] != proxy_id and entry[1] > now:
+                self.repinned += 1
+            self._pins[key_hash] = (proxy_id, now + self.ttl)
+            self._pins.move_to_end(key_hash)
+            # The table is in last-use order: expired pins and the overflow are at the front
+            while self._pins:
+                oldest = next(iter(self._pins.values()))
+                if len(self._pins) <= self.max_entries and oldest[1] > now:
+                    break
+                self._pins.popitem(last=False)
+                self.evicted += 1
+
+    def route(self, session_id, candidates, k, accept=None):
+        """
+        Proxies to try for a session, in order: its pinned proxy, then the next ones on its ring
+
+        Args:
+            session_id (str): Client-supplied session id
+            candidates (tuple): Pool bucket to choose from
+            k (int): Number of proxies wanted
+            accept (callable, optional): Predicate on a proxy id, e.g. the circuit breaker check
+        """
+        if not candidates or k <= 0:
+            return []
+        k = min(k, len(candidates))
+        ring = self._ring(candidates)
+        pinned_id = self.pinned(session_id)
+
+        picked = []
+        i = ring.index.get(pinned_id) if pinned_id is not None else None
+        if i is not None:
+            if accept is None or accept(pinned_id):
+                picked.append(candidates[i])
+                self.hits += 1
+            else:
+                self.failovers += 1
+        else:
+            # No pin, or pinned to a proxy that is gone or in another bucket
+            self.new += 1
+
+        for j in ring.walk(session_hash(session_id), k + 32):
+            if len(picked) == k:
+                break
+            record = candidates[j]
+            if record.id == pinned_id:
+                continue
+            if accept is None or accept(record.id):
+                picked.append(record)
+        return picked
+
+    def stats(self):
+        return {
+            'shared': shared_state.shares_sessions,
+            'pinned': len(self._pins),
+            'hits': self.hits,
+            'new': self.new,
+            'failovers': self.failovers,
+            'repinned': self.repinned,
+            'evicted': self.evicted
+        }
+
+
+session_affinity = SessionAffinity()
@@ -0,0 +1,215 @@
+import asyncio
+import time
+
+from proxy_manager.services.breaker import classify_error
+from proxy_manager.services.hedging import latency_tracker
+from proxy_manager.services.pool import proxy_pool
+from proxy_manager.services.proxy_service import ProxyService
+from proxy_manager.services.limits import proxy_limiter
+from proxy_manager.services.metrics import proxy_metrics
+
+
+class AsyncForwarder:
+    """
+    asyncio counterpart of ProxyService.make_request.
+
+    Uses the same proxy plan, response envelope and usage accounting, but an
+    upstream round-trip only holds a coroutine, so one process can keep tens of
+    thousands of requests in flight. `global_limit` caps in-flight requests for
+    the process and `per_proxy_limit` caps them per upstream proxy.
+    """
+
+    def __init__(self, app=None, global_limit=10000, per_proxy_limit=100):
+        self.app = app
+        self.global_limit = global_limit
+        self.per_proxy_limit = per_proxy_limit
+        self._session = None
+        self._global = None
+        self._per_proxy = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.global_limit = app.config.get('ASYNC_GLOBAL_CONCURRENCY', self.global_limit)
+        self.per_proxy_limit = app.config.get('ASYNC_PER_PROXY_CONCURRENCY', self.per_proxy_limit)
+
+    async def start(self):
+        # Imported here so the sync app does not need aiohttp installed
+        import aiohttp
+
+        self._global = asyncio.Semaphore(self.global_limit)
+        connector = aiohttp.TCPConnector(limit=0, ssl=False, ttl_dns_cache=300)
+        # Never carry one caller's cookies into another's request
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            trust_env=False
+        )
+        await self.refresh_pool()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def refresh_pool(self):
+        """
+        Reload the proxy pool off the event loop when it is due; reads on the loop never refresh it
+        """
+        if proxy_pool.needs_refresh():
+            await asyncio.get_running_loop().run_in_executor(None, self._refresh_pool_sync)
+
+    def _refresh_pool_sync(self):
+        with self.app.app_context():
+            proxy_pool.snapshot()
+
+    def _proxy_semaphore(self, proxy_id):
+        semaphore = self._per_proxy.get(proxy_id)
+        if semaphore is None:
+            semaphore = self._per_proxy[proxy_id] = asyncio.Semaphore(self.per_proxy_limit)
+        return semaphore
+
+    async def _send(self, proxy, url, method, params, headers, data, timeout, body='text'):
+        import aiohttp
+
+        async with self._global, self._proxy_semaphore(proxy.id):
+            async with self._session.request(
+                method,
+                url,
+                params=params,
+                headers=headers,
+                data=data,
+                proxy=proxy.url,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                auto_decompress=body != 'raw'
+            ) as response:
+                if body == 'text':
+                    return response.status, response.headers, await response.text(errors='replace')
+                content = await response.read()
+                response_headers = response.headers
+                if body == 'bytes' and 'Content-Encoding' in response_headers:
+                    # Decompressed: the upstream encoding and length no longer describe the body
+                    response_headers = {k: v for k, v in response_headers.items()
+                                        if k.lower() not in ('content-encoding', 'content-length')}
+                return response.status, response_headers, content
+
+    async def _attempt(self, proxy, url, method, params, headers, data, timeout, body='text'):
+        """
+        One upstream attempt with usage and latency accounting
+        """
+        await proxy_limiter.acquire_async(proxy, proxy_limiter.deadline())
+        started = time.monotonic()
+        try:
+            result = await self._send(proxy, url, method, params, headers, data, timeout, body)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            ProxyService.record_proxy_usage(proxy.id, url, method, 0, error=str(e) or e.__class__.__name__,
+                                            error_kind=classify_error(e), latency=time.monotonic() - started,
+                                            proxy_type=proxy.proxy_type)
+            raise
+        finally:
+            # _send() reads the whole body before returning, so the slot covered the download
+            proxy_limiter.release(proxy)
+        latency = time.monotonic() - started
+        latency_tracker.add(latency)
+        ProxyService.record_proxy_usage(proxy.id, url, method, result[0], latency=latency, proxy_type=proxy.proxy_type)
+        return result
+
+    async def _hedged(self, plan, hedge, hedge_delay, errors, url, method, params, headers, data, timeout, body='text'):
+        """
+        Race up to `hedge` attempts through different proxies, starting a new one
+        every `hedge_delay` seconds (or as soon as one fails). The first response
+        wins and the other attempts are cancelled.
+
+        Returns:
+            tuple: ((response_data, status_code) or None, attempts started)
+        """
+        pending = {}
+        started = 0
+
+        def launch():
+            nonlocal started
+            proxy = plan.proxies.pop(0)
+            started += 1
+            task = asyncio.ensure_future(self._attempt(proxy, url, method, params, headers, data, timeout, body))
+            pending[task] = proxy
+
+        launch()
+        try:
+            while pending:
+                can_hedge = plan.proxies and len(pending) < hedge
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+
+                for task in done:
+                    proxy = pending.pop(task)
+                    try:
+                        status_code, response_headers, content = task.result()
+                    except Exception as e:
+                        errors.append(f"Proxy {proxy.address} failed: {str(e) or e.__class__.__name__}")
+                        if plan.proxies:
+                            launch()
+                        continue
+                    return (ProxyService.build_response(proxy, status_code, response_headers, content, plan.note), status_code), started
+            return None, started
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def forward(self, url, method='GET', params=None, headers=None, data=None, max_retries=3, timeout=30, proxy_type=None,
+                      hedge=1, hedge_delay=None, session=None, body='text', geo=None):
+        """
+        Forward a request through a proxy; same arguments and return value as ProxyService.make_request
+        """
+        await self.refresh_pool()
+        # The plan holds every proxy the request may use, so nothing below reads the pool
+        with self.app.app_context(), proxy_pool.without_refresh():
+            plan, error = ProxyService.plan_request(proxy_type, max_retries, session, geo)
+        if error:
+            return error
+
+        attempt = 0
+        errors = []
+
+        if hedge > 1 and not plan.session:
+            result, attempt = await self._hedged(plan, hedge, hedge_delay or 0, errors, url, method, params, headers, data, timeout,
+                                                 body)
+            if result:
+                return result
+
+        while attempt < max_retries:
+            attempt += 1
+            if not plan.proxies:
+                break
+
+            proxy = plan.proxies.pop(0)
+            if attempt > 1:
+                proxy_metrics.retry(proxy.proxy_type)
+            try:
+                status_code, response_headers, content = await self._attempt(proxy, url, method, params, headers, data, timeout,
+                                                                              body)
+                plan.pin(proxy)
+                return ProxyService.build_response(proxy, status_code, response_headers, content, plan.note), status_code
+            except Exception as e:
+                errors.append(f"Proxy {proxy.address} failed: {str(e) or e.__class__.__name__}")
+
+        # Try with the other proxy type as a last resort
+        proxy, fallback_msg = plan.last_resort(attempt)
+        if proxy:
+            try:
+                status_code, response_headers, content = await self._attempt(proxy, url, method, params, headers, data, timeout,
+                                                                              body)
+                # Not pinned, as in ProxyService.make_request
+                return ProxyService.build_response(proxy, status_code, response_headers, content, fallback_msg), status_code
+            except Exception as e:
+                errors.append(f"Proxy {proxy.address} failed: {str(e) or e.__class__.__name__}")
+
+        return {
+            "error": "All retries failed",
+            "details": errors
+        }, 503
@@ -0,0 +1,178 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from proxy_manager.services.cache import CACHEABLE_METHODS, parse_cache_ttl, response_cache
+from proxy_manager.services.geo import DEFAULT_FALLBACK, parse_geo
+from proxy_manager.services.metrics import proxy_metrics
+from proxy_manager.services.proxy_service import ProxyService
+
+ALLOWED_METHODS = ['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD']
+PROXY_TYPES = ['datacenter', 'residential']
+# Never forwarded upstream, as in /api/proxy/request
+SKIPPED_HEADERS = {'host', 'x-api-key', 'content-length', 'x-proxy-session', 'x-proxy-cache', 'x-proxy-cache-ttl',
+                   'x-proxy-country', 'x-proxy-city', 'x-proxy-region', 'x-proxy-geo-fallback'}
+
+# Runs batch items; under gevent these threads are greenlets
+batch_executor = ThreadPoolExecutor(max_workers=256, thread_name_prefix='batch')
+
+
+class BatchItem:
+    """
+    One validated request of a batch
+    """
+    __slots__ = ('index', 'id', 'url', 'method', 'params', 'headers', 'data', 'proxy_type', 'session',
+                 'use_cache', 'cache_ttl', 'geo')
+
+    def __init__(self, index, spec, default_proxy_type, default_fallback=DEFAULT_FALLBACK):
+        if not isinstance(spec, dict):
+            raise ValueError("must be an object")
+        self.index = index
+        self.id = spec.get('id')
+
+        self.url = spec.get('url')
+        if not self.url or not isinstance(self.url, str):
+            raise ValueError("url is required")
+
+        self.method = str(spec.get('method', 'GET')).upper()
+        if self.method not in ALLOWED_METHODS:
+            raise ValueError("invalid HTTP method")
+
+        self.params = spec.get('params') or {}
+        self.headers = spec.get('headers') or {}
+        if not isinstance(self.params, dict) or not isinstance(self.headers, dict):
+            raise ValueError("params and headers must be objects")
+        self.params = {str(k): str(v) for k, v in self.params.items()}
+        self.headers = {str(k): str(v) for k, v in self.headers.items() if str(k).lower() not in SKIPPED_HEADERS}
+
+        data = spec.get('data')
+        if data is not None and not isinstance(data, str):
+            raise ValueError("data must be a string")
+        self.data = data.encode('utf-8') if data is not None and self.method in ['POST', 'PUT', 'PATCH'] else None
+
+        self.proxy_type = str(spec.get('proxy_type') or default_proxy_type).lower()
+        if self.proxy_type not in PROXY_TYPES:
+            raise ValueError("invalid proxy type. Must be 'datacenter' or 'residential'")
+
+        self.session = spec.get('session')
+        if self.session is not None:
+            self.session = str(self.session)
+
+        ttl = spec.get('cache_ttl')
+        self.use_cache, self.cache_ttl = parse_cache_ttl('true' if spec.get('cache') else '',
+                                                         str(ttl) if ttl is not None else None)
+
+        geo = [spec.get(name) for name in ('country', 'city', 'region', 'geo_fallback')]
+        if any(value is not None and not isinstance(value, str) for value in geo):
+            raise ValueError("country, city, region and geo_fallback must be strings")
+        self.geo = parse_geo(*geo, default_fallback=default_fallback)
+
+
+def parse_batch(payload, default_proxy_type='residential', max_items=1000, default_concurrency=10, max_concurrency=50,
+                default_fallback=DEFAULT_FALLBACK):
+    """
+    Validate a batch request body
+
+    Args:
+        payload (dict): {"requests": [request spec, ...], "concurrency": n}
+        default_proxy_type (str): Proxy type of items that don't set one
+        max_items (int): Largest batch accepted
+        default_concurrency (int): Concurrency when the body doesn't set one
+        max_concurrency (int): Upper bound for the concurrency
+        default_fallback (str): Geo fallback order of items that don't set one
+
+    Returns:
+        tuple: (list of BatchItem, concurrency)
+
+    Raises:
+        ValueError: If the body or one of its requests is malformed
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('requests'), list):
+        raise ValueError("Body must be a JSON object with a 'requests' list")
+    specs = payload['requests']
+    if not specs:
+        raise ValueError("'requests' is empty")
+    if len(specs) > max_items:
+        raise ValueError(f"At most {max_items} requests per batch")
+
+    try:
+        concurrency = int(payload.get('concurrency') or default_concurrency)
+    except (TypeError, ValueError):
+        raise ValueError("'concurrency' must be a positive integer")
+    if concurrency < 1:
+        raise ValueError("'concurrency' must be a positive integer")
+
+    items = []
+    for index, spec in enumerate(specs):
+        try:
+            items.append(BatchItem(index, spec, default_proxy_type, default_fallback))
+        except ValueError as e:
+            raise ValueError(f"Request {index}: {e}")
+    return items, min(concurrency, max_concurrency, len(items))
+
+
+def _forward(app, item):
+    def forward():
+        return ProxyService.make_request(
+            url=item.url,
+            method=item.method,
+            params=item.params,
+            headers=item.headers,
+            data=item.data,
+            max_retries=3,
+            timeout=30,
+            proxy_type=item.proxy_type,
+            session=item.session,
+            geo=item.geo
+        )
+
+    started = time.monotonic()
+    with app.app_context():
+        if item.use_cache and item.method in CACHEABLE_METHODS:
+            key = response_cache.key(item.method, item.url, item.params, item.headers, item.proxy_type, geo=item.geo)
+            (response_data, status_code), cache_result = response_cache.fetch(key, forward, item.cache_ttl)
+            response_data = dict(response_data, cache=cache_result)
+            proxy_metrics.cache(cache_result, response_cache.body_size(response_data) if cache_result != 'miss' else 0)
+        else:
+            response_data, status_code = forward()
+    proxy_metrics.request('batch', status_code, time.monotonic() - started)
+    return response_data, status_code
+
+
+def run_batch(app, items, concurrency):
+    """
+    Forward every item through the pool, at most `concurrency` at a time
+
+    Yields one result per item, in completion order: the make_request envelope
+    (or its error) plus "index" (position in the batch), "id" if the item had one,
+    and "status_code" for errors too. Items not yet started when the generator is
+    closed (client gone) are never sent.
+    """
+    queued = iter(items)
+    pending = {}
+
+    def submit():
+        item = next(queued, None)
+        if item is not None:
+            pending[batch_executor.submit(_forward, app, item)] = item
+
+    for _ in range(concurrency):
+        submit()
+    try:
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                submit()
+                try:
+                    response_data, status_code = future.result()
+                except Exception as e:
+                    response_data, status_code = {"error": "Request failed", "details": [str(e)]}, 500
+                result = {"index": item.index}
+                if item.id is not None:
+                    result["id"] = item.id
+                result.update(response_data)
+                result.setdefault("status_code", status_code)
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,197 @@
+import asyncio
+import threading
+import time
+
+import requests
+
+from proxy_manager.services.shared import shared_state
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Failure kinds that are the proxy's fault. 'auth' trips the breaker at once
+PROXY_ERRORS = ('auth', 'proxy', 'connect', 'timeout')
+# aiohttp connection errors that are about the target's certificate, not the proxy
+AIOHTTP_SSL_ERRORS = ('ClientSSLError', 'ClientConnectorSSLError', 'ClientConnectorCertificateError')
+
+
+def classify_error(exc):
+    """
+    Map an upstream exception (requests or aiohttp) to a failure kind
+
+    Returns:
+        str: 'auth', 'proxy', 'timeout' or 'connect', or None if the error is not the proxy's fault
+    """
+    name = type(exc).__name__
+    if isinstance(exc, requests.exceptions.ProxyError) or name in ('ClientProxyConnectionError', 'ClientHttpProxyError'):
+        return 'auth' if '407' in str(exc) or getattr(exc, 'status', None) == 407 else 'proxy'
+    if isinstance(exc, (requests.exceptions.Timeout, asyncio.TimeoutError, TimeoutError)):
+        return 'timeout'
+    if isinstance(exc, requests.exceptions.RequestException):
+        # Every requests exception is an OSError; only a refused or reset connection is the proxy's.
+        # Bad URLs, redirect loops, TLS failures and broken bodies are the caller's or the target's
+        if isinstance(exc, requests.exceptions.ConnectionError) and \
+                not isinstance(exc, requests.exceptions.SSLError):
+            return 'connect'
+        return None
+    if name in AIOHTTP_SSL_ERRORS:
+        return None
+    if isinstance(exc, (ConnectionError, OSError)):
+        return 'connect'
+    return None
+
+
+class Breaker:
+    __slots__ = ('state', 'failures', 'trips', 'open_until', 'probe_started', 'last_error')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probe_started = 0.0
+        self.last_error = None
+
+    def to_dict(self, proxy_id):
+        return {
+            'proxy_id': proxy_id,
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'trips': self.trips,
+            'retry_in': max(0.0, self.open_until - time.monotonic()) if self.state == OPEN else 0.0,
+            'last_error': self.last_error
+        }
+
+
+class CircuitBreakers:
+    """
+    Per-proxy circuit breakers driven by the make_request outcomes.
+
+    A proxy opens after `failure_threshold` consecutive proxy-side failures
+    (or one 407) and is skipped by selection without touching the database.
+    After its cooldown it goes half-open and lets one probe request through:
+    success closes it, failure re-opens it with the cooldown doubled, up to
+    `max_cooldown`.
+
+    With shared state enabled, failures are counted across all workers and a
+    quarantine set by one worker is honoured by the others: they go half-open
+    when it runs out and only close once some worker's probe succeeded.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=600.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.failure_threshold = app.config.get('BREAKER_FAILURE_THRESHOLD', self.failure_threshold)
+        self.cooldown = app.config.get('BREAKER_COOLDOWN', self.cooldown)
+        self.max_cooldown = app.config.get('BREAKER_MAX_COOLDOWN', self.max_cooldown)
+
+    def allow(self, proxy_id):
+        """
+        Whether a request may go through this proxy now
+        """
+        breaker = self._breakers.get(proxy_id)
+        if breaker is None or breaker.state == CLOSED:
+            # Another worker may have quarantined it
+            shared_until = shared_state.open_until(proxy_id)
+            if not shared_until:
+                return True
+            with self._lock:
+                breaker = self._adopt(proxy_id, shared_until)
+
+        now = time.monotonic()
+        with self._lock:
+            if shared_state.open_until(proxy_id) == 0.0:
+                # Another worker's probe got through and closed it (an expired cooldown is not enough)
+                self._breakers.pop(proxy_id, None)
+                return True
+            if breaker.state == OPEN:
+                if now < breaker.open_until:
+                    return False
+                breaker.state = HALF_OPEN
+                breaker.probe_started = now
+                return True
+            # Half-open: one probe at a time, but don't wait forever on a probe that was never sent
+            if now - breaker.probe_started > self.cooldown:
+                breaker.probe_started = now
+                return True
+            return False
+
+    def _adopt(self, proxy_id, shared_until):
+        # Quarantined by another worker: sit out the rest of its cooldown, then probe it like a local breaker
+        breaker = self._breakers.get(proxy_id)
+        if breaker is None:
+            breaker = self._breakers[proxy_id] = Breaker()
+        if breaker.state == CLOSED:
+            breaker.state = OPEN
+            breaker.trips = max(breaker.trips, 1)
+            breaker.open_until = time.monotonic() + max(0.0, shared_until - time.time())
+            breaker.last_error = breaker.last_error or 'quarantined by another worker'
+        return breaker
+
+    def record_success(self, proxy_id):
+        shared_state.success(proxy_id)
+        breaker = self._breakers.get(proxy_id)
+        if breaker is None:
+            return
+        with self._lock:
+            # Healthy again: closed breakers with no failures are not kept
+            self._breakers.pop(proxy_id, None)
+
+    def record_failure(self, proxy_id, kind, error=None):
+        if kind not in PROXY_ERRORS:
+            return
+        shared_failures = shared_state.failure(proxy_id)
+        with self._lock:
+            breaker = self._breakers.get(proxy_id)
+            if breaker is None:
+                breaker = self._breakers[proxy_id] = Breaker()
+            breaker.failures += 1
+            breaker.last_error = error or kind
+            if breaker.state == OPEN:
+                # Late result from a request sent before the breaker opened
+                return
+            failures = max(breaker.failures, shared_failures)
+            if breaker.state == HALF_OPEN or kind == 'auth' or failures >= self.failure_threshold:
+                # Published under the lock so allow() never sees it open here but not shared
+                shared_state.trip(proxy_id, self._trip(breaker))
+
+    def _trip(self, breaker):
+        breaker.trips += 1
+        cooldown = min(self.cooldown * (2 ** (breaker.trips - 1)), self.max_cooldown)
+        breaker.state = OPEN
+        breaker.open_until = time.monotonic() + cooldown
+        return cooldown
+
+    def quarantined(self, proxy_id):
+        """
+        Whether this worker is keeping the proxy out right now (open and still cooling down); no side effects
+        """
+        breaker = self._breakers.get(proxy_id)
+        return breaker is not None and breaker.state == OPEN and time.monotonic() < breaker.open_until
+
+    def state(self, proxy_id):
+        breaker = self._breakers.get(proxy_id)
+        return breaker.state if breaker else CLOSED
+
+    def to_list(self, state=None):
+        return [
+            breaker.to_dict(proxy_id)
+            for proxy_id, breaker in list(self._breakers.items())
+            if breaker.state != CLOSED and (state is None or breaker.state == state)
+        ]
+
+    def stats(self):
+        counts = {OPEN: 0, HALF_OPEN: 0}
+        for breaker in list(self._breakers.values()):
+            if breaker.state in counts:
+                counts[breaker.state] += 1
+        return counts
+
+
+proxy_breakers = CircuitBreakers()
@@ -0,0 +1,422 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger('proxy_manager.cache')
+
+# Responses that may be stored without explicit freshness information (RFC 9111, 4.2.2)
+CACHEABLE_STATUS = {200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501}
+CACHEABLE_METHODS = ('GET', 'HEAD')
+
+
+def parse_cache_ttl(cache_header, ttl_header):
+    """
+    Parse the X-Proxy-Cache / X-Proxy-Cache-TTL request headers
+
+    Returns:
+        tuple: (use cache, ttl seconds or None to follow the upstream Cache-Control)
+
+    Raises:
+        ValueError: If the TTL is not a non-negative number
+    """
+    if ttl_header:
+        ttl = float(ttl_header)
+        if ttl < 0:
+            raise ValueError("Cache TTL must not be negative")
+        return True, ttl
+    return (cache_header or '').lower() in ['1', 'true', 'yes'], None
+
+
+def freshness(headers):
+    """
+    Seconds an upstream response may be reused according to its Cache-Control
+
+    Returns:
+        float: s-maxage or max-age minus Age; 0 for no-store, no-cache, private or no directive
+    """
+    cache_control = age = None
+    for name, value in headers.items():
+        lowered = name.lower()
+        if lowered == 'cache-control':
+            cache_control = value
+        elif lowered == 'age':
+            age = value
+
+    directives = {}
+    for part in (cache_control or '').split(','):
+        name, _, value = part.strip().partition('=')
+        directives[name.lower()] = value.strip('"')
+    if not directives.keys() & {'s-maxage', 'max-age'} or directives.keys() & {'no-store', 'no-cache', 'private'}:
+        return 0.0
+    try:
+        ttl = float(directives.get('s-maxage') or directives['max-age'])
+        ttl -= float(age or 0)
+    except ValueError:
+        return 0.0
+    return max(ttl, 0.0)
+
+
+class _Flight:
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class ResponseCache:
+    """
+    Opt-in cache of /api/proxy/request responses to GET and HEAD requests.
+
+    Entries are keyed on method, URL, query parameters, proxy type and the
+    request headers named in `vary`, and are kept for the client's TTL
+    (X-Proxy-Cache-TTL) or, failing that, as long as the upstream
+    Cache-Control allows. The memory tier is an LRU bounded by total bytes,
+    per worker. The optional disk tier (`directory`) is shared by every worker
+    on the host and survives restarts; it is trimmed back to `disk_max_bytes`
+    by a background sweep, oldest first.
+
+    Identical requests arriving while one is already on its way upstream wait
+    for it and share its response (single-flight), so a burst costs one
+    upstream round-trip.
+    """
+
+    HEADER = struct.Struct('<dq')   # expires at (epoch), body bytes
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_item_bytes=2 * 1024 * 1024, directory=None,
+                 disk_max_bytes=1024 * 1024 * 1024, vary=('Accept', 'Accept-Encoding', 'Accept-Language', 'Authorization', 'Cookie'),
+                 flight_timeout=120.0):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.vary = vary
+        self.flight_timeout = flight_timeout
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+        self._disk_written = 0
+        self._sweeping = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('RESPONSE_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_item_bytes = app.config.get('RESPONSE_CACHE_MAX_ITEM_BYTES', self.max_item_bytes)
+        self.directory = app.config.get('RESPONSE_CACHE_DIR') or None
+        self.disk_max_bytes = app.config.get('RESPONSE_CACHE_DISK_MAX_BYTES', self.disk_max_bytes)
+        vary = app.config.get('RESPONSE_CACHE_VARY', self.vary)
+        if isinstance(vary, str):
+            vary = [name.strip() for name in vary.split(',') if name.strip()]
+        self.vary = tuple(vary)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, method, url, params, headers, proxy_type, body='text', geo=None):
+        """
+        Cache key of a request: a digest of everything that can change the response
+        (`body` is make_request's body mode, which changes what "content" holds; `geo` the GeoTarget)
+        """
+        lowered = {name.lower(): value for name, value in (headers or {}).items()}
+        varying = [lowered.get(name.lower(), '') for name in self.vary]
+        material = json.dumps([method, url, sorted((params or {}).items()), proxy_type, varying, body,
+                               geo.key if geo else None])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    # Storage
+
+    def get(self, key):
+        """
+        Fresh cached (response_data, status_code) or None
+        """
+        cached = self.get_memory(key)
+        if cached is not None:
+            return cached
+
+        now = time.time()
+        entry = self._disk_get(key, now)
+        if entry is None:
+            return None
+        expires_at, payload, body_size = entry
+        self._remember(key, expires_at, payload, body_size)
+        with self._lock:
+            self.disk_hits += 1
+            self.bytes_saved += body_size
+        return self._decode(payload)
+
+    def put(self, key, result, ttl=None):
+        """
+        Store a response if it may be cached
+
+        Args:
+            key (str): From key()
+            result (tuple): (response_data, status_code) as returned by make_request
+            ttl (float, optional): Seconds to keep it; None follows the upstream Cache-Control
+        """
+        response_data, status_code = result
+        if status_code not in CACHEABLE_STATUS or 'content' not in response_data:
+            return False
+        if ttl is None:
+            ttl = freshness(response_data.get('headers') or {})
+        if ttl <= 0:
+            return False
+
+        payload = self._encode(response_data, status_code)
+        if len(payload) > self.max_item_bytes:
+            return False
+        body_size = self.body_size(response_data)
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, payload, body_size)
+        self._disk_put(key, expires_at, payload, body_size)
+        self.stores += 1
+        return True
+
+    @staticmethod
+    def body_size(response_data):
+        content = response_data.get('content') or b''
+        return len(content if isinstance(content, bytes) else content.encode())
+
+    @staticmethod
+    def _encode(response_data, status_code):
+        content = response_data.get('content')
+        if isinstance(content, bytes):
+            # Binary bodies (make_request body='bytes'/'raw') are stored base64 encoded
+            response_data = dict(response_data, content=base64.b64encode(content).decode('ascii'))
+            return json.dumps([response_data, status_code, True]).encode()
+        return json.dumps([response_data, status_code]).encode()
+
+    @staticmethod
+    def _decode(payload):
+        response_data, status_code, *binary = json.loads(payload)
+        if binary:
+            response_data['content'] = base64.b64decode(response_data['content'])
+        return response_data, status_code
+
+    def _remember(self, key, expires_at, payload, body_size):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (expires_at, payload, body_size)
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _disk_get(self, key, now):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < self.HEADER.size:
+            return None
+        expires_at, body_size = self.HEADER.unpack_from(data)
+        if expires_at <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # Mark it recently used for the sweep
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return expires_at, data[self.HEADER.size:], body_size
+
+    def _disk_put(self, key, expires_at, payload, body_size):
+        if not self.directory:
+            return
+        path = self._path(key)
+        # Written to a temporary name and renamed, so readers never see half a file
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp, 'wb') as f:
+                f.write(self.HEADER.pack(expires_at, body_size))
+                f.write(payload)
+            os.replace(temp, path)
+        except OSError as e:
+            log.error('Error writing response cache entry: %s', e)
+            return
+
+        self._disk_written += self.HEADER.size + len(payload)
+        if self._disk_written > self.disk_max_bytes // 10 and self._sweeping.acquire(blocking=False):
+            self._disk_written = 0
+            threading.Thread(target=self._sweep, name='response-cache-sweep', daemon=True).start()
+
+    def _sweep(self):
+        """
+        Remove expired files, then the least recently used ones until the tier is under 90% of its size
+        """
+        try:
+            now = time.time()
+            files = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.is_dir():
+                    continue
+                for item in os.scandir(entry.path):
+                    try:
+                        stat = item.stat()
+                        with open(item.path, 'rb') as f:
+                            expires_at, _ = self.HEADER.unpack(f.read(self.HEADER.size))
+                    except (OSError, struct.error):
+                        continue
+                    if expires_at <= now or (item.name.endswith('.tmp') and stat.st_mtime < now - 300):
+                        self._unlink(item.path)
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+            files.sort()
+            target = self.disk_max_bytes * 0.9
+            for _, size, path in files:
+                if total <= target:
+                    break
+                self._unlink(path)
+                total -= size
+        finally:
+            self._sweeping.release()
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # Single-flight
+
+    def fetch(self, key, loader, ttl=None):
+        """
+        Cached response for `key`, or the result of `loader()` (stored if cacheable).
+        Concurrent callers with the same key share one loader() call.
+
+        Returns:
+            tuple: ((response_data, status_code), 'hit', 'coalesced' or 'miss')
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached, 'hit'
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+
+        if not leader:
+            if flight.event.wait(self.flight_timeout) and flight.result is not None:
+                self._count_coalesced(flight.result)
+                return flight.result, 'coalesced'
+            return loader(), 'miss'
+
+        try:
+            flight.result = loader()
+            self.put(key, flight.result, ttl)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+        return flight.result, 'miss'
+
+    async def fetch_async(self, key, loader, ttl=None):
+        """
+        fetch() for the async engine: `loader` is a coroutine function, disk I/O runs off the event loop
+        """
+        loop = asyncio.get_running_loop()
+        cached = self.get_memory(key)
+        if cached is None and self.directory:
+            cached = await loop.run_in_executor(None, self.get, key)
+        if cached is not None:
+            return cached, 'hit'
+
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(flight), self.flight_timeout)
+            except asyncio.TimeoutError:
+                result = None
+            if result is None:
+                return await loader(), 'miss'
+            self._count_coalesced(result)
+            return result, 'coalesced'
+
+        flight = self._async_flights[key] = loop.create_future()
+        with self._lock:
+            self.misses += 1
+        result = None
+        try:
+            result = await loader()
+        finally:
+            # None sends the waiting requests upstream themselves
+            flight.set_result(result)
+            self._async_flights.pop(key, None)
+        await loop.run_in_executor(None, self.put, key, result, ttl)
+        return result, 'miss'
+
+    def _count_coalesced(self, result):
+        with self._lock:
+            self.coalesced += 1
+            self.bytes_saved += self.body_size(result[0])
+
+    def get_memory(self, key):
+        """
+        get() without the disk tier
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += entry[2]
+            payload = entry[1]
+        return self._decode(payload)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'memory_bytes': self._bytes,
+                'disk': bool(self.directory),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'bytes_saved': self.bytes_saved
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,183 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import SQLAlchemyError
+
+from proxy_manager import db
+from proxy_manager.models.api_key import ApiKey
+from proxy_manager.models.generation import Generation
+from proxy_manager.models.user import User
+from proxy_manager.services.shared import shared_state
+
+# Shared counter bumped whenever stored credentials change; workers drop their cache when it moves
+GENERATION_KEY = 'credentials:generation'
+# Row of the generation table bumped with every such change, for workers without shared state
+GENERATION_ROW = 'credentials'
+
+
+class CredentialCache:
+    """
+    Credentials that recently passed verification, so repeat API calls skip
+    the password hash (scrypt/pbkdf2, tens of milliseconds) and the database.
+
+    Entries are keyed by an HMAC of the credentials under a per-process random
+    secret, so neither passwords nor API keys are kept in memory, and expire
+    after `ttl` seconds. Only successful verifications are cached. The table is
+    an LRU of at most `max_entries`.
+
+    Any committed change to a user's password hash or to an API key clears
+    the cache. The same transaction bumps a counter row in the database, and
+    once committed a shared counter too when shared state is configured. Every
+    worker checks one of them every `sync_interval` seconds (the shared one
+    when configured, the row otherwise) and clears its cache when it moved.
+    """
+
+    def __init__(self, ttl=300.0, max_entries=10000, sync_interval=0.5):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sync_interval = sync_interval
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked_at = 0.0
+        self._engine = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.ttl = app.config.get('AUTH_CACHE_TTL', self.ttl)
+        self.max_entries = app.config.get('AUTH_CACHE_MAX', self.max_entries)
+        self.sync_interval = app.config.get('SHARED_STATE_SYNC_INTERVAL', self.sync_interval)
+        # Kept so the generation row can be read outside an app context (the ASGI app)
+        with app.app_context():
+            self._engine = db.engine
+        self._generation = None
+        self.clear()
+
+    def _digest(self, kind, parts):
+        message = '\0'.join((kind,) + parts).encode('utf-8', 'surrogateescape')
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def get(self, kind, *parts):
+        """
+        Cached verification result for the credentials, or None
+        """
+        self._check_generation()
+        digest = self._digest(kind, parts)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, value, kind, *parts, until=None):
+        """
+        Remember verified credentials
+
+        Args:
+            value: What get() returns for them (not None)
+            kind (str): Namespace, e.g. 'user' or 'api_key'
+            until (float, optional): Epoch time the credentials stop being valid, if before the TTL
+        """
+        expires_at = time.time() + self.ttl
+        if until is not None:
+            expires_at = min(expires_at, until)
+        digest = self._digest(kind, parts)
+        with self._lock:
+            self._entries[digest] = (value, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self):
+        """
+        Forget every cached credential, here and (with shared state) in every other worker
+        """
+        self.clear()
+        self.invalidations += 1
+        generation = shared_state.cursor(GENERATION_KEY, 1)
+        if generation is not None:
+            self._generation = generation + 1
+
+    def _check_generation(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.sync_interval:
+            return
+        self._checked_at = now
+        if shared_state.enabled:
+            generation = shared_state.cursor(GENERATION_KEY, 0)
+        else:
+            generation = self._stored_generation()
+        if generation is None:
+            return
+        if generation != self._generation:
+            if self._generation is not None:
+                self.clear()
+            self._generation = generation
+
+    def _stored_generation(self):
+        if self._engine is None:
+            return None
+        try:
+            with self._engine.connect() as conn:
+                return Generation.read(conn, GENERATION_ROW)
+        except SQLAlchemyError:
+            # Not migrated yet: entries still expire after the TTL
+            return None
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+credential_cache = CredentialCache()
+
+
+def _note_changes(session, flush_context, instances):
+    changed = any(isinstance(obj, (User, ApiKey)) for obj in session.deleted)
+    for obj in session.dirty:
+        if isinstance(obj, ApiKey) or (isinstance(obj, User) and inspect(obj).attrs.password_hash.history.has_changes()):
+            changed = True
+    if changed and not session.info.get('credentials_changed'):
+        session.info['credentials_changed'] = True
+        # In the same transaction, so a worker that sees the new generation also sees the change
+        Generation.bump(session.connection(), GENERATION_ROW)
+
+
+def _invalidate_on_commit(session):
+    if session.info.pop('credentials_changed', False):
+        credential_cache.invalidate()
+
+
+def _forget_on_rollback(session):
+    session.info.pop('credentials_changed', None)
+
+
+def watch_credentials(session):
+    """
+    Invalidate the credential cache after any commit that changes a password hash or an API key
+    """
+    for name, listener in [('before_flush', _note_changes), ('after_commit', _invalidate_on_commit),
+                           ('after_rollback', _forget_on_rollback)]:
+        if not event.contains(session, name, listener):
+            event.listen(session, name, listener)
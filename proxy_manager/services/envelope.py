@@ -0,0 +1,85 @@
+import json
+import struct
+
+JSON_TYPE = 'application/json'
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+FRAME_TYPE = 'application/vnd.proxy-manager.frame'
+FORMATS = ('json', 'msgpack', 'frame')
+
+_FRAME_LENGTH = struct.Struct('>I')
+
+
+def negotiate(accept_header=None, envelope_arg=None, keep_encoding=None):
+    """
+    Pick the response envelope from the `envelope` query parameter, else the Accept header
+
+    Args:
+        accept_header (str): Accept request header
+        envelope_arg (str): 'json', 'msgpack' or 'frame'
+        keep_encoding (str): X-Proxy-Keep-Encoding header: 'true' to pass the upstream body through
+                             still compressed (binary envelopes only)
+
+    Returns:
+        tuple: (format, body, from_accept) where body is how make_request reads the upstream body:
+               'text' (decoded to str), 'bytes' (decompressed bytes) or 'raw' (bytes as sent),
+               and from_accept tells whether the Accept header chose it (and so is not meant for upstream)
+
+    Raises:
+        ValueError: If the format is unknown or unavailable, or keep_encoding is asked of the JSON envelope
+    """
+    from_accept = False
+    if envelope_arg:
+        fmt = envelope_arg.lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown envelope '{envelope_arg}'. Must be one of: {', '.join(FORMATS)}")
+    else:
+        fmt = 'json'
+        for part in (accept_header or '').split(','):
+            media_type = part.split(';')[0].strip().lower()
+            if media_type in MSGPACK_TYPES:
+                fmt, from_accept = 'msgpack', True
+                break
+            if media_type == FRAME_TYPE:
+                fmt, from_accept = 'frame', True
+                break
+
+    if fmt == 'msgpack':
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            raise ValueError("The msgpack envelope needs the msgpack package (poetry install -E binary)")
+
+    keep = (keep_encoding or '').lower() in ['1', 'true', 'yes']
+    if fmt == 'json':
+        if keep:
+            raise ValueError("Compressed bodies can only be returned in the msgpack or frame envelope")
+        return fmt, 'text', from_accept
+    return fmt, 'raw' if keep else 'bytes', from_accept
+
+
+def pack(response_data, fmt):
+    """
+    Serialize a response envelope (or error) from make_request
+
+    `json` is the original envelope, with the body decoded to text. `msgpack`
+    is the same map with "content" as raw bytes. `frame` is a 4-byte big-endian
+    length, that many bytes of JSON metadata (the envelope without "content"),
+    then the body bytes untouched until the end of the response; the body is
+    never escaped or copied into the metadata.
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    if fmt == 'msgpack':
+        import msgpack
+
+        return msgpack.packb(response_data, use_bin_type=True), MSGPACK_TYPES[0]
+
+    if fmt == 'frame':
+        content = response_data.get('content') or b''
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        meta = json.dumps({k: v for k, v in response_data.items() if k != 'content'}).encode('utf-8')
+        return b''.join([_FRAME_LENGTH.pack(len(meta)), meta, content]), FRAME_TYPE
+
+    return json.dumps(response_data).encode('utf-8'), JSON_TYPE
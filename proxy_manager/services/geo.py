@@ -0,0 +1,177 @@
+import threading
+
+# Continents by ISO 3166-1 alpha-2 country code, for the 'region' fallback level
+REGIONS = {
+    'AF': 'AO BF BI BJ BW CD CF CG CI CM CV DJ DZ EG EH ER ET GA GH GM GN GQ GW KE KM LR LS LY MA MG ML MR MU MW MZ '
+          'NA NE NG RE RW SC SD SH SL SN SO SS ST SZ TD TG TN TZ UG YT ZA ZM ZW',
+    'AS': 'AE AF AM AZ BD BH BN BT CN CY GE HK ID IL IN IQ IR JO JP KG KH KP KR KW KZ LA LB LK MM MN MO MV MY NP OM '
+          'PH PK PS QA SA SG SY TH TJ TL TM TR TW UZ VN YE',
+    'EU': 'AD AL AT AX BA BE BG BY CH CZ DE DK EE ES FI FO FR GB GG GI GR HR HU IE IM IS IT JE LI LT LU LV MC MD ME '
+          'MK MT NL NO PL PT RO RS RU SE SI SJ SK SM UA VA XK',
+    'NA': 'AG AI AW BB BL BM BQ BS BZ CA CR CU CW DM DO GD GL GP GT HN HT JM KN KY LC MF MQ MS MX NI PA PM PR SV SX '
+          'TC TT US VC VG VI',
+    'SA': 'AR BO BR CL CO EC FK GF GY PE PY SR UY VE',
+    'OC': 'AS AU CK FJ FM GU KI MH MP NC NF NR NU NZ PF PG PN PW SB TK TO TV UM VU WF WS',
+    'AN': 'AQ BV GS HM TF'
+}
+COUNTRY_REGIONS = {country: region for region, countries in REGIONS.items() for country in countries.split()}
+
+LEVELS = ('city', 'country', 'region', 'any')
+DEFAULT_FALLBACK = 'city,country,region,any'
+
+
+def region_of(country_code):
+    return COUNTRY_REGIONS.get((country_code or '').upper())
+
+
+def parse_levels(value):
+    """
+    Parse a fallback order such as 'city,country,region,any'
+
+    Raises:
+        ValueError: If a level is unknown
+    """
+    levels = tuple(level.strip().lower() for level in value.split(',') if level.strip())
+    for level in levels:
+        if level not in LEVELS:
+            raise ValueError(f"Unknown geo fallback level '{level}'. Must be among: {', '.join(LEVELS)}")
+    return levels
+
+
+class GeoTarget:
+    """
+    Where a request wants its proxy: a city, country and/or region, and how far it may widen
+    """
+    __slots__ = ('country', 'city', 'region', 'levels')
+
+    def __init__(self, country=None, city=None, region=None, levels=LEVELS):
+        self.country = country.upper() if country else None
+        self.city = city.strip().lower() if city else None
+        self.region = region.upper() if region else region_of(self.country)
+        self.levels = levels
+
+    @property
+    def key(self):
+        # Stable description, e.g. for cache keys
+        return f"{self.city or ''}/{self.country or ''}/{self.region or ''}/{','.join(self.levels)}"
+
+    def describe(self, level):
+        if level == 'city':
+            return self.city.title() + (f", {self.country}" if self.country else '')
+        if level == 'country':
+            return self.country
+        if level == 'region':
+            return self.region
+        return 'any location'
+
+    def steps(self):
+        """
+        (level, country, city, region) filters to try in order, skipping levels the target doesn't name
+        """
+        for level in self.levels:
+            if level == 'city' and self.city:
+                yield level, self.country, self.city, None
+            elif level == 'country' and self.country:
+                yield level, self.country, None, None
+            elif level == 'region' and self.region:
+                yield level, None, None, self.region
+            elif level == 'any':
+                yield level, None, None, None
+
+
+def parse_geo(country=None, city=None, region=None, fallback=None, default_fallback=DEFAULT_FALLBACK):
+    """
+    Parse geo targeting from request headers or parameters
+
+    Args:
+        country (str): Two-letter country code
+        city (str): City name (matched case-insensitively, within the country if one is given)
+        region (str): Continent code (AF, AS, EU, NA, SA, OC, AN); defaults to the country's
+        fallback (str): Comma-separated fallback order, e.g. 'city,country' to never leave the country
+        default_fallback (str): Order used when `fallback` is not given (GEO_FALLBACK)
+
+    Returns:
+        GeoTarget: Or None when no location was asked for
+
+    Raises:
+        ValueError: If a value is malformed
+    """
+    if not (country or city or region):
+        return None
+    if country and (len(country) != 2 or not country.isalpha()):
+        raise ValueError("Country must be a two-letter country code")
+    if region and region.upper() not in REGIONS:
+        raise ValueError(f"Unknown region '{region}'. Must be one of: {', '.join(REGIONS)}")
+    levels = parse_levels(fallback or default_fallback)
+    if not levels:
+        raise ValueError("Geo fallback order is empty")
+    return GeoTarget(country, city, region, levels)
+
+
+def parse_geo_headers(headers, default_fallback=DEFAULT_FALLBACK):
+    """
+    parse_geo() from the X-Proxy-Country, X-Proxy-City, X-Proxy-Region and X-Proxy-Geo-Fallback headers
+    """
+    return parse_geo(headers.get('X-Proxy-Country'), headers.get('X-Proxy-City'), headers.get('X-Proxy-Region'),
+                     headers.get('X-Proxy-Geo-Fallback'), default_fallback)
+
+
+class GeoLocator:
+    """
+    Country and city of an IP address from a local MaxMind/DB-IP .mmdb file
+    (City or Country edition), used to fill in proxy locations on import.
+    Needs the geoip2 package (poetry install -E geoip).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.close()
+        self.path = app.config.get('GEOIP_DATABASE') or None
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _open(self):
+        with self._lock:
+            if self._reader is None:
+                try:
+                    import geoip2.database
+                except ImportError as e:
+                    raise RuntimeError("GEOIP_DATABASE is set but the geoip2 package is not installed "
+                                       "(poetry install -E geoip)") from e
+                self._reader = geoip2.database.Reader(self.path)
+        return self._reader
+
+    def lookup(self, ip):
+        """
+        Returns:
+            tuple: (country code, city name); either may be None
+        """
+        if not self.path:
+            return None, None
+        reader = self._open()
+        from geoip2.errors import AddressNotFoundError
+
+        try:
+            # Country-only databases have no city() lookup
+            if 'City' in reader.metadata().database_type:
+                result = reader.city(ip)
+                return result.country.iso_code, result.city.name
+            return reader.country(ip).country.iso_code, None
+        except (ValueError, AddressNotFoundError):
+            # Not an IP address (a hostname) or not in the database
+            return None, None
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+
+geo_locator = GeoLocator()
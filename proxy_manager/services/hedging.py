@@ -0,0 +1,82 @@
+import math
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """
+    Rolling window of successful upstream attempt latencies, used to time hedges
+    """
+
+    def __init__(self, size=1000, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._sorted = None
+        self._added = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._added += 1
+            # Re-sorting on every sample is wasteful; refresh every 50
+            if self._added % 50 == 0:
+                self._sorted = None
+
+    def percentile(self, p):
+        """
+        Latency at percentile p in seconds, or None until enough samples exist
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            ordered = self._sorted
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+
+latency_tracker = LatencyTracker()
+
+
+def parse_hedge(count_header, delay_header, default_delay='p95', fallback_delay_ms=1000, max_count=3):
+    """
+    Parse the X-Proxy-Hedge / X-Proxy-Hedge-Delay request headers
+
+    Args:
+        count_header (str): Number of parallel attempts, e.g. '2'
+        delay_header (str): Delay before each extra attempt, in ms ('250') or as a latency percentile ('p95')
+        default_delay (str): Delay used when the header is absent
+        fallback_delay_ms (int): Delay used for a percentile before enough latencies are recorded
+        max_count (int): Upper bound for the number of parallel attempts
+
+    Returns:
+        tuple: (count, delay_seconds)
+
+    Raises:
+        ValueError: If a header is malformed, the delay is negative or not finite, or the percentile is outside (0, 100]
+    """
+    if not count_header:
+        return 1, None
+
+    count = int(count_header)
+    if count < 1:
+        raise ValueError("X-Proxy-Hedge must be a positive integer")
+    count = min(count, max_count)
+
+    delay = (delay_header or default_delay).strip().lower()
+    if delay.startswith('p'):
+        percentile = float(delay[1:])
+        # float() also takes 'nan' and 'inf'; neither names a percentile
+        if not 0 < percentile <= 100:
+            raise ValueError("X-Proxy-Hedge-Delay percentile must be above 0 and at most 100")
+        seconds = latency_tracker.percentile(percentile)
+        if seconds is None:
+            seconds = fallback_delay_ms / 1000
+    else:
+        seconds = float(delay) / 1000
+        if not math.isfinite(seconds) or seconds < 0:
+            raise ValueError("X-Proxy-Hedge-Delay must be a non-negative number of milliseconds")
+
+    return count, seconds
@@ -0,0 +1,147 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select
+
+from proxy_manager import db
+from proxy_manager.models.proxy import Proxy
+from proxy_manager.services.geo import geo_locator
+
+
+def parse_proxy_line(line):
+    """
+    Parse one line of a provider proxy list
+
+    Supported formats (an optional http:// or https:// prefix is ignored):
+        ip:port:username:password
+        username:password@ip:port
+        ip:port
+
+    Returns:
+        tuple: (ip, port, username, password), or None if the line is malformed
+    """
+    line = line.strip()
+    for scheme in ('http://', 'https://'):
+        if line.lower().startswith(scheme):
+            line = line[len(scheme):]
+            break
+
+    username = password = ''
+    if '@' in line:
+        credentials, _, address = line.rpartition('@')
+        username, sep, password = credentials.partition(':')
+        parts = address.split(':')
+        if not sep or len(parts) != 2:
+            return None
+        ip, port = parts
+    else:
+        parts = line.split(':')
+        if len(parts) == 4:
+            ip, port, username, password = parts
+        elif len(parts) == 2:
+            ip, port = parts
+        else:
+            return None
+
+    if not ip or not port.isdigit():
+        return None
+    port = int(port)
+    if not 1 <= port <= 65535:
+        return None
+    return ip, port, username, password
+
+
+def iter_lines(content):
+    """
+    Yield text lines from a str, bytes, or a binary file-like object read incrementally
+    """
+    if isinstance(content, str):
+        yield from content.splitlines()
+        return
+    if isinstance(content, bytes):
+        yield from content.decode('utf-8', errors='replace').splitlines()
+        return
+    for raw in content:
+        yield raw.decode('utf-8', errors='replace') if isinstance(raw, bytes) else raw
+
+
+def _insert_statement():
+    # ON CONFLICT DO NOTHING where the dialect supports it, so a concurrent import can't fail the batch
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(Proxy.__table__)
+    return dialect_insert(Proxy.__table__).on_conflict_do_nothing()
+
+
+def bulk_import(content, proxy_type='datacenter', batch_size=1000):
+    """
+    Stream proxy lines into the database in batched inserts inside one transaction
+
+    Lines are parsed one at a time and de-duplicated against the (ip, port)
+    pairs already stored and earlier lines of the same upload, so memory use is
+    bounded by the key set rather than the upload. With GEOIP_DATABASE set,
+    each proxy's country and city are looked up from its IP address.
+
+    Args:
+        content (str | bytes | file): Proxy list, one proxy per line
+        proxy_type (str): Type assigned to every imported proxy
+        batch_size (int): Rows per INSERT
+
+    Returns:
+        dict: Counts of added, duplicate and malformed lines
+    """
+    counts = {'added': 0, 'duplicates': 0, 'malformed': 0}
+    seen = set(db.session.execute(select(Proxy.ip, Proxy.port)).tuples())
+    db.session.rollback()
+
+    now = datetime.now(timezone.utc)
+    stmt = _insert_statement()
+    batch = []
+
+    with db.engine.begin() as conn:
+        for line in iter_lines(content):
+            if not line.strip():
+                continue
+            parsed = parse_proxy_line(line)
+            if parsed is None:
+                counts['malformed'] += 1
+                continue
+
+            ip, port, username, password = parsed
+            if (ip, port) in seen:
+                counts['duplicates'] += 1
+                continue
+            seen.add((ip, port))
+            country_code, city_name = geo_locator.lookup(ip)
+
+            batch.append({
+                'ip': ip,
+                'port': port,
+                'username': username,
+                'password': password,
+                'proxy_type': proxy_type,
+                'country_code': country_code,
+                'city_name': city_name,
+                'is_active': True,
+                'success_count': 0,
+                'failure_count': 0,
+                'last_used': now,
+                'created_at': now
+            })
+            if len(batch) >= batch_size:
+                counts['added'] += _flush(conn, stmt, batch)
+                batch = []
+
+        if batch:
+            counts['added'] += _flush(conn, stmt, batch)
+
+    return counts
+
+
+def _flush(conn, stmt, batch):
+    result = conn.execute(stmt, batch)
+    # Rows skipped by ON CONFLICT are not counted when the driver reports it
+    return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(batch)
@@ -0,0 +1,241 @@
+import asyncio
+import ipaddress
+import threading
+import time
+
+from proxy_manager.services.ratelimit import TokenBucket
+from proxy_manager.services.shared import shared_state
+
+
+class ProxySaturated(Exception):
+    """
+    No rate token or in-flight slot could be had for a proxy before the deadline
+    """
+
+
+def parse_type_limits(value):
+    """
+    Parse a per-type limit like 'residential=50,datacenter=200' (a bare number applies to every type)
+
+    Returns:
+        dict: {proxy_type: limit}, with the catch-all under '*'
+    """
+    if isinstance(value, dict):
+        return value
+    limits = {}
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, sep, limit = part.rpartition('=')
+        limits[name.strip() if sep else '*'] = float(limit)
+    return limits
+
+
+class ProxyLimiter:
+    """
+    Rate limits and in-flight caps applied before an attempt goes out.
+
+    Limits apply at three levels: each proxy, each proxy type (one provider
+    product, e.g. residential), and each provider subnet (/24 for IPv4 by
+    default), since providers throttle and ban by address block. A limit of 0
+    is off. The per-proxy in-flight cap counts across all workers when shared
+    state is enabled; rate limits and the type and subnet caps are per worker
+    process, so set them to the provider's limit divided by the worker count.
+
+    The selector skips saturated proxies. If every candidate is saturated
+    and `queue_timeout` is set, attempts wait up to that long for a slot
+    instead of failing.
+    """
+
+    def __init__(self):
+        self.proxy_rate = 0.0
+        self.proxy_burst = None
+        self.proxy_max_inflight = 0
+        self.type_rate = {}
+        self.type_max_inflight = {}
+        self.subnet_rate = 0.0
+        self.subnet_max_inflight = 0
+        self.subnet_prefix = 24
+        self.queue_timeout = 0.0
+        self._buckets = {}
+        self._inflight = {}
+        self._subnets = {}
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.skipped = 0
+        self.queued = 0
+        self.timeouts = 0
+
+    def init_app(self, app):
+        self.proxy_rate = app.config.get('PROXY_RATE_LIMIT', self.proxy_rate)
+        self.proxy_burst = app.config.get('PROXY_RATE_BURST', self.proxy_burst)
+        self.proxy_max_inflight = app.config.get('PROXY_MAX_INFLIGHT', self.proxy_max_inflight)
+        self.type_rate = parse_type_limits(app.config.get('PROXY_TYPE_RATE_LIMIT', self.type_rate))
+        self.type_max_inflight = parse_type_limits(app.config.get('PROXY_TYPE_MAX_INFLIGHT', self.type_max_inflight))
+        self.subnet_rate = app.config.get('PROXY_SUBNET_RATE_LIMIT', self.subnet_rate)
+        self.subnet_max_inflight = app.config.get('PROXY_SUBNET_MAX_INFLIGHT', self.subnet_max_inflight)
+        self.subnet_prefix = app.config.get('PROXY_SUBNET_PREFIX', self.subnet_prefix)
+        self.queue_timeout = app.config.get('PROXY_QUEUE_TIMEOUT', self.queue_timeout)
+        self._buckets = {}
+        self._subnets = {}
+
+    @property
+    def enabled(self):
+        return bool(self.proxy_rate or self.proxy_max_inflight or self.type_rate or self.type_max_inflight
+                    or self.subnet_rate or self.subnet_max_inflight)
+
+    def subnet(self, ip):
+        subnet = self._subnets.get(ip)
+        if subnet is None:
+            try:
+                address = ipaddress.ip_address(ip)
+                prefix = self.subnet_prefix if address.version == 4 else max(self.subnet_prefix, 48)
+                subnet = str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+            except ValueError:
+                # Hostname: treat it as its own block
+                subnet = ip
+            self._subnets[ip] = subnet
+        return subnet
+
+    def _scopes(self, record):
+        """
+        (bucket key, rate, burst, local in-flight key, in-flight cap) for each level that has a limit
+        """
+        scopes = []
+        if self.proxy_rate:
+            scopes.append((('proxy', record.id), self.proxy_rate, self.proxy_burst, None, 0))
+        type_rate = self.type_rate.get(record.proxy_type, self.type_rate.get('*', 0))
+        type_cap = self.type_max_inflight.get(record.proxy_type, self.type_max_inflight.get('*', 0))
+        if type_rate or type_cap:
+            key = ('type', record.proxy_type)
+            scopes.append((key, type_rate, None, key, int(type_cap)))
+        if self.subnet_rate or self.subnet_max_inflight:
+            key = ('subnet', self.subnet(record.ip))
+            scopes.append((key, self.subnet_rate, None, key, self.subnet_max_inflight))
+        return scopes
+
+    def _bucket(self, key, rate, burst):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def available(self, record):
+        """
+        Whether an attempt through this proxy could start now (takes nothing)
+        """
+        if not self.enabled:
+            return True
+        if self.proxy_max_inflight and shared_state.inflight(record.id) >= self.proxy_max_inflight:
+            self.skipped += 1
+            return False
+        for key, rate, burst, inflight_key, cap in self._scopes(record):
+            if (cap and self._inflight.get(inflight_key, 0) >= cap) or \
+                    (rate and self._bucket(key, rate, burst).wait_time() > 0):
+                self.skipped += 1
+                return False
+        return True
+
+    def try_acquire(self, record):
+        """
+        Take a rate token at every level and an in-flight slot, all or nothing
+
+        Returns:
+            float: 0.0 if acquired, otherwise roughly how many seconds to wait before trying again
+        """
+        # In-flight slots are freed by responses, not by time: a full cap means poll
+        count = shared_state.acquire(record.id)
+        if self.proxy_max_inflight and count is not None and count > self.proxy_max_inflight:
+            wait = 0.05
+        else:
+            wait = self._take(self._scopes(record)) if self.enabled else 0.0
+        if wait:
+            shared_state.release(record.id)
+        else:
+            self.acquired += 1
+        return wait
+
+    def _take(self, scopes):
+        with self._lock:
+            wait = 0.0
+            for key, rate, burst, inflight_key, cap in scopes:
+                if cap and self._inflight.get(inflight_key, 0) >= cap:
+                    wait = max(wait, 0.05)
+                if rate:
+                    wait = max(wait, self._bucket(key, rate, burst).wait_time())
+            if wait:
+                return wait
+            for key, rate, burst, inflight_key, cap in scopes:
+                if rate:
+                    self._bucket(key, rate, burst).try_acquire()
+                if inflight_key:
+                    self._inflight[inflight_key] = self._inflight.get(inflight_key, 0) + 1
+            return 0.0
+
+    def acquire(self, record, deadline=None):
+        """
+        Take a slot for one attempt, waiting until the monotonic `deadline` if given
+
+        Raises:
+            ProxySaturated: If no slot was available in time
+        """
+        wait = self.try_acquire(record)
+        if not wait:
+            return
+        self.queued += 1
+        while wait:
+            if deadline is None or time.monotonic() + min(wait, 0.05) > deadline:
+                self.timeouts += 1
+                raise ProxySaturated(f"Proxy {record.address} is at its rate or concurrency limit")
+            time.sleep(min(wait, 0.05))
+            wait = self.try_acquire(record)
+
+    async def acquire_async(self, record, deadline=None):
+        """
+        acquire() for the async engine: waits without blocking the event loop
+        """
+        wait = self.try_acquire(record)
+        if not wait:
+            return
+        self.queued += 1
+        while wait:
+            if deadline is None or time.monotonic() + min(wait, 0.05) > deadline:
+                self.timeouts += 1
+                raise ProxySaturated(f"Proxy {record.address} is at its rate or concurrency limit")
+            await asyncio.sleep(min(wait, 0.05))
+            wait = self.try_acquire(record)
+
+    def release(self, record):
+        shared_state.release(record.id)
+        if not self.enabled:
+            return
+        with self._lock:
+            for _, _, _, inflight_key, _ in self._scopes(record):
+                if inflight_key:
+                    count = self._inflight.get(inflight_key, 0) - 1
+                    if count > 0:
+                        self._inflight[inflight_key] = count
+                    else:
+                        self._inflight.pop(inflight_key, None)
+
+    def deadline(self):
+        return time.monotonic() + self.queue_timeout if self.queue_timeout else None
+
+    def stats(self):
+        with self._lock:
+            inflight = dict(self._inflight)
+        by_type = {key[1]: n for key, n in inflight.items() if key[0] == 'type'}
+        subnets = sorted(((n, key[1]) for key, n in inflight.items() if key[0] == 'subnet'), reverse=True)
+        return {
+            'enabled': self.enabled,
+            'acquired': self.acquired,
+            'skipped': self.skipped,
+            'queued': self.queued,
+            'queue_timeouts': self.timeouts,
+            'inflight_by_type': by_type,
+            'busiest_subnets': [{'subnet': subnet, 'inflight': n} for n, subnet in subnets[:10]]
+        }
+
+
+proxy_limiter = ProxyLimiter()
@@ -0,0 +1,130 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, func, or_, select
+
+from proxy_manager import db
+from proxy_manager.models.proxy import Proxy
+
+SORT_KEYS = ('id', 'failure_rate', 'last_used', 'latency')
+HEALTH_STATES = ('healthy', 'unhealthy', 'unchecked')
+
+# Stand-ins for NULLs so every row has a comparable sort value
+NEVER_USED = datetime(1970, 1, 1, tzinfo=timezone.utc)
+UNMEASURED_MS = 1e9
+
+
+def sort_expression(sort):
+    """
+    SQL expression a listing is ordered by (ties are broken by id)
+    """
+    if sort == 'failure_rate':
+        total = Proxy.success_count + Proxy.failure_count
+        return func.coalesce(Proxy.failure_count * 100.0 / func.nullif(total, 0), 0.0)
+    if sort == 'last_used':
+        return func.coalesce(Proxy.last_used, NEVER_USED)
+    if sort == 'latency':
+        return func.coalesce(Proxy.ttfb_ms, UNMEASURED_MS)
+    return Proxy.id
+
+
+def encode_cursor(sort, order, value, last_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, order, value, last_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort, order):
+    """
+    Returns:
+        tuple: (sort value, id) of the last row of the previous page
+
+    Raises:
+        ValueError: If the cursor is malformed or was issued for a different sort
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, cursor_order, value, last_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if (cursor_sort, cursor_order) != (sort, order) or not isinstance(last_id, int):
+        raise ValueError('Cursor does not match the requested sort')
+    if sort == 'last_used':
+        value = datetime.fromisoformat(value)
+    return value, last_id
+
+
+def list_proxies(proxy_type=None, country_code=None, active=None, health=None,
+                 sort='id', order='asc', cursor=None, limit=100):
+    """
+    Get one page of proxies, filtered and sorted in the database
+
+    Pages are keyset-paginated on (sort value, id), so later pages cost the
+    same as the first and rows don't shift when proxies are added or deleted
+    between requests.
+
+    Args:
+        proxy_type (str, optional): Filter by proxy type
+        country_code (str, optional): Filter by two-letter country code
+        active (bool, optional): Filter by is_active
+        health (str, optional): 'healthy', 'unhealthy' or 'unchecked' (never health-checked)
+        sort (str): One of SORT_KEYS
+        order (str): 'asc' or 'desc'
+        cursor (str, optional): next_cursor of the previous page
+        limit (int): Page size
+
+    Returns:
+        tuple: (list of Proxy, cursor for the next page or None on the last page)
+
+    Raises:
+        ValueError: On an unknown sort, order or health state, or a bad cursor
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort '{sort}', expected one of {', '.join(SORT_KEYS)}")
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    if health is not None and health not in HEALTH_STATES:
+        raise ValueError(f"Unknown health state '{health}', expected one of {', '.join(HEALTH_STATES)}")
+
+    expr = sort_expression(sort)
+    query = select(Proxy, expr)
+    if proxy_type:
+        query = query.where(Proxy.proxy_type == proxy_type)
+    if country_code:
+        query = query.where(Proxy.country_code == country_code.upper())
+    if active is not None:
+        query = query.where(Proxy.is_active == active)
+    if health == 'healthy':
+        query = query.where(Proxy.is_healthy.is_(True))
+    elif health == 'unhealthy':
+        query = query.where(Proxy.is_healthy.is_(False))
+    elif health == 'unchecked':
+        query = query.where(Proxy.is_healthy.is_(None))
+
+    descending = order == 'desc'
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort, order)
+        if sort == 'id':
+            query = query.where(Proxy.id < last_id if descending else Proxy.id > last_id)
+        elif descending:
+            query = query.where(or_(expr < value, and_(expr == value, Proxy.id < last_id)))
+        else:
+            query = query.where(or_(expr > value, and_(expr == value, Proxy.id > last_id)))
+
+    if sort == 'id':
+        ordering = (Proxy.id.desc() if descending else Proxy.id,)
+    elif descending:
+        ordering = (expr.desc(), Proxy.id.desc())
+    else:
+        ordering = (expr, Proxy.id)
+
+    # One extra row tells us whether there is a next page without a COUNT
+    rows = db.session.execute(query.order_by(*ordering).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, value = rows[-1]
+        next_cursor = encode_cursor(sort, order, value, last.id)
+    return [proxy for proxy, _ in rows], next_cursor
@@ -0,0 +1,118 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, Summary, generate_latest, multiprocess
+)
+
+# Upstream round-trips: tens of milliseconds for datacenter proxies up to the 30 s request timeout
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Choosing proxies from the in-process pool: microseconds, unless the pool has to refresh
+SELECTION_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.25)
+
+REQUESTS = Counter(
+    'proxy_manager_requests_total', 'Forwarded requests by engine and response status class',
+    ['engine', 'status']
+)
+REQUEST_SECONDS = Histogram(
+    'proxy_manager_request_duration_seconds', 'End-to-end time of forwarded requests (until headers for streams)',
+    ['engine'], buckets=LATENCY_BUCKETS
+)
+ATTEMPT_SECONDS = Histogram(
+    'proxy_manager_attempt_duration_seconds', 'Upstream attempts until the response headers, by proxy type and outcome',
+    ['proxy_type', 'outcome'], buckets=LATENCY_BUCKETS
+)
+RETRIES = Counter(
+    'proxy_manager_retries_total', 'Attempts made after the first one of a request',
+    ['proxy_type']
+)
+FALLBACKS = Counter(
+    'proxy_manager_fallbacks_total', 'Requests sent through the other proxy type (no proxies of the requested '
+    'type: type, or all of its attempts failed: last_resort) or outside the requested location (geo)',
+    ['kind']
+)
+SELECTION_SECONDS = Histogram(
+    'proxy_manager_selection_duration_seconds', 'Time to choose the proxies for a request',
+    buckets=SELECTION_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    'proxy_manager_cache_requests_total', 'Cacheable requests by result: hit, coalesced (shared a request '
+    'already in flight) or miss',
+    ['result']
+)
+CACHE_SAVED_BYTES = Counter(
+    'proxy_manager_cache_saved_bytes_total', 'Response body bytes served without going upstream'
+)
+PROXY_ATTEMPTS = Counter(
+    'proxy_manager_proxy_attempts_total', 'Upstream attempts per proxy by outcome',
+    ['proxy', 'outcome']
+)
+PROXY_SECONDS = Summary(
+    'proxy_manager_proxy_attempt_seconds', 'Upstream attempt latency per proxy',
+    ['proxy']
+)
+
+
+class ProxyMetrics:
+    """
+    Prometheus metrics for the forwarding path.
+
+    Recording is a dictionary lookup and an in-memory add, with no I/O. Under
+    gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty directory before the
+    workers start: each process then writes its values to a memory-mapped
+    file there and /metrics adds up all workers (and the async engine, if it
+    shares the directory). Without it, /metrics reports the worker that
+    happened to answer the scrape.
+
+    Per-proxy series (`proxy` label, the proxy id) grow with the pool; turn
+    them off with METRICS_PER_PROXY=false for very large pools.
+    """
+
+    def __init__(self):
+        self.per_proxy = True
+
+    def init_app(self, app):
+        self.per_proxy = app.config.get('METRICS_PER_PROXY', self.per_proxy)
+
+    def request(self, engine, status_code, seconds):
+        REQUESTS.labels(engine, f"{status_code // 100}xx").inc()
+        REQUEST_SECONDS.labels(engine).observe(seconds)
+
+    def attempt(self, proxy_id, proxy_type, success, seconds=None):
+        outcome = 'success' if success else 'error'
+        if seconds is not None:
+            ATTEMPT_SECONDS.labels(proxy_type, outcome).observe(seconds)
+        if self.per_proxy:
+            proxy = str(proxy_id)
+            PROXY_ATTEMPTS.labels(proxy, outcome).inc()
+            if seconds is not None:
+                PROXY_SECONDS.labels(proxy).observe(seconds)
+
+    def retry(self, proxy_type):
+        RETRIES.labels(proxy_type).inc()
+
+    def fallback(self, kind):
+        FALLBACKS.labels(kind).inc()
+
+    def selection(self, seconds):
+        SELECTION_SECONDS.observe(seconds)
+
+    def cache(self, result, saved_bytes=0):
+        CACHE_REQUESTS.labels(result).inc()
+        if saved_bytes:
+            CACHE_SAVED_BYTES.inc(saved_bytes)
+
+    @staticmethod
+    def render():
+        """
+        Returns:
+            tuple: (body, content type) in the Prometheus text format
+        """
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+proxy_metrics = ProxyMetrics()
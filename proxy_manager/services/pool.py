@@ -0,0 +1,334 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import func, select
+
+from proxy_manager import db
+from proxy_manager.models.proxy import Proxy
+from proxy_manager.services.selection import proxy_selector
+from proxy_manager.services.affinity import session_affinity
+from proxy_manager.services.geo import region_of
+
+log = logging.getLogger('proxy_manager.pool')
+
+# Set while serving from an event loop (see ProxyPool.without_refresh)
+_refresh_off = contextvars.ContextVar('proxy_pool_refresh_off', default=False)
+
+
+class ProxyRecord:
+    """
+    Compact, read-only view of an active proxy row held in the in-process pool
+    """
+    __slots__ = (
+        'id', 'webshare_id', 'ip', 'port', 'username', 'password', 'proxy_type',
+        'country_code', 'city_name', 'success_count', 'failure_count',
+        'created_at', 'is_healthy', 'connect_ms', 'ttfb_ms', 'last_checked',
+        'address', 'url'
+    )
+
+    COLUMNS = (
+        Proxy.id, Proxy.webshare_id, Proxy.ip, Proxy.port, Proxy.username,
+        Proxy.password, Proxy.proxy_type, Proxy.country_code, Proxy.city_name,
+        Proxy.success_count, Proxy.failure_count, Proxy.created_at,
+        Proxy.is_healthy, Proxy.connect_ms, Proxy.ttfb_ms, Proxy.last_checked
+    )
+
+    def __init__(self, id, webshare_id, ip, port, username, password, proxy_type,
+                 country_code, city_name, success_count, failure_count, created_at,
+                 is_healthy=None, connect_ms=None, ttfb_ms=None, last_checked=None):
+        self.id = id
+        self.webshare_id = webshare_id
+        self.ip = ip
+        self.port = port
+        self.username = username
+        self.password = password
+        self.proxy_type = proxy_type or 'datacenter'
+        self.country_code = country_code
+        self.city_name = city_name
+        self.success_count = success_count or 0
+        self.failure_count = failure_count or 0
+        self.created_at = created_at
+        self.is_healthy = is_healthy
+        self.connect_ms = connect_ms
+        self.ttfb_ms = ttfb_ms
+        self.last_checked = last_checked
+        self.address = f"{ip}:{port}"
+        self.url = f"http://{username}:{password}@{ip}:{port}"
+
+    @property
+    def failure_rate(self):
+        total = self.success_count + self.failure_count
+        if total == 0:
+            return 0
+        return (self.failure_count / total) * 100
+
+    def to_dict(self):
+        """
+        Same shape as Proxy.to_dict() so API responses do not change
+        """
+        return {
+            'id': self.id,
+            'webshare_id': self.webshare_id,
+            'ip': self.ip,
+            'port': self.port,
+            'username': self.username,
+            'password': self.password,
+            'proxy_type': self.proxy_type,
+            'is_active': True,
+            'success_count': self.success_count,
+            'failure_count': self.failure_count,
+            'failure_rate': self.failure_rate,
+            'country_code': self.country_code,
+            'city_name': self.city_name,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'is_healthy': self.is_healthy,
+            'connect_ms': self.connect_ms,
+            'ttfb_ms': self.ttfb_ms,
+            'last_checked': self.last_checked.isoformat() if self.last_checked else None
+        }
+
+
+def _geo_keys(record):
+    """
+    Keys of the geo index a proxy is listed under: its country, region, and city (alone and within its country)
+    """
+    country_code = record.country_code.upper() if record.country_code else None
+    if country_code:
+        yield ('country', country_code)
+        region = region_of(country_code)
+        if region:
+            yield ('region', region)
+    if record.city_name:
+        city = record.city_name.strip().lower()
+        yield ('city', None, city)
+        if country_code:
+            yield ('city', country_code, city)
+
+
+def _by_id(record):
+    return record.id
+
+
+class _Snapshot:
+    """
+    Immutable set of indexes over the active proxies. A refresh builds a new
+    snapshot and swaps it in, so readers never see a half-built index.
+    """
+    __slots__ = ('records', 'by_id', 'by_type', 'by_geo', 'count', 'max_id', 'checked_at', 'updated_at')
+
+    def __init__(self, records, checked_at=None, updated_at=None):
+        self.checked_at = checked_at
+        self.updated_at = updated_at
+        # In id order in every worker, whatever order the rows were loaded or patched in: shared
+        # round-robin cursors rely on a position meaning the same proxy everywhere
+        self.records = tuple(sorted(records, key=_by_id))
+        self.by_id = {r.id: r for r in self.records}
+        by_type = {}
+        # (proxy type or None, geo key) -> proxies, so a targeted pick is one dict lookup like an untargeted one
+        by_geo = {}
+        for record in self.records:
+            by_type.setdefault(record.proxy_type, []).append(record)
+            for key in _geo_keys(record):
+                by_geo.setdefault((None, key), []).append(record)
+                by_geo.setdefault((record.proxy_type, key), []).append(record)
+        self.by_type = {k: tuple(v) for k, v in by_type.items()}
+        self.by_geo = {k: tuple(v) for k, v in by_geo.items()}
+        self.count = len(self.records)
+        self.max_id = max(self.by_id) if self.by_id else 0
+
+
+class ProxyPool:
+    """
+    Per-process pool of active proxies, indexed by type, country, region and city.
+
+    Picking a proxy never touches the database. The pool checks a cheap
+    (count, max id, last health check, last in-place update) watermark at most
+    every `refresh_interval` seconds, or straight away after invalidate().
+    Appended rows and rows whose `updated_at` (provider sync) or `last_checked`
+    (health check batch) moved past the watermark are patched into the current
+    snapshot; anything else reloads it.
+    """
+
+    def __init__(self, refresh_interval=5.0):
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.refresh_interval = app.config.get('PROXY_POOL_REFRESH_INTERVAL', self.refresh_interval)
+
+    def invalidate(self):
+        """
+        Mark the pool stale; the next read re-checks the database
+        """
+        self._dirty = True
+
+    def needs_refresh(self):
+        return self._snapshot is None or self._dirty or \
+            time.monotonic() - self._checked_at >= self.refresh_interval
+
+    @contextmanager
+    def without_refresh(self):
+        """
+        Serve reads inside the block from the current snapshot even when a refresh is due, so they never
+        query the database (e.g. on an event loop, which refreshes off the loop instead)
+        """
+        token = _refresh_off.set(True)
+        try:
+            yield
+        finally:
+            _refresh_off.reset(token)
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if not self.needs_refresh() or (snapshot is not None and _refresh_off.get()):
+            return snapshot
+
+        # Only one greenlet refreshes; the rest keep serving the old snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            self._refresh()
+        except Exception as e:
+            db.session.rollback()
+            log.error('Error refreshing proxy pool: %s', e)
+            if self._snapshot is None:
+                return _Snapshot([])
+        finally:
+            self._lock.release()
+        return self._snapshot
+
+    def warm(self):
+        """
+        Load the snapshot and prepare selection over the untargeted buckets (every proxy, each type)
+        now, e.g. in a preloading parent so that forked workers start with both; call inside an app context
+        """
+        snapshot = self.snapshot()
+        for candidates in (snapshot.records, *snapshot.by_type.values()):
+            proxy_selector.prepare(candidates)
+        return snapshot
+
+    def _refresh(self):
+        self._dirty = False
+        self._checked_at = time.monotonic()
+
+        active = Proxy.is_active.is_(True)
+        count, max_id, checked_at, updated_at = db.session.execute(
+            select(func.count(Proxy.id).filter(active), func.max(Proxy.id).filter(active),
+                   func.max(Proxy.last_checked).filter(active), func.max(Proxy.updated_at))
+        ).one()
+        max_id = max_id or 0
+
+        current = self._snapshot
+        if current is not None and current.count == count and current.max_id == max_id \
+                and current.checked_at == checked_at and current.updated_at == updated_at:
+            return
+
+        if current is not None and max_id >= current.max_id:
+            # Rows were appended (add/import), changed in place (sync) or health checked: load just those
+            changed = {}
+            if updated_at != current.updated_at:
+                since = Proxy.updated_at > current.updated_at if current.updated_at is not None \
+                    else Proxy.updated_at.isnot(None)
+                changed = self._load_changed(since)
+            if checked_at != current.checked_at:
+                since = Proxy.last_checked > current.checked_at if current.checked_at is not None \
+                    else Proxy.last_checked.isnot(None)
+                changed.update(self._load_changed(since))
+            new_rows = self._load(Proxy.id > current.max_id) if max_id > current.max_id else []
+            records = [r for r in current.records if r.id not in changed]
+            records += [r for r in changed.values() if r is not None]
+            records += [r for r in new_rows if r.id not in changed]
+            if len(records) == count:
+                self._swap(_Snapshot(records, checked_at, updated_at))
+                return
+
+        self._swap(_Snapshot(self._load(), checked_at, updated_at))
+
+    def _swap(self, snapshot):
+        self._snapshot = snapshot
+        proxy_selector.reset_buckets()
+        session_affinity.reset_rings()
+        # Fold any new health check results into the selection weights
+        proxy_selector.absorb_checks(snapshot.records)
+
+    @staticmethod
+    def _load(*criteria):
+        stmt = select(*ProxyRecord.COLUMNS).where(Proxy.is_active.is_(True), *criteria)
+        return [ProxyRecord(*row) for row in db.session.execute(stmt)]
+
+    @staticmethod
+    def _load_changed(*criteria):
+        # Deactivated rows map to None, so they are dropped from the snapshot
+        stmt = select(*ProxyRecord.COLUMNS, Proxy.is_active).where(*criteria)
+        return {row[0]: ProxyRecord(*row[:-1]) if row[-1] else None for row in db.session.execute(stmt)}
+
+    def get(self, proxy_id):
+        return self.snapshot().by_id.get(proxy_id)
+
+    def candidates(self, proxy_type=None, country_code=None, city=None, region=None):
+        """
+        All active proxies matching the filters, as a shared tuple (do not mutate).
+        The most specific location given wins: city (within the country, if given), country, region.
+        """
+        snapshot = self.snapshot()
+        if city:
+            key = ('city', country_code.upper() if country_code else None, city.strip().lower())
+        elif country_code:
+            key = ('country', country_code.upper())
+        elif region:
+            key = ('region', region.upper())
+        elif proxy_type:
+            return snapshot.by_type.get(proxy_type, ())
+        else:
+            return snapshot.records
+        return snapshot.by_geo.get((proxy_type, key), ())
+
+    @staticmethod
+    def bucket_key(proxy_type=None, country_code=None, city=None, region=None):
+        key = f"{proxy_type or '*'}:{(country_code or '*').upper()}"
+        if city:
+            key += f":{city.strip().lower()}"
+        elif region and not country_code:
+            key += f"@{region.upper()}"
+        return key
+
+    def locate(self, proxy_type, geo, usable=None):
+        """
+        Proxies for a geo target, widening along its fallback order until some are found
+
+        Args:
+            proxy_type (str): Proxy type, or None for any
+            geo (GeoTarget): Requested location, or None for anywhere
+            usable (callable, optional): Predicate on a proxy id; a level is only used if one of its
+                                         proxies passes it (e.g. not every proxy in the city is quarantined)
+
+        Returns:
+            tuple: (candidates, bucket key, level matched: 'city', 'country', 'region', 'any' or None if nothing matched)
+        """
+        if geo is None:
+            return self.candidates(proxy_type), self.bucket_key(proxy_type), 'any'
+        for level, country_code, city, region in geo.steps():
+            candidates = self.candidates(proxy_type, country_code, city, region)
+            if candidates and (usable is None or any(usable(r.id) for r in candidates)):
+                return candidates, self.bucket_key(proxy_type, country_code, city, region), level
+        return (), self.bucket_key(proxy_type), None
+
+    def choice(self, proxy_type=None, country_code=None, accept=None):
+        return proxy_selector.pick(self.candidates(proxy_type, country_code), accept,
+                                   self.bucket_key(proxy_type, country_code))
+
+    def sample(self, k, proxy_type=None, country_code=None, accept=None):
+        """
+        Up to k distinct proxies chosen by the selection strategy
+        """
+        return proxy_selector.select(self.candidates(proxy_type, country_code), k, accept,
+                                     self.bucket_key(proxy_type, country_code))
+
+
+proxy_pool = ProxyPool()
@@ -1,17 +1,79 @@
-import random
-from datetime import datetime, timezone
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import base64
 import warnings
+import weakref
 
-import requests
 from urllib3.exceptions import InsecureRequestWarning
 from proxy_manager.models.proxy import Proxy
+from proxy_manager.services.pool import proxy_pool
+from proxy_manager.services.importer import bulk_import
+from proxy_manager.services.usage import usage_recorder
+from proxy_manager.services.sessions import session_pool
+from proxy_manager.services.hedging import latency_tracker
+from proxy_manager.services.selection import proxy_selector
+from proxy_manager.services.breaker import classify_error, proxy_breakers
+from proxy_manager.services.limits import proxy_limiter
+from proxy_manager.services.affinity import session_affinity
+from proxy_manager.services.metrics import proxy_metrics
+from proxy_manager.log import request_log
 from proxy_manager import db
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 
 # Suppress only the specific InsecureRequestWarning, not all warnings
 warnings.filterwarnings('ignore', category=InsecureRequestWarning)
 
+# Runs hedged attempts; under gevent these threads are greenlets
+hedge_executor = ThreadPoolExecutor(max_workers=256, thread_name_prefix='hedge')
+
+class RequestPlan:
+    """
+    Proxies chosen for one forwarded request, shared by the sync and async paths
+    """
+    __slots__ = ('proxy_type', 'other_type', 'proxies', 'note', 'allow_last_resort', 'max_retries', 'session', 'geo',
+                 'last_resort_candidates')
+
+    def __init__(self, proxy_type, other_type, proxies, note, allow_last_resort, max_retries, session=None, geo=None,
+                 last_resort_candidates=None):
+        self.proxy_type = proxy_type
+        self.other_type = other_type
+        self.proxies = proxies
+        self.note = note
+        self.allow_last_resort = allow_last_resort
+        self.max_retries = max_retries
+        self.session = session
+        self.geo = geo
+        # (candidates, bucket key) of the other type, looked up with the rest of the plan so that
+        # last_resort() doesn't read the pool where it can't refresh (hedge threads, the event loop)
+        self.last_resort_candidates = last_resort_candidates
+
+    def pin(self, proxy):
+        """
+        Keep a sticky session on the proxy that just served it
+        """
+        if self.session:
+            session_affinity.pin(self.session, proxy.id)
+
+    def last_resort(self, attempt):
+        """
+        Pick one proxy of the other type once the requested type is used up
+        
+        Returns:
+            tuple: (proxy, note) or (None, None) if no last resort applies
+        """
+        if attempt < self.max_retries or not self.allow_last_resort or not self.last_resort_candidates:
+            return None, None
+        candidates, bucket = self.last_resort_candidates
+        proxy = proxy_selector.pick(candidates, proxy_breakers.allow, bucket)
+        if not proxy:
+            return None, None
+        note = f"All {self.proxy_type} proxies failed, attempting with {self.other_type} proxies as last resort"
+        request_log.info(note, extra={'event': 'last_resort', 'proxy': proxy.address})
+        proxy_metrics.fallback('last_resort')
+        return proxy, note
+
+
 class ProxyService:
     @staticmethod
     def add_proxy(ip, port, username, password, proxy_type='datacenter'):
@@ -27,58 +89,60 @@ class ProxyService:
             proxy_type=proxy_type
         )
         db.session.add(new_proxy)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Added concurrently since the check above; (ip, port) is unique
+            db.session.rollback()
+            return None
+        proxy_pool.invalidate()
         return new_proxy
 
     @staticmethod
     def import_proxies(content, proxy_type='datacenter'):
-        added = 0
-        for line in content.splitlines():
-            if not line.strip():
-                continue
-            
-            try:
-                ip, port, username, password = line.strip().split(':')
-                if ProxyService.add_proxy(ip, int(port), username, password, proxy_type):
-                    added += 1
-            except ValueError:
-                continue
+        """
+        Import a proxy list in batched inserts
         
-        return added
+        Args:
+            content (str | bytes | file): One proxy per line as ip:port:user:pass, user:pass@ip:port or ip:port.
+                                          File objects are read incrementally.
+            proxy_type (str): Type of the imported proxies
+            
+        Returns:
+            dict: Counts of added, duplicate and malformed lines
+        """
+        counts = bulk_import(content, proxy_type)
+        if counts['added']:
+            proxy_pool.invalidate()
+        return counts
 
     @staticmethod
-    def get_random_proxy(proxy_type=None):
+    def get_random_proxy(proxy_type=None, session=None, geo=None):
         """
-        Get a random active proxy of the specified type
+        Get a random active proxy of the specified type from the in-process pool,
+        or the proxy pinned to a sticky session
+        
+        Args:
+            proxy_type (str, optional): Proxy type
+            session (str, optional): Sticky session id
+            geo (GeoTarget, optional): Location to pick from, widened along its fallback order
         """
         try:
-            # Build the base query
-            query = Proxy.query.filter_by(is_active=True)
-            
-            # Filter by proxy type if specified
-            if proxy_type:
-                query = query.filter_by(proxy_type=proxy_type)
-            
-            # Count the total number of matching proxies
-            count = query.count()
-            
-            if count == 0:
-                return None
-            
-            # Get a random offset
-            random_offset = random.randint(0, count - 1)
-            
-            # Use offset to get a single random proxy
-            proxy = query.offset(random_offset).limit(1).first()
+            candidates, bucket, _ = proxy_pool.locate(proxy_type, geo, ProxyService._in_service)
+            if session:
+                proxies = session_affinity.route(session, candidates, 1, accept=proxy_breakers.allow)
+                proxy = proxies[0] if proxies else None
+                if proxy:
+                    session_affinity.pin(session, proxy.id)
+            else:
+                proxy = proxy_selector.pick(candidates, proxy_breakers.allow, bucket)
             
             if proxy:
-                # Update last_used timestamp
-                proxy.last_used = datetime.now(timezone.utc)
-                db.session.commit()
+                # Update last_used timestamp with the next usage flush
+                usage_recorder.record(proxy.id)
                 
             return proxy
         except Exception as e:
-            db.session.rollback()
             return None
 
     @staticmethod
@@ -92,10 +156,7 @@ class ProxyService:
         Returns:
             bool: True if proxies of the specified type are available, False otherwise
         """
-        try:
-            return Proxy.query.filter_by(is_active=True, proxy_type=proxy_type).count() > 0
-        except Exception as e:
-            return False
+        return len(proxy_pool.candidates(proxy_type)) > 0
 
     @staticmethod
     def get_proxies(proxy_type=None):
@@ -114,19 +175,41 @@ class ProxyService:
             db.session.rollback()
             return None
 
+    @staticmethod
+    def get_proxy_page(proxy_type=None, cursor=None, limit=100, active_only=True):
+        """
+        Get one page of proxies ordered by id, starting after a cursor
+
+        Keyset pagination: each page is an index range scan from the cursor, so
+        fetching page 500 costs the same as fetching page 1.
+
+        Args:
+            proxy_type (str, optional): Filter by proxy type
+            cursor (int, optional): Last proxy id of the previous page
+            limit (int): Page size
+            active_only (bool): Only include active proxies
+
+        Returns:
+            tuple: (list of Proxy, cursor for the next page or None on the last page)
+        """
+        query = Proxy.query
+        if active_only:
+            query = query.filter_by(is_active=True)
+        if proxy_type:
+            query = query.filter_by(proxy_type=proxy_type)
+        if cursor is not None:
+            query = query.filter(Proxy.id > cursor)
+
+        # One extra row tells us whether there is a next page without a COUNT
+        rows = query.order_by(Proxy.id).limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1].id
+        return rows, None
+
     @staticmethod
     def update_proxy_status(proxy_id, success):
-        try:
-            proxy = Proxy.query.get(proxy_id)
-            if proxy:
-                if success:
-                    proxy.success_count += 1
-                else:
-                    proxy.failure_count += 1
-                proxy.last_used = datetime.now(timezone.utc)
-                db.session.commit()
-        except Exception as e:
-            db.session.rollback()
+        usage_recorder.record(proxy_id, bool(success))
 
     @classmethod
     def get_all_proxies(cls):
@@ -152,15 +235,11 @@ class ProxyService:
                     'type': proxy.proxy_type,
                     'last_used': proxy.last_used.isoformat() if proxy.last_used else None,
                     'success_count': proxy.success_count,
-                    'failure_count': proxy.failure_count
+                    'failure_count': proxy.failure_count,
+                    'country': proxy.country_code,
+                    'city': proxy.city_name
                 }
                 
-                # Only add country if it exists as an attribute
-                if hasattr(proxy, 'country'):
-                    proxy_dict['country'] = proxy.country
-                else:
-                    proxy_dict['country'] = None
-                
                 proxies_list.append(proxy_dict)
             
             return proxies_list
@@ -191,7 +270,8 @@ class ProxyService:
         return f"http://{proxy['username']}:{proxy['password']}@{proxy['ip']}:{proxy['port']}"
     
     @classmethod
-    def record_proxy_usage(cls, proxy_id, url, method, status_code, error=None):
+    def record_proxy_usage(cls, proxy_id, url, method, status_code, error=None, latency=None, error_kind=None,
+                           proxy_type=None):
         """
         Record proxy usage for analytics
         
@@ -201,63 +281,65 @@ class ProxyService:
             method (str): HTTP method
             status_code (int): Response status code, 0 if error
             error (str, optional): Error message if request failed
+            latency (float, optional): Seconds until the response headers arrived (or the attempt failed)
+            error_kind (str, optional): Failure kind from classify_error(), drives the circuit breaker
+            proxy_type (str, optional): Type of the proxy, for the metrics. Passed in rather than read from the pool:
+                                        attempts run outside the app context, where the pool can't refresh
         """
         if proxy_id is None:
-            print("Warning: Attempted to record proxy usage without a valid proxy ID")
+            request_log.warning("Attempted to record proxy usage without a valid proxy ID")
             return
             
-        try:
-            proxy = Proxy.query.get(proxy_id)
-            if proxy:
-                if status_code > 0:
-                    proxy.success_count += 1
-                else:
-                    proxy.failure_count += 1
-                    
-                proxy.last_used = datetime.now(timezone.utc)
-                db.session.commit()
-                
-                # Add analytics logging here if needed in the future
-            else:
-                print(f"Warning: No proxy found with ID {proxy_id} when recording usage")
-                
-        except Exception as e:
-            db.session.rollback()
-            print(f"Error recording proxy usage: {str(e)}")
+        # Counters are written in batches by the usage recorder, not per request
+        usage_recorder.record(proxy_id, status_code > 0)
+        # Time to failure says nothing about how fast the proxy is
+        proxy_selector.observe(proxy_id, status_code > 0, latency if status_code > 0 else None)
+        proxy_metrics.attempt(proxy_id, proxy_type or 'unknown', 0 < status_code != 407, latency)
+        
+        if status_code == 407:
+            proxy_breakers.record_failure(proxy_id, 'auth', 'Proxy authentication required')
+        elif status_code > 0:
+            proxy_breakers.record_success(proxy_id)
+        else:
+            proxy_breakers.record_failure(proxy_id, error_kind, error)
             
+    @staticmethod
+    def _usable(proxy_id):
+        # Limits first: the breaker check may hand out the single half-open probe
+        proxy = proxy_pool.get(proxy_id)
+        return proxy is not None and proxy_limiter.available(proxy) and proxy_breakers.allow(proxy_id)
+
+    @staticmethod
+    def _in_service(proxy_id):
+        # Whether a geo level still has proxies worth trying; saturated ones count, quarantined ones don't
+        return not proxy_breakers.quarantined(proxy_id)
+
     @classmethod
-    def make_request(cls, url, method='GET', params=None, headers=None, data=None, max_retries=3, timeout=30, proxy_type=None):
+    def plan_request(cls, proxy_type=None, max_retries=3, session=None, geo=None):
         """
-        Make a request to the given URL through a proxy
+        Choose which proxies a request will try, applying the type and location fallback rules
         
         Args:
-            url (str): Target URL
-            method (str): HTTP method (default: GET)
-            params (dict): URL parameters
-            headers (dict): HTTP headers
-            data (bytes): Request body data
-            max_retries (int): Maximum number of retries
-            timeout (int): Request timeout in seconds
-            proxy_type (str): Type of proxy to use ('datacenter' or 'residential', default: 'residential')
+            proxy_type (str): Requested proxy type (default: 'residential')
+            max_retries (int): Maximum number of attempts
+            session (str, optional): Sticky session id; its pinned proxy is tried first
+            geo (GeoTarget, optional): Requested location. Within the proxy type, the search widens along
+                                       the target's fallback order (e.g. city, country, region, any)
             
         Returns:
-            tuple: (response_data, status_code)
+            tuple: (RequestPlan, None) or (None, (error_data, status_code))
         """
-        proxies = cls.get_all_proxies()
-        if not proxies:
-            return {"error": "No proxies available"}, 500
+        if not proxy_pool.candidates():
+            return None, ({"error": "No proxies available"}, 500)
 
         # If proxy_type is not specified, default to residential
         if not proxy_type:
             proxy_type = 'residential'
         
         # Select proxies of the requested type
-        requested_type_proxies = [p for p in proxies if p.get('type') == proxy_type]
+        selection_started = time.perf_counter()
+        candidates, bucket, level = proxy_pool.locate(proxy_type, geo, cls._in_service)
         other_type = 'datacenter' if proxy_type == 'residential' else 'residential'
-        other_type_proxies = [p for p in proxies if p.get('type') == other_type]
-        
-        # Determine which proxy type to use based on the request and availability
-        proxies_to_use = requested_type_proxies
         note = None
         
         # Strict mode: If user explicitly requests datacenter, only use datacenter
@@ -265,150 +347,364 @@ class ProxyService:
         
         # If no proxies of requested type, and if user didn't explicitly request datacenter proxies,
         # or if they requested residential (which is our preference anyway), we can fall back
-        if not proxies_to_use and (not explicitly_requested_datacenter or proxy_type == 'residential'):
-            proxies_to_use = other_type_proxies
-            if proxies_to_use:  # Only add a note if we're actually falling back
+        if not candidates and (not explicitly_requested_datacenter or proxy_type == 'residential'):
+            candidates, bucket, level = proxy_pool.locate(other_type, geo, cls._in_service)
+            if candidates:  # Only add a note if we're actually falling back
                 note = f"No {proxy_type} proxies available, using {other_type} proxies instead"
-                print(f"PROXY FALLBACK: {note}")
+                request_log.info(note, extra={'event': 'fallback'})
+                proxy_metrics.fallback('type')
+        
+        # Say so when the location had to be widened
+        wanted = next(geo.steps(), None) if geo else None
+        if candidates and wanted and level != wanted[0]:
+            geo_note = f"No available proxies in {geo.describe(wanted[0])}, using proxies in {geo.describe(level)}"
+            note = f"{note}; {geo_note}" if note else geo_note
+            request_log.info(geo_note, extra={'event': 'geo_fallback'})
+            proxy_metrics.fallback('geo')
         
         # If still no proxies to use, return error
-        if not proxies_to_use:
-            err_msg = f"No {proxy_type} proxies available" + (
+        if not candidates:
+            where = f" in {geo.describe(wanted[0])}" if wanted else ""
+            err_msg = f"No {proxy_type} proxies available{where}" + (
                 " and fallback to other proxy types is not enabled for this request" 
                 if explicitly_requested_datacenter else ""
             )
-            print(f"PROXY ERROR: {err_msg}")
-            return {"error": err_msg, "details": []}, 503
+            request_log.warning(err_msg, extra={'event': 'no_proxy'})
+            return None, ({"error": err_msg, "details": []}, 503)
+        
+        # Let the selection strategy pick as many distinct proxies as we can try.
+        # If the requested type is used up and this isn't a strict datacenter request,
+        # the other type gets one last-resort attempt
+        # Proxies with an open circuit breaker or at their rate/concurrency limits are skipped
+        if session:
+            # Sticky sessions only move off a quarantined proxy; a saturated one is waited on by the limiter
+            proxies_to_use = session_affinity.route(session, candidates, max_retries, accept=proxy_breakers.allow)
+        else:
+            proxies_to_use = proxy_selector.select(candidates, max_retries, accept=cls._usable, key=bucket)
+        proxy_metrics.selection(time.perf_counter() - selection_started)
+        allow_last_resort = len(candidates) <= max_retries and not explicitly_requested_datacenter
+        
+        if not proxies_to_use and proxy_limiter.enabled:
+            # Everything healthy is saturated: queue on the limits if allowed, else report it as such
+            if proxy_limiter.queue_timeout:
+                proxies_to_use = proxy_selector.select(candidates, max_retries, accept=proxy_breakers.allow, key=bucket)
+            elif not allow_last_resort and any(proxy_breakers.state(r.id) == 'closed' for r in candidates):
+                err_msg = f"All {proxy_type} proxies are at their rate or concurrency limits"
+                request_log.warning(err_msg, extra={'event': 'no_proxy'})
+                return None, ({"error": err_msg, "details": []}, 503)
+        
+        if not proxies_to_use and not allow_last_resort:
+            err_msg = f"All {proxy_type} proxies are temporarily quarantined after repeated failures"
+            request_log.warning(err_msg, extra={'event': 'no_proxy'})
+            return None, ({"error": err_msg, "details": []}, 503)
+        
+        last_resort_candidates = None
+        if allow_last_resort:
+            last_resort_candidates = proxy_pool.locate(other_type, geo, cls._in_service)[:2]
+        return RequestPlan(proxy_type, other_type, proxies_to_use, note, allow_last_resort, max_retries, session, geo,
+                           last_resort_candidates), None
+
+    @classmethod
+    def build_response(cls, proxy, status_code, headers, content, note=None):
+        """
+        Response envelope returned by /api/proxy/request
+        """
+        # Use original response format for compatibility
+        response_data = {
+            "status_code": status_code,
+            "headers": dict(headers),
+            "content": content,
+            "proxy_used": proxy.address
+        }
+        
+        # Add additional fields for enhanced functionality but maintain backward compatibility
+        response_data["proxy_type"] = proxy.proxy_type
+        
+        if note:
+            response_data["note"] = note
         
-        # Shuffle to avoid using the same proxy repeatedly
-        random.shuffle(proxies_to_use)
+        return response_data
+
+    @classmethod
+    def make_request(cls, url, method='GET', params=None, headers=None, data=None, max_retries=3, timeout=30, proxy_type=None,
+                     hedge=1, hedge_delay=None, session=None, body='text', geo=None):
+        """
+        Make a request to the given URL through a proxy
+        
+        Args:
+            url (str): Target URL
+            method (str): HTTP method (default: GET)
+            params (dict): URL parameters
+            headers (dict): HTTP headers
+            data (bytes): Request body data
+            max_retries (int): Maximum number of retries
+            timeout (int): Request timeout in seconds
+            proxy_type (str): Type of proxy to use ('datacenter' or 'residential', default: 'residential')
+            hedge (int): Number of attempts allowed in flight at once (default: 1, no hedging)
+            hedge_delay (float): Seconds to wait on an attempt before starting the next one in parallel
+            session (str, optional): Sticky session id; requests with the same id keep the same proxy
+                                     until it fails or is quarantined. Disables hedging
+            body (str): How "content" carries the upstream body: 'text' (decoded to str), 'bytes'
+                        (decompressed) or 'raw' (bytes as sent, Content-Encoding kept)
+            geo (GeoTarget, optional): Location the proxy should be in, see plan_request
+            
+        Returns:
+            tuple: (response_data, status_code)
+        """
+        plan, error = cls.plan_request(proxy_type, max_retries, session, geo)
+        if error:
+            return error
         
         attempt = 0
         errors = []
-        proxy_used = None
+        
+        # Racing several proxies would break a sticky session's affinity
+        if hedge > 1 and not plan.session:
+            result, attempt = cls._hedged_request(plan, hedge, hedge_delay or 0, errors, url, method, params, headers, data, timeout,
+                                                  body)
+            if result:
+                return result
         
         while attempt < max_retries:
             attempt += 1
-            if not proxies_to_use:
+            if not plan.proxies:
                 break
             
-            proxy = proxies_to_use.pop(0)
-            proxy_used = proxy
-            
-            proxy_url = cls.format_proxy_url(proxy)
-            
-            # Skip invalid proxies
-            if not proxy_url:
-                print(f"Skipping proxy with invalid format: {proxy.get('ip')}:{proxy.get('port')}")
-                continue
+            proxy = plan.proxies.pop(0)
                 
-            print(f"Attempt {attempt}: Using {proxy.get('type', 'unknown')} proxy {proxy.get('ip')}:{proxy.get('port')} for {method} {url}")
+            if attempt > 1:
+                proxy_metrics.retry(proxy.proxy_type)
+            request_log.info("Attempt", extra={'attempt': attempt, 'proxy': proxy.address, 'proxy_type': proxy.proxy_type,
+                                               'method': method, 'url': url})
             
             try:
-                response = requests.request(
-                    method=method,
-                    url=url,
-                    params=params,
-                    headers=headers,
-                    data=data,
-                    proxies={'http': proxy_url, 'https': proxy_url},
-                    timeout=timeout,
-                    verify=False
-                )
-                
-                # Log the response status
-                print(f"Proxy response: {response.status_code} from {proxy.get('type', 'unknown')} proxy {proxy.get('ip')}:{proxy.get('port')}")
-                
-                # Record successful proxy usage for analytics
-                cls.record_proxy_usage(proxy['id'], url, method, response.status_code)
-                
-                # Use original response format for compatibility
-                response_data = {
-                    "status_code": response.status_code,
-                    "headers": dict(response.headers),
-                    "content": response.text,
-                    "proxy_used": f"{proxy.get('ip')}:{proxy.get('port')}"
-                }
-                
-                # Add additional fields for enhanced functionality but maintain backward compatibility
-                response_data["proxy_type"] = proxy.get('type')
-                
-                if note:
-                    response_data["note"] = note
+                # Logs the outcome and records it for analytics
+                response = cls._attempt(proxy, url, method, params, headers, data, timeout, stream=body == 'raw')
+                plan.pin(proxy)
                 
+                response_data = cls._envelope(proxy, response, plan.note, body)
                 return response_data, response.status_code
                 
             except Exception as e:
-                error_message = str(e)
-                print(f"Proxy error: {error_message} with {proxy.get('type', 'unknown')} proxy {proxy.get('ip')}:{proxy.get('port')}")
-                errors.append(f"Proxy {proxy.get('ip')}:{proxy.get('port')} failed: {str(e)}")
-                
-                # Record failed proxy usage
-                cls.record_proxy_usage(proxy['id'], url, method, 0, error=error_message)
+                errors.append(f"Proxy {proxy.address} failed: {str(e)}")
         
-        # If we've exhausted the requested proxy type and it's not a strict datacenter request,
-        # try with the other proxy type as a last resort
-        if attempt >= max_retries and proxy_type and not explicitly_requested_datacenter:
-            other_type_proxies = [p for p in cls.get_all_proxies() if p.get('type') == other_type]
-            
-            if other_type_proxies and not proxies_to_use:
-                fallback_msg = f"All {proxy_type} proxies failed, attempting with {other_type} proxies as last resort"
-                print(f"PROXY LAST RESORT: {fallback_msg}")
-                
-                # Try one proxy of the other type
-                proxy = random.choice(other_type_proxies)
-                proxy_url = cls.format_proxy_url(proxy)
+        # Try with the other proxy type as a last resort
+        proxy, fallback_msg = plan.last_resort(attempt)
+        if proxy:
+            try:
+                # Limits, latency and usage accounting as for any other attempt, but no pin:
+                # a sticky session goes back to its own proxy type on the next request
+                response = cls._attempt(proxy, url, method, params, headers, data, timeout, stream=body == 'raw')
                 
-                # Skip invalid proxies
-                if not proxy_url:
-                    print(f"Skipping last resort proxy with invalid format: {proxy.get('ip')}:{proxy.get('port')}")
-                    return {
-                        "error": "All retries failed",
-                        "details": errors
-                    }, 503
+                response_data = cls._envelope(proxy, response, fallback_msg, body)
+                return response_data, response.status_code
                 
-                try:
-                    response = requests.request(
-                        method=method,
-                        url=url,
-                        params=params,
-                        headers=headers,
-                        data=data,
-                        proxies={'http': proxy_url, 'https': proxy_url},
-                        timeout=timeout,
-                        verify=False
-                    )
-                    
-                    # Log the response status
-                    print(f"Last resort proxy response: {response.status_code} from {proxy.get('type', 'unknown')} proxy {proxy.get('ip')}:{proxy.get('port')}")
-                    
-                    # Record successful proxy usage for analytics
-                    cls.record_proxy_usage(proxy['id'], url, method, response.status_code)
-                    
-                    # Use original response format for compatibility
-                    response_data = {
-                        "status_code": response.status_code,
-                        "headers": dict(response.headers),
-                        "content": response.text,
-                        "proxy_used": f"{proxy.get('ip')}:{proxy.get('port')}"
-                    }
-                    
-                    # Add additional fields but maintain backward compatibility
-                    response_data["proxy_type"] = proxy.get('type')
-                    response_data["note"] = fallback_msg
-                    
-                    return response_data, response.status_code
-                    
-                except Exception as e:
-                    error_message = str(e)
-                    print(f"Last resort proxy error: {error_message} with {proxy.get('type', 'unknown')} proxy {proxy.get('ip')}:{proxy.get('port')}")
-                    errors.append(f"Proxy {proxy.get('ip')}:{proxy.get('port')} failed: {str(e)}")
-                    
-                    # Record failed proxy usage
-                    cls.record_proxy_usage(proxy['id'], url, method, 0, error=error_message)
+            except Exception as e:
+                errors.append(f"Proxy {proxy.address} failed: {str(e)}")
         
         # If all else fails, return error in the original format
         return {
             "error": "All retries failed",
             "details": errors
-        }, 503
\ No newline at end of file
+        }, 503
+
+    @classmethod
+    def stream_request(cls, url, method='GET', params=None, headers=None, data=None, max_retries=3, timeout=30, proxy_type=None,
+                       session=None, geo=None):
+        """
+        Like make_request, but hand back the upstream response with its body unread so it can be streamed.
+        Proxies are only retried until one returns headers.
+        
+        Returns:
+            tuple: ((response, proxy, note), None) or (None, (error_data, status_code)).
+                   The caller must close the response.
+        """
+        plan, error = cls.plan_request(proxy_type, max_retries, session, geo)
+        if error:
+            return None, error
+        
+        attempt = 0
+        errors = []
+        
+        while attempt < max_retries:
+            attempt += 1
+            if not plan.proxies:
+                break
+            
+            proxy = plan.proxies.pop(0)
+            if attempt > 1:
+                proxy_metrics.retry(proxy.proxy_type)
+            request_log.info("Attempt", extra={'attempt': attempt, 'proxy': proxy.address, 'proxy_type': proxy.proxy_type,
+                                               'method': method, 'url': url, 'stream': True})
+            try:
+                response = cls._attempt(proxy, url, method, params, headers, data, timeout, stream=True)
+                plan.pin(proxy)
+                return (response, proxy, plan.note), None
+            except Exception as e:
+                errors.append(f"Proxy {proxy.address} failed: {str(e)}")
+        
+        proxy, fallback_msg = plan.last_resort(attempt)
+        if proxy:
+            try:
+                response = cls._attempt(proxy, url, method, params, headers, data, timeout, stream=True)
+                return (response, proxy, fallback_msg), None
+            except Exception as e:
+                errors.append(f"Proxy {proxy.address} failed: {str(e)}")
+        
+        return None, ({
+            "error": "All retries failed",
+            "details": errors
+        }, 503)
+
+    @classmethod
+    def _hedged_request(cls, plan, hedge, hedge_delay, errors, url, method, params, headers, data, timeout, body='text'):
+        """
+        Race up to `hedge` attempts through different proxies, starting a new one
+        every `hedge_delay` seconds (or as soon as one fails) and returning the
+        first response. Every attempt records its own outcome in the usage stats.
+        Losing attempts are dropped once their headers arrive, so their bodies
+        are never downloaded.
+        
+        Returns:
+            tuple: ((response_data, status_code) or None, attempts started)
+        """
+        pending = {}
+        started = 0
+        
+        def launch():
+            nonlocal started
+            proxy = plan.proxies.pop(0)
+            started += 1
+            request_log.info("Attempt", extra={'attempt': started, 'proxy': proxy.address, 'proxy_type': proxy.proxy_type,
+                                               'method': method, 'url': url, 'hedged': True})
+            future = hedge_executor.submit(cls._attempt, proxy, url, method, params, headers, data, timeout, True)
+            pending[future] = proxy
+        
+        launch()
+        while pending:
+            can_hedge = plan.proxies and len(pending) < hedge
+            done, _ = wait(pending, timeout=hedge_delay if can_hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            
+            winner = None
+            for future in done:
+                proxy = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors.append(f"Proxy {proxy.address} failed: {str(e)}")
+                    if plan.proxies:
+                        launch()
+                    continue
+                if winner is None:
+                    winner = (proxy, response)
+                else:
+                    response.close()
+            
+            if winner:
+                for future in pending:
+                    # Not started yet: never runs. In flight: the response is closed on arrival
+                    if not future.cancel():
+                        future.add_done_callback(cls._discard_response)
+                proxy, response = winner
+                response_data = cls._envelope(proxy, response, plan.note, body)
+                return (response_data, response.status_code), started
+        
+        return None, started
+
+    @classmethod
+    def _envelope(cls, proxy, response, note, body='text'):
+        """
+        build_response() for a requests response, reading its body the way `body` asks for
+        """
+        headers = response.headers
+        if body == 'raw':
+            try:
+                content = response.raw.read(decode_content=False)
+            finally:
+                response.close()
+        else:
+            # Closed once read, which frees a streamed attempt's limiter slot
+            try:
+                content = response.content if body == 'bytes' else response.text
+            finally:
+                response.close()
+            if body == 'bytes' and 'Content-Encoding' in headers:
+                # Decompressed: the upstream encoding and length no longer describe the body
+                headers = {k: v for k, v in headers.items() if k.lower() not in ('content-encoding', 'content-length')}
+        return cls.build_response(proxy, response.status_code, headers, content, note)
+
+    @staticmethod
+    def _discard_response(future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
+    @classmethod
+    def _attempt(cls, proxy, url, method, params, headers, data, timeout, stream=False):
+        """
+        One upstream attempt with usage and latency accounting
+        """
+        # Raises ProxySaturated, which is not the proxy's fault and isn't recorded as a failure
+        proxy_limiter.acquire(proxy, proxy_limiter.deadline())
+        started = time.monotonic()
+        response = None
+        try:
+            response = cls._send(proxy, url, method, params, headers, data, timeout, stream)
+        except Exception as e:
+            request_log.warning("Proxy error", extra={'error': str(e), 'proxy': proxy.address, 'proxy_type': proxy.proxy_type})
+            cls.record_proxy_usage(proxy.id, url, method, 0, error=str(e), error_kind=classify_error(e),
+                                   latency=time.monotonic() - started, proxy_type=proxy.proxy_type)
+            raise
+        finally:
+            if response is not None and stream:
+                # The body is still to be downloaded: the slot is held until the response is closed
+                cls._release_on_close(response, proxy)
+            else:
+                proxy_limiter.release(proxy)
+        latency = time.monotonic() - started
+        latency_tracker.add(latency)
+        request_log.info("Proxy response", extra={'status': response.status_code, 'proxy': proxy.address,
+                                                  'proxy_type': proxy.proxy_type, 'seconds': round(latency, 4)})
+        cls.record_proxy_usage(proxy.id, url, method, response.status_code, latency=latency, proxy_type=proxy.proxy_type)
+        return response
+
+    @staticmethod
+    def _release_on_close(response, proxy):
+        """
+        Free the proxy's limiter slot when the response is closed, or failing that when it is garbage collected
+        """
+        held = [proxy]
+
+        def release():
+            try:
+                record = held.pop()
+            except IndexError:
+                return
+            proxy_limiter.release(record)
+
+        close = response.close
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                release()
+
+        response.close = close_and_release
+        weakref.finalize(response, release)
+
+    @classmethod
+    def _send(cls, proxy, url, method, params, headers, data, timeout, stream=False):
+        return session_pool.get(proxy.url).request(
+            method=method,
+            url=url,
+            params=params,
+            headers=headers,
+            data=data,
+            proxies={'http': proxy.url, 'https': proxy.url},
+            timeout=timeout,
+            verify=False,
+            stream=stream
+        )
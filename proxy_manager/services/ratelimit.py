@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: `rate` tokens per second, bursts up to `capacity`
+    """
+    __slots__ = ('rate', 'capacity', '_tokens', '_updated', '_lock')
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens if available right now
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        """
+        Seconds until `tokens` would be available
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else float('inf')
+
+    def acquire(self, tokens=1, deadline=None):
+        """
+        Block until tokens are available or the monotonic `deadline` passes
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        while not self.try_acquire(tokens):
+            delay = self.wait_time(tokens)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+        return True
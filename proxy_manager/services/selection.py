@@ -0,0 +1,310 @@
+import random
+import threading
+
+from proxy_manager.services.shared import shared_state
+
+STRATEGIES = ('weighted', 'p2c', 'round_robin', 'random')
+
+
+class ProxyHealth:
+    """
+    Exponentially decayed success rate and latency EWMA for one proxy
+    """
+    __slots__ = ('success_rate', 'latency')
+
+    def __init__(self, success_rate, latency):
+        self.success_rate = success_rate
+        self.latency = latency
+
+
+class WeightedSampler:
+    """
+    Fenwick tree over proxy weights: O(log n) weighted draw and O(log n) weight update
+    """
+    __slots__ = ('records', 'index', '_weights', '_tree', '_total', '_top', '_lock')
+
+    def __init__(self, records, weights):
+        self.records = records
+        self.index = {record.id: i for i, record in enumerate(records)}
+        n = len(records)
+        self._weights = list(weights)
+        self._total = sum(self._weights)
+        # Build the tree in O(n)
+        tree = [0.0] * (n + 1)
+        for i, weight in enumerate(self._weights, 1):
+            tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._top = 1 << (n.bit_length() - 1) if n else 0
+        self._lock = threading.Lock()
+
+    def _set(self, i, weight):
+        delta = weight - self._weights[i]
+        self._weights[i] = weight
+        self._total += delta
+        i += 1
+        n = len(self._weights)
+        while i <= n:
+            self._tree[i] += delta
+            i += i & -i
+
+    def update(self, proxy_id, weight):
+        i = self.index.get(proxy_id)
+        if i is not None:
+            with self._lock:
+                self._set(i, weight)
+
+    def _draw(self):
+        target = random.random() * self._total
+        pos = 0
+        mask = self._top
+        n = len(self._weights)
+        while mask:
+            nxt = pos + mask
+            if nxt <= n and self._tree[nxt] <= target:
+                pos = nxt
+                target -= self._tree[nxt]
+            mask >>= 1
+        return min(pos, n - 1)
+
+    def sample(self, k, accept=None, max_draws=None):
+        """
+        Draw up to k distinct records, each with probability proportional to its weight
+
+        Args:
+            k (int): Number of records wanted
+            accept (callable, optional): Predicate on a record; rejected draws are skipped
+            max_draws (int, optional): Give up after this many draws (default: k + 32)
+        """
+        k = min(k, len(self.records))
+        max_draws = max_draws or k + 32
+        drawn = []
+        selected = []
+        with self._lock:
+            # Zero out drawn entries so they cannot repeat, then put the weights back
+            while len(selected) < k and len(drawn) < max_draws and self._total > 1e-12:
+                i = self._draw()
+                drawn.append((i, self._weights[i]))
+                self._set(i, 0.0)
+                record = self.records[i]
+                if accept is None or accept(record.id):
+                    selected.append(record)
+            for i, weight in drawn:
+                self._set(i, weight)
+        return selected
+
+
+class ProxySelector:
+    """
+    Picks proxies from a pool bucket using the configured strategy.
+
+    - weighted: weighted-random by decayed success rate and latency EWMA (Fenwick tree sampler)
+    - p2c: power of two choices, the healthier and less busy of two random proxies
+    - round_robin: walk each bucket in order (one cursor for all workers with shared state)
+    - random: uniform random, the original behaviour
+
+    Health is fed by observe() from every attempt outcome. Proxies start from a
+    smoothed prior built from their stored success/failure counts.
+    """
+
+    def __init__(self, strategy='weighted', decay=0.1, default_latency=1.0, min_weight=0.001):
+        self.strategy = strategy
+        self.decay = decay
+        self.default_latency = default_latency
+        self.min_weight = min_weight
+        self._health = {}
+        self._checked = {}
+        self._samplers = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        strategy = app.config.get('PROXY_SELECTION_STRATEGY', self.strategy)
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown proxy selection strategy '{strategy}', expected one of {', '.join(STRATEGIES)}")
+        self.strategy = strategy
+        self.decay = app.config.get('PROXY_HEALTH_DECAY', self.decay)
+
+    def health(self, record):
+        health = self._health.get(record.id)
+        if health is None:
+            # Laplace-smoothed prior from the stored counters, and the last health check if any
+            prior = (record.success_count + 1) / (record.success_count + record.failure_count + 2)
+            latency = self.default_latency
+            if record.is_healthy is False:
+                prior *= 0.1
+            if record.ttfb_ms:
+                latency = record.ttfb_ms / 1000
+            health = self._health[record.id] = ProxyHealth(prior, latency)
+        return health
+
+    def weight(self, record):
+        health = self.health(record)
+        return max(health.success_rate ** 2 / max(health.latency, 0.05), self.min_weight)
+
+    def observe(self, proxy_id, success, latency=None):
+        """
+        Fold one attempt outcome into the proxy's health and sampler weights
+        """
+        health = self._health.get(proxy_id)
+        if health is None:
+            health = self._health[proxy_id] = ProxyHealth(0.5, self.default_latency)
+        health.success_rate += self.decay * ((1.0 if success else 0.0) - health.success_rate)
+        if latency is not None:
+            health.latency += self.decay * (latency - health.latency)
+
+        weight = max(health.success_rate ** 2 / max(health.latency, 0.05), self.min_weight)
+        for _, sampler in list(self._samplers.values()):
+            sampler.update(proxy_id, weight)
+
+    def absorb_checks(self, records):
+        """
+        Treat health check results newer than the last ones seen as observations
+        """
+        for record in records:
+            if record.last_checked is None or self._checked.get(record.id) == record.last_checked:
+                continue
+            self._checked[record.id] = record.last_checked
+            if record.id in self._health and record.is_healthy is not None:
+                self.observe(record.id, record.is_healthy, record.ttfb_ms / 1000 if record.ttfb_ms else None)
+
+    def reset_buckets(self):
+        """
+        Forget samplers and cursors built for an old pool snapshot
+        """
+        with self._lock:
+            self._samplers = {}
+            self._cursors = {}
+
+    def prepare(self, candidates):
+        """
+        Build what the strategy keeps for a pool bucket now rather than on its first pick
+        """
+        if self.strategy == 'weighted' and candidates:
+            self._sampler(candidates)
+
+    def _sampler(self, candidates):
+        entry = self._samplers.get(id(candidates))
+        if entry is not None and entry[0] is candidates:
+            return entry[1]
+        sampler = WeightedSampler(candidates, [self.weight(r) for r in candidates])
+        with self._lock:
+            # Bounded in case buckets are built outside the pool
+            if len(self._samplers) > 256:
+                self._samplers.clear()
+            self._samplers[id(candidates)] = (candidates, sampler)
+        return sampler
+
+    def select(self, candidates, k, accept=None, key=None):
+        """
+        Choose up to k distinct proxies from a pool bucket, in the order to try them
+
+        Args:
+            candidates (tuple): Pool bucket to choose from
+            k (int): Number of proxies wanted
+            accept (callable, optional): Predicate on a proxy id, e.g. the circuit breaker check.
+                                         Rejected proxies are skipped after a bounded number of draws
+            key (str, optional): Name of the bucket, the same in every worker; used for shared cursors
+        """
+        if not candidates or k <= 0:
+            return []
+        k = min(k, len(candidates))
+        max_draws = k + 32
+
+        if self.strategy == 'weighted':
+            return self._sampler(candidates).sample(k, accept, max_draws)
+        if self.strategy == 'p2c':
+            return self._power_of_two(candidates, k, accept, max_draws)
+        if self.strategy == 'round_robin':
+            return self._round_robin(candidates, k, accept, max_draws, key)
+        return self._random(candidates, k, accept, max_draws)
+
+    def pick(self, candidates, accept=None, key=None):
+        selected = self.select(candidates, 1, accept, key)
+        return selected[0] if selected else None
+
+    def _random(self, candidates, k, accept, max_draws):
+        if accept is None:
+            return random.sample(candidates, k)
+        if len(candidates) <= max_draws:
+            draws = random.sample(candidates, len(candidates))
+        else:
+            draws = (candidates[random.randrange(len(candidates))] for _ in range(max_draws))
+        picked = []
+        seen = set()
+        for record in draws:
+            if record.id in seen:
+                continue
+            seen.add(record.id)
+            # Stop as soon as we have enough: accept() may hand out a half-open probe
+            if accept(record.id):
+                picked.append(record)
+                if len(picked) == k:
+                    break
+        return picked
+
+    def _power_of_two(self, candidates, k, accept, max_draws):
+        if len(candidates) <= k:
+            ordered = sorted(candidates, key=self.weight, reverse=True)
+            return [r for r in ordered if accept is None or accept(r.id)][:k]
+        picked = []
+        seen = set()
+        draws = 0
+        while len(picked) < k and draws < max_draws:
+            # Draw the pairs for the proxies still wanted and read all their loads in one round trip
+            pairs = [(candidates[random.randrange(len(candidates))], candidates[random.randrange(len(candidates))])
+                     for _ in range(min(k - len(picked), max_draws - draws))]
+            draws += len(pairs)
+            inflight = shared_state.inflight_many({r.id for pair in pairs for r in pair})
+            for a, b in pairs:
+                best = a if self._load_weight(a, inflight) >= self._load_weight(b, inflight) else b
+                if best.id in seen:
+                    continue
+                seen.add(best.id)
+                if accept is None or accept(best.id):
+                    picked.append(best)
+                    if len(picked) == k:
+                        break
+        return picked
+
+    def _load_weight(self, record, inflight):
+        # Spread load: a proxy busy with other requests (in any worker) counts for less
+        return self.weight(record) / (1 + inflight.get(record.id, 0))
+
+    def _round_robin(self, candidates, k, accept, max_draws, bucket=None):
+        n = len(candidates)
+        # Buckets list proxies by id in every worker, so a shared position means the same proxy
+        shared_start = shared_state.cursor(bucket, k) if bucket is not None else None
+        if shared_start is not None:
+            return self._walk(candidates, shared_start % n, k, accept, max_draws)[0]
+
+        key = id(candidates)
+        with self._lock:
+            start = self._cursors.get(key, 0) % n
+        picked, steps = self._walk(candidates, start, k, accept, max_draws)
+        with self._lock:
+            self._cursors[key] = start + steps
+            if len(self._cursors) > 256:
+                self._cursors = {key: start + steps}
+        return picked
+
+    @staticmethod
+    def _walk(candidates, start, k, accept, max_draws):
+        n = len(candidates)
+        picked = []
+        steps = 0
+        while len(picked) < k and steps < min(n, max_draws):
+            record = candidates[(start + steps) % n]
+            steps += 1
+            if accept is None or accept(record.id):
+                picked.append(record)
+        return picked, steps
+
+    def stats(self, record):
+        health = self.health(record)
+        return {'success_rate': health.success_rate, 'latency': health.latency, 'weight': self.weight(record)}
+
+
+proxy_selector = ProxySelector()
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool:
+    """
+    Bounded LRU of keep-alive requests.Session objects, one per upstream proxy.
+
+    Reusing the session for a proxy reuses its pooled connections, so repeat
+    requests skip the TCP connect to the proxy (and the CONNECT/TLS handshake
+    for the same target host). Sessions idle for longer than `idle_timeout`
+    seconds, or pushed out by `max_sessions`, are closed.
+    """
+
+    def __init__(self, max_sessions=256, pool_maxsize=10, idle_timeout=300):
+        self.max_sessions = max_sessions
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        self.max_sessions = app.config.get('PROXY_SESSION_MAX', self.max_sessions)
+        self.pool_maxsize = app.config.get('PROXY_SESSION_POOL_SIZE', self.pool_maxsize)
+        self.idle_timeout = app.config.get('PROXY_SESSION_IDLE_TIMEOUT', self.idle_timeout)
+
+    def get(self, proxy_url):
+        """
+        Get the session for a proxy URL, creating it if needed
+        """
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            entry = self._sessions.get(proxy_url)
+            if entry is not None:
+                self._sessions.move_to_end(proxy_url)
+                entry[1] = now
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            session = self._create_session(proxy_url)
+            self._sessions[proxy_url] = [session, now]
+
+            # Oldest entries sit at the front, so stop at the first fresh one
+            while self._sessions:
+                key, (old_session, last_used) = next(iter(self._sessions.items()))
+                if len(self._sessions) <= self.max_sessions and now - last_used < self.idle_timeout:
+                    break
+                del self._sessions[key]
+                evicted.append(old_session)
+            self.evictions += len(evicted)
+
+        for old_session in evicted:
+            old_session.close()
+        return session
+
+    def _create_session(self, proxy_url):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.proxies = {'http': proxy_url, 'https': proxy_url}
+        session.verify = False
+        # Skip per-request env/netrc lookups, and never carry one caller's cookies into another's request
+        session.trust_env = False
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def clear(self):
+        with self._lock:
+            sessions = [entry[0] for entry in self._sessions.values()]
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'sessions': len(self._sessions),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / total) * 100 if total else 0
+        }
+
+
+session_pool = SessionPool()
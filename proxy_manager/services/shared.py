@@ -0,0 +1,551 @@
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+log = logging.getLogger('proxy_manager.shared')
+
+
+def _key_hash(key):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') >> 1 or 1
+
+
+class RedisBackend:
+    """
+    Shared state in Redis, for any number of workers and hosts.
+
+    Breaker state is read from a copy of the Redis hashes refreshed every
+    `sync_interval` seconds, so checking a candidate proxy costs no round-trip.
+    Usage deltas from all workers are merged in Redis and written to the
+    database by whichever worker takes the flush lock. Sticky session pins are
+    plain keys that expire with the session.
+    """
+    name = 'redis'
+    shares_usage = True
+    shares_sessions = True
+
+    def __init__(self, url, prefix='proxy_manager', sync_interval=0.5, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("SHARED_STATE_URL points at Redis but the redis package is not installed "
+                                   "(poetry install -E shared)") from e
+            client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.client = client
+        self.prefix = prefix
+        self.sync_interval = sync_interval
+        self._failing = {}
+        self._open = {}
+        self._synced_at = 0.0
+        self._sync_lock = threading.Lock()
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def cursor(self, key, steps):
+        return self.client.hincrby(self._key('cursors'), key, steps) - steps
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._synced_at < self.sync_interval or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hgetall(self._key('breaker:failures'))
+            pipe.hgetall(self._key('breaker:open'))
+            failing, opened = pipe.execute()
+            self._failing = {int(k): int(v) for k, v in failing.items()}
+            self._open = {int(k): float(v) for k, v in opened.items()}
+            self._synced_at = now
+        finally:
+            self._sync_lock.release()
+
+    def failure(self, proxy_id):
+        count = self.client.hincrby(self._key('breaker:failures'), proxy_id, 1)
+        self._failing[proxy_id] = count
+        return count
+
+    def success(self, proxy_id):
+        self._sync()
+        if proxy_id not in self._failing and proxy_id not in self._open:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hdel(self._key('breaker:failures'), proxy_id)
+        pipe.hdel(self._key('breaker:open'), proxy_id)
+        pipe.execute()
+        self._failing.pop(proxy_id, None)
+        self._open.pop(proxy_id, None)
+
+    def trip(self, proxy_id, cooldown):
+        until = time.time() + cooldown
+        self.client.hset(self._key('breaker:open'), proxy_id, until)
+        self._open[proxy_id] = until
+
+    def open_until(self, proxy_id):
+        self._sync()
+        return self._open.get(proxy_id, 0.0)
+
+    def acquire(self, proxy_id):
+        # Counters expire once a proxy has been idle a while, so a worker killed
+        # mid-request can't leave a proxy looking busy forever
+        key = self._key(f"inflight:{proxy_id}")
+        pipe = self.client.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, 300)
+        return pipe.execute()[0]
+
+    def release(self, proxy_id):
+        self.client.decr(self._key(f"inflight:{proxy_id}"))
+
+    def inflight(self, proxy_id):
+        return max(0, int(self.client.get(self._key(f"inflight:{proxy_id}")) or 0))
+
+    def inflight_many(self, proxy_ids):
+        values = self.client.mget([self._key(f"inflight:{proxy_id}") for proxy_id in proxy_ids])
+        return {proxy_id: max(0, int(value or 0)) for proxy_id, value in zip(proxy_ids, values)}
+
+    def push_usage(self, pending):
+        key = self._key('usage')
+        pipe = self.client.pipeline(transaction=False)
+        for proxy_id, (successes, failures, last_used) in pending.items():
+            if successes:
+                pipe.hincrby(key, f"{proxy_id}:s", successes)
+            if failures:
+                pipe.hincrby(key, f"{proxy_id}:f", failures)
+            # Last writer wins; pushes are at most a flush interval apart
+            pipe.hset(key, f"{proxy_id}:t", last_used.timestamp())
+        pipe.execute()
+        return True
+
+    def drain_usage(self, lock_seconds, force=False):
+        # One worker per interval writes the merged deltas; the lock just expires
+        if not force and not self.client.set(self._key('usage:lock'), os.getpid(), nx=True, px=max(int(lock_seconds * 1000), 100)):
+            return {}
+        draining = self._key(f"usage:{uuid.uuid4().hex}")
+        try:
+            self.client.rename(self._key('usage'), draining)
+        except Exception:
+            # Nothing pending (RENAME fails on a missing key)
+            return {}
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hgetall(draining)
+        pipe.delete(draining)
+        fields = pipe.execute()[0]
+
+        pending = {}
+        for field, value in fields.items():
+            proxy_id, _, kind = field.decode().partition(':')
+            entry = pending.setdefault(int(proxy_id), [0, 0, None])
+            if kind == 's':
+                entry[0] = int(value)
+            elif kind == 'f':
+                entry[1] = int(value)
+            else:
+                entry[2] = datetime.fromtimestamp(float(value), timezone.utc)
+        now = datetime.now(timezone.utc)
+        for entry in pending.values():
+            entry[2] = entry[2] or now
+        return pending
+
+    def pinned(self, key_hash):
+        value = self.client.get(self._key(f"session:{key_hash:x}"))
+        return int(value) if value else 0
+
+    def pin(self, key_hash, proxy_id, ttl):
+        # SET ... GET (Redis 6.2+) reports the proxy it replaces in the same round-trip
+        previous = self.client.set(self._key(f"session:{key_hash:x}"), proxy_id, ex=max(int(ttl), 1), get=True)
+        return int(previous) if previous else 0
+
+
+class MemoryBackend:
+    """
+    Shared state in a memory-mapped file, for workers on one host without Redis.
+
+    The file holds a fixed-size open-addressing table of per-proxy slots
+    (consecutive failures, in-flight count, quarantine deadline) and a small
+    table of round-robin cursors. Like the Redis counters, an in-flight count
+    not raised for INFLIGHT_TTL seconds is ignored, so a worker killed
+    mid-request can't leave a proxy looking busy; the file outlives restarts,
+    so the gunicorn master also clears the counts when it starts. Access is serialised with flock; every
+    operation is a few microseconds. Usage deltas are not shared: each worker
+    keeps writing its own, which the atomic UPDATEs already make safe. Sticky
+    session pins stay per worker too (the hash ring already agrees between workers).
+    """
+    name = 'memory'
+    shares_usage = False
+    shares_sessions = False
+
+    MAGIC = b'PMSTATE2'
+    HEADER = struct.Struct('<8sqq')
+    SLOT = struct.Struct('<qqqdd')     # proxy id + 1, failures, in flight, open until, in flight raised at (epoch)
+    CURSOR = struct.Struct('<qq')      # key hash, position
+
+    # Give up on a slot after this many probes, so a full table stays cheap
+    MAX_PROBES = 64
+    # Seconds an in-flight count lasts without a new request (the Redis counters' EXPIRE)
+    INFLIGHT_TTL = 300
+
+    def __init__(self, path, slots=262144, cursors=4096):
+        self.path = path
+        self.slots = slots
+        self.cursors = cursors
+        self.size = self.HEADER.size + slots * self.SLOT.size + cursors * self.CURSOR.size
+        self._cursor_base = self.HEADER.size + slots * self.SLOT.size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._map = None
+
+    def _open(self):
+        import fcntl
+
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        # Re-opened after fork: flock only excludes separate open file descriptions
+        self._file = open(self.path, 'a+b')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._file.fileno()).st_size != self.size:
+                self._file.truncate(0)
+                self._file.truncate(self.size)
+            self._map = mmap.mmap(self._file.fileno(), self.size)
+            magic, slots, cursors = self.HEADER.unpack_from(self._map, 0)
+            if (magic, slots, cursors) != (self.MAGIC, self.slots, self.cursors):
+                self._map[:] = bytes(self.size)
+                self.HEADER.pack_into(self._map, 0, self.MAGIC, self.slots, self.cursors)
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._pid = os.getpid()
+
+    def _locked(self, fn, *args):
+        import fcntl
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                return fn(*args)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _slot(self, proxy_id, create):
+        # Linear probing; returns the slot offset, or None if absent (or the table is full)
+        key = proxy_id + 1
+        base = self.HEADER.size
+        i = proxy_id % self.slots
+        for _ in range(self.MAX_PROBES):
+            offset = base + i * self.SLOT.size
+            stored = struct.unpack_from('<q', self._map, offset)[0]
+            if stored == key:
+                return offset
+            if stored == 0:
+                if not create:
+                    return None
+                self.SLOT.pack_into(self._map, offset, key, 0, 0, 0.0, 0.0)
+                return offset
+            i = (i + 1) % self.slots
+        return None
+
+    def _update(self, proxy_id, failures=None, inflight=None, open_until=None, create=True):
+        offset = self._slot(proxy_id, create)
+        if offset is None:
+            return None
+        key, f, n, until, raised_at = self.SLOT.unpack_from(self._map, offset)
+        now = time.time()
+        if now - raised_at > self.INFLIGHT_TTL:
+            n = 0
+        f = f + failures if failures is not None else f
+        if inflight is not None:
+            n = max(0, n + inflight)
+            if inflight > 0:
+                raised_at = now
+        until = open_until if open_until is not None else until
+        self.SLOT.pack_into(self._map, offset, key, f, n, until, raised_at)
+        return f, n, until
+
+    def _read(self, proxy_id):
+        offset = self._slot(proxy_id, False)
+        if offset is None:
+            return 0, 0, 0.0
+        _, f, n, until, raised_at = self.SLOT.unpack_from(self._map, offset)
+        return f, n if time.time() - raised_at <= self.INFLIGHT_TTL else 0, until
+
+    def cursor(self, key, steps):
+        def advance():
+            h = _key_hash(key)
+            i = h % self.cursors
+            for _ in range(self.MAX_PROBES):
+                offset = self._cursor_base + i * self.CURSOR.size
+                stored, position = self.CURSOR.unpack_from(self._map, offset)
+                if stored in (0, h):
+                    self.CURSOR.pack_into(self._map, offset, h, position + steps)
+                    return position
+                i = (i + 1) % self.cursors
+            return None
+        return self._locked(advance)
+
+    def failure(self, proxy_id):
+        result = self._locked(self._update, proxy_id, 1)
+        return result[0] if result else 0
+
+    def success(self, proxy_id):
+        def reset():
+            offset = self._slot(proxy_id, False)
+            if offset is None:
+                return
+            key, failures, inflight, until, raised_at = self.SLOT.unpack_from(self._map, offset)
+            if failures or until:
+                self.SLOT.pack_into(self._map, offset, key, 0, inflight, 0.0, raised_at)
+        self._locked(reset)
+
+    def trip(self, proxy_id, cooldown):
+        self._locked(self._update, proxy_id, None, None, time.time() + cooldown)
+
+    def open_until(self, proxy_id):
+        return self._locked(self._read, proxy_id)[2]
+
+    def acquire(self, proxy_id):
+        result = self._locked(self._update, proxy_id, None, 1)
+        return result[1] if result else 0
+
+    def release(self, proxy_id):
+        self._locked(self._update, proxy_id, None, -1, None, False)
+
+    def inflight(self, proxy_id):
+        return self._locked(self._read, proxy_id)[1]
+
+    def inflight_many(self, proxy_ids):
+        return self._locked(lambda: {proxy_id: self._read(proxy_id)[1] for proxy_id in proxy_ids})
+
+    def reset_inflight(self):
+        def reset():
+            for i in range(self.slots):
+                offset = self.HEADER.size + i * self.SLOT.size
+                key, failures, inflight, until, raised_at = self.SLOT.unpack_from(self._map, offset)
+                if inflight:
+                    self.SLOT.pack_into(self._map, offset, key, failures, 0, until, raised_at)
+        self._locked(reset)
+
+
+class SharedState:
+    """
+    Selection state shared by all gunicorn workers: round-robin cursors,
+    circuit breaker failures and quarantine, and in-flight request counts
+    (plus usage deltas and sticky session pins on Redis).
+
+    SHARED_STATE_URL selects the backend:
+        redis://host:6379/0    Redis (redis package required)
+        memory://              memory-mapped file in /dev/shm (single host)
+        memory:///path/file    memory-mapped file at the given path
+        (empty)                off: every worker keeps its own state, as before
+
+    The shared state is advisory. If the backend fails, callers get the
+    neutral answer (unknown quarantine, no failures, no cursor) and requests
+    keep flowing on per-worker state.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.errors = 0
+        self.retry_after = 5.0
+        self._retry_at = 0.0
+        self._last_warning = 0.0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        url = app.config.get('SHARED_STATE_URL')
+        prefix = app.config.get('SHARED_STATE_PREFIX', 'proxy_manager')
+        if not url:
+            self.backend = None
+        elif url.startswith(('redis://', 'rediss://', 'unix://')):
+            self.backend = RedisBackend(url, prefix, app.config.get('SHARED_STATE_SYNC_INTERVAL', 0.5))
+        elif url.startswith('memory://'):
+            path = url[len('memory://'):]
+            if not path:
+                shm = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+                path = os.path.join(shm, f"{prefix}.state")
+            self.backend = MemoryBackend(path)
+        else:
+            raise ValueError(f"Unsupported SHARED_STATE_URL '{url}', expected redis://... or memory://...")
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    @property
+    def shares_usage(self):
+        return self.backend is not None and self.backend.shares_usage
+
+    @property
+    def shares_sessions(self):
+        return self.backend is not None and self.backend.shares_sessions
+
+    def _call(self, method, default, *args):
+        if self.backend is None:
+            return default
+        # After a failure, don't pay a connect timeout on every call; retry in a few seconds
+        if self._retry_at and time.monotonic() < self._retry_at:
+            return default
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            self.errors += 1
+            now = time.monotonic()
+            self._retry_at = now + self.retry_after
+            if now - self._last_warning > 60:
+                self._last_warning = now
+                log.warning('Shared state unavailable, using per-worker state: %s', e)
+            return default
+
+    def cursor(self, key, steps):
+        """
+        Reserve `steps` positions of a shared round-robin cursor
+
+        Returns:
+            int: First reserved position, or None when the cursor is not shared
+        """
+        return self._call('cursor', None, key, steps)
+
+    def failure(self, proxy_id):
+        """
+        Count a proxy-side failure
+
+        Returns:
+            int: Consecutive failures across all workers (0 when not shared)
+        """
+        return self._call('failure', 0, proxy_id)
+
+    def success(self, proxy_id):
+        self._call('success', None, proxy_id)
+
+    def trip(self, proxy_id, cooldown):
+        self._call('trip', None, proxy_id, cooldown)
+
+    def open_until(self, proxy_id):
+        """
+        End of the quarantine set by any worker. It stays set after the cooldown ran out and is only
+        cleared by success(), so an expired deadline means "probe it", not "it recovered"
+
+        Returns:
+            float: Epoch seconds, 0.0 if not quarantined (or cleared), or None when not shared (or the backend is unavailable)
+        """
+        return self._call('open_until', None, proxy_id)
+
+    def acquire(self, proxy_id):
+        """
+        Count a request starting through a proxy
+
+        Returns:
+            int: Requests now in flight through it, or None if the backend is unavailable
+        """
+        if self.backend is None:
+            with self._lock:
+                count = self._inflight[proxy_id] = self._inflight.get(proxy_id, 0) + 1
+            return count
+        return self._call('acquire', None, proxy_id)
+
+    def release(self, proxy_id):
+        if self.backend is None:
+            with self._lock:
+                count = self._inflight.get(proxy_id, 0) - 1
+                if count > 0:
+                    self._inflight[proxy_id] = count
+                else:
+                    self._inflight.pop(proxy_id, None)
+            return
+        self._call('release', None, proxy_id)
+
+    def inflight(self, proxy_id):
+        """
+        Requests currently going through a proxy, across workers when shared
+        """
+        if self.backend is None:
+            return self._inflight.get(proxy_id, 0)
+        return self._call('inflight', 0, proxy_id)
+
+    def inflight_many(self, proxy_ids):
+        """
+        inflight() for several proxies in one round trip
+
+        Returns:
+            dict: Proxy id -> requests in flight; missing ids (the backend failed) count as 0
+        """
+        proxy_ids = list(proxy_ids)
+        if self.backend is None:
+            return {proxy_id: self._inflight.get(proxy_id, 0) for proxy_id in proxy_ids}
+        return self._call('inflight_many', {}, proxy_ids)
+
+    def reset_inflight(self):
+        """
+        Zero the in-flight counts of the memory backend, e.g. when the gunicorn master starts; counts left
+        by workers of a previous run would otherwise hold proxies at their limits. Redis counters expire instead.
+        """
+        if isinstance(self.backend, MemoryBackend):
+            self._call('reset_inflight', None)
+
+    def push_usage(self, pending):
+        """
+        Add usage deltas to the shared totals
+
+        Returns:
+            bool: False if usage is not shared (or the push failed) and the caller should write it itself
+        """
+        if not self.shares_usage:
+            return False
+        return self._call('push_usage', False, pending)
+
+    def drain_usage(self, lock_seconds, force=False):
+        """
+        Take the merged usage deltas of all workers if no other worker has in the last `lock_seconds`
+
+        Args:
+            lock_seconds (float): Flush turn length
+            force (bool): Take them regardless of whose turn it is, e.g. when the worker exits
+
+        Returns:
+            dict: {proxy_id: [successes, failures, last_used]}, empty if there is nothing for this worker to write
+        """
+        return self._call('drain_usage', {}, lock_seconds, force)
+
+    def pinned(self, key_hash):
+        """
+        Proxy a sticky session was pinned to by any worker
+
+        Returns:
+            int: Proxy id, 0 if the session has no pin, or None when pins are not shared (or the backend is unavailable)
+        """
+        if not self.shares_sessions:
+            return None
+        return self._call('pinned', None, key_hash)
+
+    def pin(self, key_hash, proxy_id, ttl):
+        """
+        Pin a sticky session to a proxy for `ttl` seconds
+
+        Returns:
+            int: Proxy id it was pinned to before (0 if none), or None if pins are not shared
+                 (or the write failed) and the caller should keep it itself
+        """
+        if not self.shares_sessions:
+            return None
+        return self._call('pin', None, key_hash, proxy_id, ttl)
+
+    def stats(self):
+        return {
+            'backend': self.backend.name if self.backend else 'local',
+            'errors': self.errors
+        }
+
+
+shared_state = SharedState()
@@ -0,0 +1,162 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, update
+
+from proxy_manager import db
+from proxy_manager.models.proxy import Proxy
+from proxy_manager.services.shared import shared_state
+
+log = logging.getLogger('proxy_manager.usage')
+
+
+class UsageRecorder:
+    """
+    Write-behind accumulator for proxy usage counters.
+
+    Success/failure deltas and the latest last_used per proxy are kept in
+    memory and written as one executemany UPDATE every `flush_interval`
+    seconds, or sooner once `flush_threshold` events are pending. Pending
+    deltas are flushed when the worker exits, so the counters on Proxy are
+    eventually consistent rather than exact at every instant.
+
+    With Redis shared state, workers push their deltas to Redis instead and
+    one worker per interval writes everyone's in a single UPDATE.
+    """
+
+    def __init__(self, flush_interval=2.0, flush_threshold=500):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.app = None
+        self._pending = {}
+        self._events = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get('USAGE_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_threshold = app.config.get('USAGE_FLUSH_THRESHOLD', self.flush_threshold)
+        atexit.register(self.flush, final=True)
+
+    def record(self, proxy_id, success=None, when=None):
+        """
+        Queue a usage event.
+
+        Args:
+            proxy_id (int): ID of the proxy used
+            success (bool, optional): True/False to bump a counter, None to only touch last_used
+            when (datetime, optional): Time of use, defaults to now
+        """
+        when = when or datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._pending.get(proxy_id)
+            if entry is None:
+                entry = self._pending[proxy_id] = [0, 0, when]
+            if success is True:
+                entry[0] += 1
+            elif success is False:
+                entry[1] += 1
+            if when > entry[2]:
+                entry[2] = when
+            self._events += 1
+            due = self._events >= self.flush_threshold
+
+        self._ensure_thread()
+        if due:
+            self._wake.set()
+
+    def flush(self, final=False):
+        """
+        Write all pending deltas in a single transaction
+
+        Args:
+            final (bool): Worker is exiting; with shared usage, write whatever is pending in Redis now
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._events = 0
+        shared = shared_state.shares_usage
+        if self.app is None or not (pending or (final and shared)):
+            return 0
+
+        if shared and (not pending or shared_state.push_usage(pending)):
+            # Merged with the other workers' deltas; written by whichever worker has the flush turn
+            pending = shared_state.drain_usage(self.flush_interval, final)
+        if not pending:
+            return 0
+
+        # Increments are applied in SQL (col = col + n), so workers never overwrite each
+        # other's counts. Updating rows in id order makes every worker take row locks in
+        # the same order, so concurrent flushes can't deadlock on PostgreSQL.
+        rows = [
+            {'pid': proxy_id, 'successes': s, 'failures': f, 'last_used': last_used}
+            for proxy_id, (s, f, last_used) in sorted(pending.items())
+        ]
+        table = Proxy.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('pid'))
+            .values(
+                success_count=table.c.success_count + bindparam('successes'),
+                failure_count=table.c.failure_count + bindparam('failures'),
+                last_used=bindparam('last_used'),
+            )
+        )
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(stmt, rows)
+        except Exception as e:
+            log.error('Error flushing proxy usage: %s', e)
+            self._requeue(pending)
+            return 0
+
+        self.flushes += 1
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def _requeue(self, pending):
+        with self._lock:
+            for proxy_id, (s, f, last_used) in pending.items():
+                entry = self._pending.setdefault(proxy_id, [0, 0, last_used])
+                entry[0] += s
+                entry[1] += f
+                if last_used > entry[2]:
+                    entry[2] = last_used
+
+    def _ensure_thread(self):
+        # Started lazily so a forked worker gets its own flusher
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='usage-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending_proxies': pending,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written
+        }
+
+
+usage_recorder = UsageRecorder()
@@ -0,0 +1,306 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import IntegrityError
+
+from proxy_manager import db
+from proxy_manager.models.proxy import Proxy
+from proxy_manager.services.importer import _insert_statement
+from proxy_manager.services.pool import proxy_pool
+
+# Columns the provider owns; a difference in any of them is an update
+SYNCED_FIELDS = ('ip', 'port', 'username', 'password', 'country_code', 'city_name', 'is_active')
+
+
+class WebshareClient:
+    """
+    Pages through the Webshare proxy list (GET {api_url}proxy/list/)
+
+    The first page gives the total count; the remaining pages are fetched
+    `concurrency` at a time and yielded in order.
+    """
+
+    def __init__(self, api_key, api_url='https://proxy.webshare.io/api/v2/', mode='direct', page_size=100,
+                 concurrency=4, timeout=30.0, retries=3):
+        self.api_url = api_url if api_url.endswith('/') else api_url + '/'
+        self.mode = mode
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Token {api_key}"
+
+    def page(self, number):
+        """
+        Returns:
+            dict: {"count": total, "next": url or null, "results": [proxy, ...]}
+
+        Raises:
+            requests.RequestException: If the page can't be fetched after `retries` attempts
+        """
+        params = {'mode': self.mode, 'page': number, 'page_size': self.page_size}
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(self.api_url + 'proxy/list/', params=params, timeout=self.timeout)
+                # Rate limited or a server error: back off and retry; anything else is final
+                if response.status_code != 429 and response.status_code < 500 or attempt == self.retries:
+                    response.raise_for_status()
+                    return response.json()
+                delay = float(response.headers.get('Retry-After') or 2 ** attempt)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                delay = 2 ** attempt
+            time.sleep(min(delay, 30))
+
+    def proxies(self):
+        """
+        Yield every proxy in the list, as returned by the API
+        """
+        first = self.page(1)
+        yield from first.get('results') or []
+        if not first.get('next'):
+            return
+        pages = -(-int(first.get('count') or 0) // self.page_size)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='webshare') as executor:
+            for page in executor.map(self.page, range(2, pages + 1)):
+                yield from page.get('results') or []
+
+
+def parse_webshare_proxy(item):
+    """
+    Proxy columns from one Webshare list entry
+
+    Returns:
+        dict: The SYNCED_FIELDS plus webshare_id, or None for entries without an address (backbone mode)
+    """
+    webshare_id, ip, port = item.get('id'), item.get('proxy_address'), item.get('port')
+    if not webshare_id or not ip or not port:
+        return None
+    country_code = item.get('country_code')
+    return {
+        'webshare_id': str(webshare_id),
+        'ip': ip,
+        'port': int(port),
+        'username': item.get('username') or '',
+        'password': item.get('password') or '',
+        'country_code': country_code.upper() if country_code else None,
+        'city_name': item.get('city_name') or None,
+        # Webshare marks proxies that failed its own checks as not valid
+        'is_active': item.get('valid', True) is not False
+    }
+
+
+class WebshareSync:
+    """
+    Incremental sync of the Webshare proxy list into the proxy table.
+
+    Rows are matched on `webshare_id`. Only differences are written: new
+    proxies are inserted, proxies whose address, credentials, location or
+    validity changed are updated, and proxies no longer listed are
+    deactivated, each in batched statements of `batch_size` rows with one
+    transaction per batch. Deactivation only happens after the whole list was
+    read, so a failed sync never disables proxies it didn't get to see. A
+    listed proxy whose address matches a row imported by hand takes that row
+    over instead of being inserted twice, and so does one that got the
+    address of a proxy no longer listed (Webshare reuses them under new ids).
+
+    Changed rows get a new `updated_at`, from which every worker's pool
+    patches in just those rows (see ProxyPool). Each committed batch gets a
+    later stamp than the one before, so a pool that refreshed between two
+    batches still finds the second past its watermark.
+    """
+
+    def __init__(self, api_key=None, api_url='https://proxy.webshare.io/api/v2/', mode='direct', page_size=100,
+                 concurrency=4, proxy_type='datacenter', batch_size=1000):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.mode = mode
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.proxy_type = proxy_type
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._last_stamp = None
+        self.last_result = None
+
+    def init_app(self, app):
+        self.api_key = app.config.get('WEBSHARE_API_KEY') or None
+        self.api_url = app.config.get('WEBSHARE_API_URL', self.api_url)
+        self.mode = app.config.get('WEBSHARE_MODE', self.mode)
+        self.page_size = app.config.get('WEBSHARE_PAGE_SIZE', self.page_size)
+        self.concurrency = app.config.get('WEBSHARE_CONCURRENCY', self.concurrency)
+        self.proxy_type = app.config.get('WEBSHARE_PROXY_TYPE', self.proxy_type)
+        self.batch_size = app.config.get('WEBSHARE_SYNC_BATCH', self.batch_size)
+
+    @property
+    def enabled(self):
+        return bool(self.api_key)
+
+    def client(self):
+        return WebshareClient(self.api_key, self.api_url, self.mode, self.page_size, self.concurrency)
+
+    def sync(self, client=None):
+        """
+        Bring the proxy table in line with the provider's list; call inside an app context
+
+        Returns:
+            dict: Counts of fetched, added, updated, deactivated, unchanged, skipped (no address or
+                  duplicate id) and conflicting (address already taken) proxies, and the elapsed seconds
+
+        Raises:
+            RuntimeError: If no API key is configured
+            requests.RequestException: If the list can't be read; nothing is deactivated then
+        """
+        if client is None:
+            if not self.enabled:
+                raise RuntimeError("WEBSHARE_API_KEY is not set")
+            client = self.client()
+
+        with self._lock:
+            started = time.monotonic()
+            result = self._sync(client)
+            result['elapsed'] = round(time.monotonic() - started, 3)
+            self.last_result = result
+            return result
+
+    def _sync(self, client):
+        existing = {
+            row[0]: row[1:]
+            for row in db.session.execute(select(Proxy.webshare_id, Proxy.id, *(getattr(Proxy, f) for f in SYNCED_FIELDS))
+                                          .where(Proxy.webshare_id.isnot(None)))
+        }
+        # Rows imported from a text list; a listed proxy at the same address adopts its row
+        unclaimed = {
+            (ip, port): proxy_id
+            for proxy_id, ip, port in db.session.execute(select(Proxy.id, Proxy.ip, Proxy.port)
+                                                         .where(Proxy.webshare_id.is_(None)))
+        }
+        db.session.rollback()
+        # Addresses of synced rows; whether a new id may take one over is only known once the list was read
+        held = {(current[1], current[2]): webshare_id for webshare_id, current in existing.items()}
+
+        counts = {'fetched': 0, 'added': 0, 'updated': 0, 'deactivated': 0, 'unchanged': 0, 'skipped': 0,
+                  'conflicts': 0}
+        seen = set()
+        inserts, updates, deferred = [], [], []
+
+        for item in client.proxies():
+            counts['fetched'] += 1
+            row = parse_webshare_proxy(item)
+            if row is None or row['webshare_id'] in seen:
+                counts['skipped'] += 1
+                continue
+            seen.add(row['webshare_id'])
+
+            current = existing.get(row['webshare_id'])
+            if current is None:
+                proxy_id = unclaimed.pop((row['ip'], row['port']), None)
+                if proxy_id is not None:
+                    updates.append(dict(row, id=proxy_id))
+                elif (row['ip'], row['port']) in held:
+                    deferred.append(row)
+                else:
+                    inserts.append(row)
+            elif tuple(current[1:]) != tuple(row[f] for f in SYNCED_FIELDS):
+                updates.append(dict(row, id=current[0]))
+            else:
+                counts['unchanged'] += 1
+
+            if len(inserts) >= self.batch_size:
+                self._insert(inserts, counts)
+                inserts = []
+            if len(updates) >= self.batch_size:
+                self._update(updates, counts)
+                updates = []
+
+        self._insert(inserts, counts)
+        self._update(updates, counts)
+
+        # New ids at the address of a synced row: take over the row of a proxy that is no longer listed,
+        # otherwise insert (the address is free if its proxy moved, else it is a conflict)
+        inserts, updates, taken_over = [], [], set()
+        for row in deferred:
+            previous = held[(row['ip'], row['port'])]
+            if previous in seen or previous in taken_over:
+                inserts.append(row)
+            else:
+                taken_over.add(previous)
+                updates.append(dict(row, id=existing[previous][0]))
+        for i in range(0, len(updates), self.batch_size):
+            self._update(updates[i:i + self.batch_size], counts)
+        for i in range(0, len(inserts), self.batch_size):
+            self._insert(inserts[i:i + self.batch_size], counts)
+
+        # The list was read to the end: whatever it no longer has goes out of rotation
+        gone = [current[0] for webshare_id, current in existing.items()
+                if webshare_id not in seen and webshare_id not in taken_over and current[-1]]
+        for i in range(0, len(gone), self.batch_size):
+            self._deactivate(gone[i:i + self.batch_size], counts)
+
+        if counts['added'] or counts['updated'] or counts['deactivated']:
+            proxy_pool.invalidate()
+        return counts
+
+    def _stamp(self):
+        # Strictly increasing, even within one clock tick: the pool only loads rows past the newest stamp it saw
+        now = datetime.now(timezone.utc)
+        if self._last_stamp is not None and now <= self._last_stamp:
+            now = self._last_stamp + timedelta(microseconds=1)
+        self._last_stamp = now
+        return now
+
+    def _insert(self, rows, counts):
+        if not rows:
+            return
+        now = self._stamp()
+        values = [dict(row, proxy_type=self.proxy_type, success_count=0, failure_count=0, last_used=now,
+                       created_at=now, updated_at=now) for row in rows]
+        with db.engine.begin() as conn:
+            result = conn.execute(_insert_statement(), values)
+        # ON CONFLICT DO NOTHING skips proxies whose address another row already has
+        added = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+        counts['added'] += added
+        counts['conflicts'] += len(rows) - added
+
+    def _update(self, rows, counts):
+        if not rows:
+            return
+        table = Proxy.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('pid'))
+            .values(updated_at=bindparam('stamp'), webshare_id=bindparam('wid'),
+                    **{f: bindparam(f"new_{f}") for f in SYNCED_FIELDS})
+        )
+        now = self._stamp()
+        params = [dict({f"new_{f}": row[f] for f in SYNCED_FIELDS}, pid=row['id'], wid=row['webshare_id'], stamp=now)
+                  for row in rows]
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(stmt, params)
+            counts['updated'] += len(rows)
+        except IntegrityError:
+            # Two proxies traded addresses, or one moved onto an address still held by
+            # another row: apply the batch row by row and skip the ones that collide
+            for param in params:
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(stmt, [dict(param, stamp=self._stamp())])
+                    counts['updated'] += 1
+                except IntegrityError:
+                    counts['conflicts'] += 1
+
+    def _deactivate(self, proxy_ids, counts):
+        table = Proxy.__table__
+        with db.engine.begin() as conn:
+            conn.execute(update(table).where(table.c.id.in_(proxy_ids)).values(is_active=False, updated_at=self._stamp()))
+        counts['deactivated'] += len(proxy_ids)
+
+
+webshare_sync = WebshareSync()
@@ -4,6 +4,8 @@ from flask_login import login_user, logout_user, login_required, current_user
 from proxy_manager.models.user import User
 from proxy_manager.models.proxy import Proxy
 from proxy_manager.services.proxy_service import ProxyService
+from proxy_manager.services.pool import proxy_pool
+from proxy_manager.services.listing import HEALTH_STATES, SORT_KEYS, list_proxies
 from proxy_manager.ui.forms import LoginForm, ProxyForm
 from proxy_manager import db
 
@@ -40,13 +42,58 @@ def logout():
 @ui.route('/proxies')
 @login_required
 def proxies():
+    # Rows are fetched page by page from proxies_data by proxies.js
     proxy_type = request.args.get('type')
-    if proxy_type:
-        proxies = Proxy.query.filter_by(proxy_type=proxy_type).all()
-    else:
-        proxies = Proxy.query.all()
     form = ProxyForm()
-    return render_template('proxies.html', proxies=proxies, form=form, current_type=proxy_type)
+    return render_template('proxies.html', form=form, current_type=proxy_type,
+                           sort_keys=SORT_KEYS, health_states=HEALTH_STATES)
+
+@ui.route('/proxies/data')
+@login_required
+def proxies_data():
+    """
+    One page of the proxy table as JSON.
+
+    Args:
+        type (str, optional): Filter by proxy type
+        country (str, optional): Filter by country code
+        active (str, optional): 'true' or 'false'
+        health (str, optional): 'healthy', 'unhealthy' or 'unchecked'
+        sort (str, optional): 'id' (default), 'failure_rate', 'last_used' or 'latency'
+        order (str, optional): 'asc' (default) or 'desc'
+        limit (int, optional): Page size, 1 to 500 (default 100)
+        cursor (str, optional): next_cursor of the previous page
+
+    Returns:
+        JSON response with the page of proxies and the cursor of the next page (null on the last page)
+    """
+    active = request.args.get('active')
+    if active not in (None, '', 'true', 'false'):
+        return jsonify({'message': "active must be 'true' or 'false'"}), 400
+    limit = request.args.get('limit', 100, type=int)
+    if not 1 <= limit <= 500:
+        return jsonify({'message': 'limit must be between 1 and 500'}), 400
+
+    try:
+        proxies, next_cursor = list_proxies(
+            proxy_type=request.args.get('type') or None,
+            country_code=request.args.get('country') or None,
+            active=(active == 'true') if active else None,
+            health=request.args.get('health') or None,
+            sort=request.args.get('sort', 'id'),
+            order=request.args.get('order', 'asc'),
+            cursor=request.args.get('cursor') or None,
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    rows = []
+    for proxy in proxies:
+        row = proxy.to_dict()
+        row['last_used'] = proxy.last_used.isoformat() if proxy.last_used else None
+        rows.append(row)
+    return jsonify({'count': len(rows), 'proxies': rows, 'next_cursor': next_cursor})
 
 @ui.route('/proxies/add', methods=['POST'])
 @login_required
@@ -72,6 +119,7 @@ def delete_proxy(proxy_id):
     proxy = Proxy.query.get_or_404(proxy_id)
     db.session.delete(proxy)
     db.session.commit()
+    proxy_pool.invalidate()
     flash('Proxy deleted successfully', 'success')
     return redirect(url_for('ui.proxies'))
 
@@ -88,10 +136,10 @@ def import_proxies():
         return redirect(url_for('ui.proxies'))
     
     try:
-        content = file.read().decode('utf-8')
         proxy_type = request.form.get('proxy_type', 'datacenter')
-        added = ProxyService.import_proxies(content, proxy_type)
-        flash(f'Successfully imported {added} proxies', 'success')
+        counts = ProxyService.import_proxies(file.stream, proxy_type)
+        flash(f"Successfully imported {counts['added']} proxies "
+              f"({counts['duplicates']} duplicates and {counts['malformed']} malformed lines skipped)", 'success')
     except Exception as e:
         flash(f'Error importing proxies: {str(e)}', 'error')
     
@@ -106,6 +154,7 @@ def bulk_delete_proxies():
         
         deleted = Proxy.query.filter(Proxy.id.in_(proxy_ids)).delete(synchronize_session=False)
         db.session.commit()
+        proxy_pool.invalidate()
         
         return jsonify({
             'success': True,
@@ -132,7 +132,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const selectAllCheckbox = document.getElementById('selectAll');
     const deleteSelectedButton = document.getElementById('deleteSelected');
     const selectedCountSpan = document.getElementById('selectedCount');
-    const proxyCheckboxes = document.querySelectorAll('.proxy-select');
+    const proxyRows = document.getElementById('proxyRows');
+    const filtersForm = document.getElementById('proxyFilters');
+    const loadMoreButton = document.getElementById('loadMore');
+    const tableStatus = document.getElementById('proxyTableStatus');
 
     // Update selected count and button state
     const updateSelectedState = () => {
@@ -161,6 +164,149 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Table rows are fetched a page at a time from /proxies/data
+    const escapeHtml = (value) => String(value ?? '').replace(/[&<>"']/g, ch => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    }[ch]));
+
+    const renderRow = (proxy) => {
+        const rate = proxy.failure_rate || 0;
+        const barColor = rate > 50 ? 'bg-red-500' : rate > 20 ? 'bg-yellow-500' : 'bg-green-500';
+        const typeClass = proxy.proxy_type === 'residential' ? 'bg-blue-50 text-blue-700' : 'bg-purple-50 text-purple-700';
+        const statusClass = proxy.is_active ? 'bg-green-50 text-green-700' : 'bg-gray-100 text-gray-700';
+        const latency = proxy.ttfb_ms != null ? `${Math.round(proxy.ttfb_ms)} ms` : '&ndash;';
+        const lastUsed = proxy.last_used ? escapeHtml(new Date(proxy.last_used).toLocaleString()) : '&ndash;';
+        const proxyType = proxy.proxy_type ? proxy.proxy_type.charAt(0).toUpperCase() + proxy.proxy_type.slice(1) : '';
+
+        const row = document.createElement('tr');
+        if (rate > 50) {
+            row.className = 'bg-red-50';
+        }
+        row.innerHTML = `
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">
+                <div class="flex items-center">
+                    <input type="checkbox" class="proxy-select h-4 w-4 rounded border-gray-300 text-indigo-600 focus:ring-indigo-600" value="${proxy.id}">
+                </div>
+            </td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm font-medium text-gray-900">${escapeHtml(proxy.ip)}</td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">${escapeHtml(proxy.port)}</td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">${escapeHtml(proxy.username)}</td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">${escapeHtml(proxy.password)}</td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">
+                <span class="inline-flex items-center rounded-md px-2 py-1 text-xs font-medium ${typeClass}">${escapeHtml(proxyType)}</span>
+            </td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">
+                <span class="inline-flex items-center rounded-md px-2 py-1 text-xs font-medium ${statusClass}">${proxy.is_active ? 'Active' : 'Inactive'}</span>
+            </td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">${proxy.success_count} / ${proxy.failure_count}</td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">
+                <div class="flex items-center">
+                    <div class="flex-1 bg-gray-200 rounded-full h-2 mr-2">
+                        <div class="h-2 rounded-full ${barColor}" style="width: ${rate}%;"></div>
+                    </div>
+                    <span class="text-xs">${rate.toFixed(1)}%</span>
+                </div>
+            </td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">${latency}</td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">${lastUsed}</td>
+            <td class="whitespace-nowrap py-4 px-4 text-sm text-gray-500">
+                <button class="delete-proxy inline-flex items-center rounded-md bg-white px-2.5 py-1.5 text-sm font-semibold text-red-600 shadow-sm ring-1 ring-inset ring-red-300 hover:bg-red-50" data-proxy-id="${proxy.id}">
+                    Delete
+                </button>
+            </td>`;
+        return row;
+    };
+
+    let nextCursor = null;
+    let loading = false;
+    // Bumped on every filter change so responses for an old filter are dropped
+    let generation = 0;
+
+    const currentFilters = () => {
+        const params = new URLSearchParams();
+        if (filtersForm.dataset.type) {
+            params.set('type', filtersForm.dataset.type);
+        }
+        new FormData(filtersForm).forEach((value, key) => {
+            if (value) {
+                params.set(key, value);
+            }
+        });
+        return params;
+    };
+
+    const setFooter = (hasMore) => {
+        const loadedCount = proxyRows.rows.length;
+        loadMoreButton.style.display = hasMore ? '' : 'none';
+        tableStatus.textContent = hasMore ? '' : (loadedCount ? `${loadedCount} proxies` : 'No proxies found');
+    };
+
+    const loadPage = async () => {
+        if (loading) {
+            return;
+        }
+        loading = true;
+        const requestGeneration = generation;
+        const params = currentFilters();
+        if (nextCursor) {
+            params.set('cursor', nextCursor);
+        }
+        tableStatus.textContent = 'Loading...';
+        loadMoreButton.style.display = 'none';
+
+        try {
+            const response = await fetch(`/proxies/data?${params}`, { credentials: 'same-origin' });
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.message || 'Failed to load proxies');
+            }
+            if (requestGeneration !== generation) {
+                return;
+            }
+            const fragment = document.createDocumentFragment();
+            data.proxies.forEach(proxy => fragment.appendChild(renderRow(proxy)));
+            proxyRows.appendChild(fragment);
+            nextCursor = data.next_cursor;
+            setFooter(Boolean(nextCursor));
+            updateSelectedState();
+        } catch (error) {
+            console.error('Error:', error);
+            tableStatus.textContent = '';
+            loadMoreButton.style.display = '';
+            showFlashMessage(error.message || 'An error occurred while loading proxies', 'danger');
+        } finally {
+            loading = false;
+            // A filter change while we were loading starts over
+            if (requestGeneration !== generation) {
+                loadPage();
+            }
+        }
+    };
+
+    const reload = () => {
+        generation += 1;
+        nextCursor = null;
+        proxyRows.replaceChildren();
+        updateSelectedState();
+        loadPage();
+    };
+
+    filtersForm.addEventListener('change', reload);
+    filtersForm.addEventListener('submit', (e) => {
+        e.preventDefault();
+        reload();
+    });
+    loadMoreButton.addEventListener('click', loadPage);
+
+    // Fetch the next page as the end of the table scrolls into view
+    if ('IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting) && nextCursor) {
+                loadPage();
+            }
+        }, { rootMargin: '400px' }).observe(document.getElementById('proxyTableFooter'));
+    }
+
     // Select all checkbox functionality
     if (selectAllCheckbox) {
         selectAllCheckbox.addEventListener('change', function() {
@@ -172,9 +318,11 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Individual checkbox change handler
-    proxyCheckboxes.forEach(checkbox => {
-        checkbox.addEventListener('change', updateSelectedState);
+    // Individual checkbox change handler (rows are added after load, so delegate)
+    proxyRows.addEventListener('change', function(e) {
+        if (e.target.classList.contains('proxy-select')) {
+            updateSelectedState();
+        }
     });
 
     // Delete selected proxies
@@ -223,36 +371,39 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Individual proxy deletion
-    document.querySelectorAll('.delete-proxy').forEach(button => {
-        button.addEventListener('click', async function() {
-            const proxyId = this.dataset.proxyId;
-            if (confirm('Are you sure you want to delete this proxy?')) {
-                try {
-                    const response = await fetch(`/proxies/${proxyId}/delete`, {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                            'X-CSRFToken': getCsrfToken()
-                        },
-                        credentials: 'same-origin'
-                    });
-
-                    if (!response.ok) {
-                        const errorData = await response.json();
-                        throw new Error(errorData.message || 'Failed to delete proxy');
-                    }
+    proxyRows.addEventListener('click', async function(e) {
+        const button = e.target.closest('.delete-proxy');
+        if (!button) {
+            return;
+        }
+        const proxyId = button.dataset.proxyId;
+        if (confirm('Are you sure you want to delete this proxy?')) {
+            try {
+                const response = await fetch(`/proxies/${proxyId}/delete`, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRFToken': getCsrfToken()
+                    },
+                    credentials: 'same-origin'
+                });
 
-                    this.closest('tr').remove();
-                    updateSelectedState();
-                    showFlashMessage('Proxy deleted successfully');
-                } catch (error) {
-                    console.error('Error:', error);
-                    showFlashMessage(error.message || 'An error occurred while deleting the proxy', 'danger');
+                if (!response.ok) {
+                    const errorData = await response.json();
+                    throw new Error(errorData.message || 'Failed to delete proxy');
                 }
+
+                button.closest('tr').remove();
+                updateSelectedState();
+                showFlashMessage('Proxy deleted successfully');
+            } catch (error) {
+                console.error('Error:', error);
+                showFlashMessage(error.message || 'An error occurred while deleting the proxy', 'danger');
             }
-        });
+        }
     });
 
-    // Initial state update
+    // Initial state update and first page
     updateSelectedState();
-});
\ No newline at end of file
+    loadPage();
+});
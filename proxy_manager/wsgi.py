@@ -0,0 +1,17 @@
+"""
+WSGI entry point for gunicorn, loaded once in the master (see gunicorn.conf.py)
+
+    gunicorn -c gunicorn.conf.py proxy_manager.wsgi:app
+
+The app is built and the proxy pool loaded (with its selection samplers)
+before the workers are forked, so a new or recycled worker starts with all of
+it in memory and serves its first request without importing the app, reading
+every proxy or weighing them.
+"""
+from proxy_manager import create_app
+from proxy_manager.services.pool import proxy_pool
+
+app = create_app()
+
+with app.app_context():
+    proxy_pool.warm()
@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    A fresh app on its own SQLite database. The service singletons outlive apps, so their caches are reset.
+    """
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'proxies.db'}")
+    monkeypatch.setenv('API_KEY', 'test-key')
+    monkeypatch.setenv('SHARED_STATE_URL', '')
+    monkeypatch.setenv('LOG_LEVEL', 'WARNING')
+
+    from proxy_manager import create_app
+    from proxy_manager.services.credentials import credential_cache
+    from proxy_manager.services.pool import proxy_pool
+
+    app = create_app()
+    app.config['TESTING'] = True
+    proxy_pool._snapshot = None
+    proxy_pool.invalidate()
+    credential_cache.clear()
+    yield app
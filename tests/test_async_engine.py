@@ -0,0 +1,74 @@
+import asyncio
+
+from proxy_manager import db
+from proxy_manager.services.affinity import session_affinity
+from proxy_manager.services.async_engine import AsyncForwarder
+from proxy_manager.services.limits import proxy_limiter
+from proxy_manager.services.pool import ProxyPool, proxy_pool
+from proxy_manager.services.proxy_service import ProxyService
+
+
+def _on_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def test_forward_never_refreshes_the_pool_on_the_loop(app, monkeypatch):
+    with app.app_context():
+        residential = ProxyService.add_proxy('10.0.4.1', 8000, 'u', 'p', 'residential')
+        ProxyService.add_proxy('10.0.4.2', 8000, 'u', 'p', 'datacenter')
+        residential_id = residential.id
+        db.session.remove()
+
+    forwarder = AsyncForwarder(app)
+    refreshes = []
+    refresh = ProxyPool._refresh
+
+    def counting_refresh(self):
+        refreshes.append(_on_loop())
+        return refresh(self)
+
+    async def send(proxy, *args, **kwargs):
+        # Every attempt outlives the refresh interval
+        proxy_pool.invalidate()
+        if proxy.id == residential_id:
+            raise ConnectionError('refused')
+        return 200, {}, 'ok'
+
+    monkeypatch.setattr(ProxyPool, '_refresh', counting_refresh)
+    monkeypatch.setattr(forwarder, '_send', send)
+
+    # One residential proxy and max_retries=1: its failure leads to the datacenter last resort
+    response, status_code = asyncio.run(forwarder.forward('http://example.com/', max_retries=1))
+
+    assert status_code == 200
+    assert response['proxy_used'] == '10.0.4.2:8000'
+    assert 'last resort' in response['note']
+    assert not any(refreshes)
+
+
+def test_async_last_resort_goes_through_the_limiter(app, monkeypatch):
+    with app.app_context():
+        residential_id = ProxyService.add_proxy('10.0.4.3', 8000, 'u', 'p', 'residential').id
+        ProxyService.add_proxy('10.0.4.4', 8000, 'u', 'p', 'datacenter')
+        db.session.remove()
+
+    forwarder = AsyncForwarder(app)
+
+    async def send(proxy, *args, **kwargs):
+        if proxy.id == residential_id:
+            raise ConnectionError('refused')
+        return 200, {}, 'ok'
+
+    monkeypatch.setattr(forwarder, '_send', send)
+    acquired = proxy_limiter.acquired
+    response, status_code = asyncio.run(forwarder.forward('http://example.com/', max_retries=1,
+                                                          session='async-last-resort'))
+
+    assert status_code == 200 and response['proxy_used'] == '10.0.4.4:8000'
+    assert proxy_limiter.acquired == acquired + 2
+    # The session is not moved onto the other proxy type
+    assert session_affinity.pinned('async-last-resort') is None
@@ -0,0 +1,34 @@
+import pytest
+
+from proxy_manager.services.proxy_service import ProxyService
+
+
+@pytest.fixture
+def forwarded(app, monkeypatch):
+    """
+    Headers /api/proxy/request would send upstream
+    """
+    sent = []
+
+    def make_request(**kwargs):
+        sent.append(kwargs['headers'])
+        return {'status_code': 200, 'headers': {}, 'content': ''}, 200
+
+    monkeypatch.setattr(ProxyService, 'make_request', make_request)
+    return sent
+
+
+def test_bearer_api_key_is_not_forwarded(app, forwarded):
+    response = app.test_client().get('/api/proxy/request?url=http://example.com/',
+                                     headers={'Authorization': 'Bearer test-key', 'X-Custom': '1'})
+    assert response.status_code == 200
+    assert 'Authorization' not in forwarded[0]
+    assert forwarded[0]['X-Custom'] == '1'
+
+
+def test_target_authorization_is_forwarded_with_x_api_key(app, forwarded):
+    response = app.test_client().get('/api/proxy/request?url=http://example.com/',
+                                     headers={'X-API-Key': 'test-key', 'Authorization': 'Bearer target-token'})
+    assert response.status_code == 200
+    assert forwarded[0]['Authorization'] == 'Bearer target-token'
+    assert 'X-Api-Key' not in forwarded[0] and 'X-API-Key' not in forwarded[0]
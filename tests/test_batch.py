@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from proxy_manager.services.batch import parse_batch, run_batch
+from proxy_manager.services.proxy_service import ProxyService
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    Stub make_request: the URL path says how long to take and what to answer; records calls and peak concurrency
+    """
+    state = {'calls': [], 'running': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def make_request(cls, url, **kwargs):
+        with lock:
+            state['calls'].append(url)
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        try:
+            _, delay, outcome = url.rsplit('/', 2)
+            time.sleep(float(delay))
+            if outcome == 'fail':
+                return {"error": "All retries failed", "details": []}, 503
+            if outcome == 'raise':
+                raise RuntimeError('boom')
+            return {'status_code': 200, 'headers': {}, 'content': url, 'proxy_used': '10.0.0.1:8000'}, 200
+        finally:
+            with lock:
+                state['running'] -= 1
+
+    monkeypatch.setattr(ProxyService, 'make_request', classmethod(make_request))
+    return state
+
+
+@pytest.mark.parametrize('payload, message', [
+    ([], "Body must be a JSON object with a 'requests' list"),
+    ({'requests': 'x'}, "Body must be a JSON object with a 'requests' list"),
+    ({'requests': []}, "'requests' is empty"),
+    ({'requests': [{'url': 'http://a/'}] * 3}, "At most 2 requests per batch"),
+    ({'requests': [{'url': 'http://a/'}], 'concurrency': 'many'}, "'concurrency' must be a positive integer"),
+    ({'requests': [{'url': 'http://a/'}], 'concurrency': -1}, "'concurrency' must be a positive integer"),
+    ({'requests': ['http://a/']}, "Request 0: must be an object"),
+    ({'requests': [{'url': 'http://a/'}, {}]}, "Request 1: url is required"),
+    ({'requests': [{'url': 'http://a/', 'method': 'TRACE'}]}, "Request 0: invalid HTTP method"),
+    ({'requests': [{'url': 'http://a/', 'headers': ['Accept']}]}, "Request 0: params and headers must be objects"),
+    ({'requests': [{'url': 'http://a/', 'data': {'a': 1}}]}, "Request 0: data must be a string"),
+    ({'requests': [{'url': 'http://a/', 'proxy_type': 'mobile'}]},
+     "Request 0: invalid proxy type. Must be 'datacenter' or 'residential'"),
+    ({'requests': [{'url': 'http://a/', 'country': 1}]},
+     "Request 0: country, city, region and geo_fallback must be strings"),
+])
+def test_parse_batch_errors(payload, message):
+    with pytest.raises(ValueError) as error:
+        parse_batch(payload, max_items=2)
+    assert str(error.value) == message
+
+
+@pytest.mark.parametrize('concurrency, items, expected', [(None, 5, 3), (2, 5, 2), (100, 5, 4), (100, 2, 2)])
+def test_parse_batch_clamps_concurrency(concurrency, items, expected):
+    payload = {'requests': [{'url': f"http://a/{i}"} for i in range(items)], 'concurrency': concurrency}
+    assert parse_batch(payload, default_concurrency=3, max_concurrency=4)[1] == expected
+
+
+def test_parse_batch_items():
+    items, _ = parse_batch({'requests': [{'url': 'http://a/', 'method': 'post', 'data': 'x', 'id': 'first',
+                                          'headers': {'X-API-Key': 'secret', 'Accept': 'text/plain'},
+                                          'params': {'page': 2}}]}, default_proxy_type='datacenter')
+    item = items[0]
+    assert (item.index, item.id, item.method, item.data, item.proxy_type) == (0, 'first', 'POST', b'x', 'datacenter')
+    assert item.headers == {'Accept': 'text/plain'}
+    assert item.params == {'page': '2'}
+
+
+def test_results_come_in_completion_order(app, upstream):
+    items, concurrency = parse_batch({'requests': [
+        {'url': 'http://a/0.3/ok', 'id': 'slow'},
+        {'url': 'http://a/0.0/fail'},
+        {'url': 'http://a/0.1/raise', 'id': 7},
+    ]})
+    results = list(run_batch(app, items, concurrency))
+
+    assert [r['index'] for r in results] == [1, 2, 0]
+    assert results[0] == {'index': 1, 'error': 'All retries failed', 'details': [], 'status_code': 503}
+    assert results[1] == {'index': 2, 'id': 7, 'error': 'Request failed', 'details': ['boom'], 'status_code': 500}
+    assert results[2]['id'] == 'slow' and results[2]['status_code'] == 200
+
+
+def test_concurrency_limits_requests_in_flight(app, upstream):
+    items, _ = parse_batch({'requests': [{'url': f"http://a/{i}/0.05/ok"} for i in range(8)]})
+    assert len(list(run_batch(app, items, 2))) == 8
+    assert upstream['peak'] == 2
+
+
+def test_closing_the_stream_drops_queued_items(app, upstream):
+    items, _ = parse_batch({'requests': [{'url': f"http://a/{i}/0.05/ok"} for i in range(5)]})
+    results = run_batch(app, items, 1)
+    assert next(results)['index'] == 0
+    results.close()
+    time.sleep(0.2)
+    # The item started before the first result was yielded may run; nothing after it does
+    assert len(upstream['calls']) <= 2
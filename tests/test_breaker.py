@@ -0,0 +1,78 @@
+import time
+
+import pytest
+import requests
+
+from proxy_manager.services.breaker import OPEN, CircuitBreakers, classify_error
+
+
+@pytest.mark.parametrize('exc, kind', [
+    (requests.exceptions.ProxyError('Cannot connect to proxy'), 'proxy'),
+    (requests.exceptions.ProxyError('407 Proxy Authentication Required'), 'auth'),
+    (requests.exceptions.ConnectTimeout(), 'timeout'),
+    (requests.exceptions.ReadTimeout(), 'timeout'),
+    (requests.exceptions.ConnectionError('Connection refused'), 'connect'),
+    (ConnectionResetError(), 'connect'),
+])
+def test_proxy_faults_count(exc, kind):
+    assert classify_error(exc) == kind
+
+
+@pytest.mark.parametrize('exc', [
+    requests.exceptions.MissingSchema(),
+    requests.exceptions.InvalidURL(),
+    requests.exceptions.InvalidSchema(),
+    requests.exceptions.TooManyRedirects(),
+    requests.exceptions.ChunkedEncodingError(),
+    requests.exceptions.ContentDecodingError(),
+    requests.exceptions.SSLError(),
+    ValueError(),
+])
+def test_client_and_target_errors_are_not_the_proxys_fault(exc):
+    assert classify_error(exc) is None
+
+
+def test_bad_urls_do_not_trip_breakers():
+    breakers = CircuitBreakers(failure_threshold=2)
+    for _ in range(10):
+        breakers.record_failure(1, classify_error(requests.exceptions.MissingSchema('foo')))
+    assert breakers.allow(1)
+
+    for _ in range(2):
+        breakers.record_failure(1, classify_error(requests.exceptions.ConnectionError('refused')))
+    assert breakers._breakers[1].state == OPEN
+    assert not breakers.allow(1)
+
+
+@pytest.fixture
+def shared(tmp_path):
+    from proxy_manager.services.shared import MemoryBackend, shared_state
+
+    previous = shared_state.backend
+    shared_state.backend = MemoryBackend(str(tmp_path / 'state'), slots=1024, cursors=16)
+    yield shared_state
+    shared_state.backend = previous
+
+
+def test_shared_quarantine_goes_half_open_until_a_probe_succeeds(shared):
+    first, second = CircuitBreakers(failure_threshold=1, cooldown=0.05), CircuitBreakers(failure_threshold=1, cooldown=0.05)
+    first.record_failure(1, 'connect')
+    assert not first.allow(1)
+    assert not second.allow(1)
+
+    time.sleep(0.06)
+    # Cooldown over: one probe per worker, not full traffic
+    assert first.allow(1) and not first.allow(1)
+    assert second.allow(1) and not second.allow(1)
+
+    # A failed probe re-opens with the cooldown doubled
+    first.record_failure(1, 'connect')
+    assert first._breakers[1].trips == 2
+    assert not first.allow(1)
+
+    time.sleep(0.11)
+    assert first.allow(1)
+    first.record_success(1)
+    # The success closes it everywhere
+    assert all(second.allow(1) for _ in range(3))
+    assert all(first.allow(1) for _ in range(3))
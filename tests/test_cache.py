@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from proxy_manager.services import cache as cache_module
+from proxy_manager.services.cache import ResponseCache
+from proxy_manager.services.proxy_service import ProxyService
+
+RESULT = ({'status_code': 200, 'headers': {}, 'content': 'body', 'proxy_used': '10.0.0.1:8000'}, 200)
+
+
+class CountingLoader:
+    """
+    Returns RESULT; with a gate, each call waits for it to open
+    """
+
+    def __init__(self, gate=None):
+        self.calls = 0
+        self.gate = gate
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        return RESULT
+
+
+def test_concurrent_fetches_share_one_loader_call():
+    cache = ResponseCache()
+    gate = threading.Event()
+    loader = CountingLoader(gate)
+    outcomes = []
+
+    def fetch():
+        outcomes.append(cache.fetch('k', loader, ttl=60))
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Let the followers find the leader's flight before its response arrives
+    time.sleep(0.2)
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == 1
+    assert sorted(result for _, result in outcomes) == ['coalesced'] * 7 + ['miss']
+    assert all(response == RESULT for response, _ in outcomes)
+    assert cache.stats()['coalesced'] == 7 and cache.stats()['misses'] == 1
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+    cache = ResponseCache()
+    loader = CountingLoader()
+
+    assert cache.fetch('k', loader, ttl=10)[1] == 'miss'
+    now[0] += 9
+    assert cache.fetch('k', loader, ttl=10)[1] == 'hit'
+    now[0] += 2
+    assert cache.fetch('k', loader, ttl=10)[1] == 'miss'
+    assert loader.calls == 2
+
+
+def test_uncacheable_results_are_loaded_every_time():
+    cache = ResponseCache()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        return {'error': 'All retries failed', 'details': []}, 503
+
+    assert cache.fetch('k', failing, ttl=60)[1] == 'miss'
+    assert cache.fetch('k', failing, ttl=60)[1] == 'miss'
+    assert len(calls) == 2
+
+
+def test_concurrent_async_fetches_share_one_loader_call():
+    cache = ResponseCache()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return RESULT
+
+    async def run():
+        return await asyncio.gather(*(cache.fetch_async('k', loader, ttl=60) for _ in range(5)))
+
+    outcomes = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(result for _, result in outcomes) == ['coalesced'] * 4 + ['miss']
+
+
+@pytest.mark.parametrize('headers', [{'X-Proxy-Cache': 'true'}, {'X-Proxy-Cache-TTL': '60'}])
+def test_request_reports_cache_hit_or_miss(app, monkeypatch, headers):
+    calls = []
+
+    def make_request(cls, **kwargs):
+        calls.append(1)
+        return dict(RESULT[0], headers={'Cache-Control': 'max-age=60'}), 200
+
+    monkeypatch.setattr(ProxyService, 'make_request', classmethod(make_request))
+    monkeypatch.setattr('proxy_manager.api.routes.response_cache', ResponseCache())
+    client = app.test_client()
+    url = '/api/proxy/request?url=http://example.com/cached'
+    headers = dict(headers, **{'X-API-Key': 'test-key'})
+
+    assert client.get(url, headers=headers).get_json()['cache'] == 'miss'
+    assert client.get(url, headers=headers).get_json()['cache'] == 'hit'
+    assert len(calls) == 1
@@ -0,0 +1,21 @@
+from proxy_manager.services.geo import GeoLocator
+from proxy_manager.services.pool import ProxyPool
+from proxy_manager.services.proxy_service import ProxyService
+
+
+def test_geo_enrich_reaches_other_workers_pools(app, monkeypatch):
+    with app.app_context():
+        proxy_id = ProxyService.add_proxy('10.0.5.1', 8000, 'u', 'p', 'residential').id
+        # A running worker's pool, which the CLI's invalidate() can't reach
+        worker_pool = ProxyPool(refresh_interval=0)
+        assert worker_pool.get(proxy_id).country_code is None
+
+    monkeypatch.setattr(GeoLocator, 'enabled', property(lambda self: True))
+    monkeypatch.setattr(GeoLocator, 'lookup', lambda self, ip: ('DE', 'Berlin'))
+    result = app.test_cli_runner().invoke(args=['geo-enrich'])
+    assert 'Located 1 proxies' in result.output
+
+    with app.app_context():
+        record = worker_pool.get(proxy_id)
+        assert (record.country_code, record.city_name) == ('DE', 'Berlin')
+        assert worker_pool.candidates(country_code='DE') == (record,)
@@ -0,0 +1,48 @@
+from proxy_manager import db
+from proxy_manager.models.api_key import ApiKey
+from proxy_manager.models.generation import Generation
+from proxy_manager.services.credentials import GENERATION_ROW, credential_cache
+
+
+def stored_generation():
+    with db.engine.connect() as conn:
+        return Generation.read(conn, GENERATION_ROW)
+
+
+def test_commit_bumps_the_stored_generation(app):
+    with app.app_context():
+        record, _ = ApiKey.generate('a')
+        db.session.add(record)
+        db.session.commit()
+        assert stored_generation() == 0
+
+        record.is_active = False
+        db.session.commit()
+        assert stored_generation() == 1
+
+        record.description = 'rolled back'
+        db.session.flush()
+        db.session.rollback()
+        assert stored_generation() == 1
+
+
+def test_key_revoked_by_another_process_is_dropped_without_shared_state(app):
+    with app.app_context():
+        record, key = ApiKey.generate('a')
+        db.session.add(record)
+        db.session.commit()
+        key_id = record.id
+    client = app.test_client()
+    url = '/api/stats'
+
+    assert client.get(url, headers={'X-API-Key': key}).status_code == 200
+    assert credential_cache.get('api_key', key) is not None
+
+    # What `flask api-key revoke` commits from its own process: this worker's commit hook doesn't run
+    with app.app_context(), db.engine.begin() as conn:
+        table = ApiKey.__table__
+        conn.execute(table.update().where(table.c.id == key_id).values(is_active=False))
+        Generation.bump(conn, GENERATION_ROW)
+
+    credential_cache._checked_at = 0.0
+    assert client.get(url, headers={'X-API-Key': key}).status_code == 401
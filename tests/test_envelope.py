@@ -0,0 +1,67 @@
+import json
+import struct
+
+import pytest
+
+from proxy_manager.services.envelope import FRAME_TYPE, JSON_TYPE, MSGPACK_TYPES, negotiate, pack
+
+RESPONSE = {'status_code': 200, 'headers': {'Content-Encoding': 'gzip'}, 'content': b'\x1f\x8b\x00binary\xff',
+            'proxy_used': '10.0.0.1:8000', 'proxy_type': 'residential'}
+
+
+@pytest.mark.parametrize('accept, envelope, keep, expected', [
+    (None, None, None, ('json', 'text', False)),
+    ('text/html, application/json', None, None, ('json', 'text', False)),
+    ('application/x-msgpack;q=0.9', None, None, ('msgpack', 'bytes', True)),
+    (FRAME_TYPE, None, 'true', ('frame', 'raw', True)),
+    # The query parameter wins over Accept, which is then meant for upstream
+    (FRAME_TYPE, 'MSGPACK', None, ('msgpack', 'bytes', False)),
+    (None, 'frame', 'no', ('frame', 'bytes', False)),
+])
+def test_negotiate(accept, envelope, keep, expected):
+    assert negotiate(accept, envelope, keep) == expected
+
+
+@pytest.mark.parametrize('accept, envelope', [(None, None), ('application/json', None), (None, 'json')])
+def test_keep_encoding_needs_a_binary_envelope(accept, envelope):
+    with pytest.raises(ValueError):
+        negotiate(accept, envelope, 'true')
+
+
+def test_unknown_envelope_is_rejected():
+    with pytest.raises(ValueError):
+        negotiate(None, 'xml')
+
+
+def test_frame_layout():
+    body, content_type = pack(RESPONSE, 'frame')
+    assert content_type == FRAME_TYPE
+    (length,) = struct.unpack('>I', body[:4])
+    meta = json.loads(body[4:4 + length])
+    assert 'content' not in meta
+    assert meta == {k: v for k, v in RESPONSE.items() if k != 'content'}
+    # The body follows the metadata untouched, to the end of the response
+    assert body[4 + length:] == RESPONSE['content']
+
+
+def test_frame_encodes_text_content():
+    body, _ = pack(dict(RESPONSE, content='héllo'), 'frame')
+    (length,) = struct.unpack('>I', body[:4])
+    assert body[4 + length:] == 'héllo'.encode('utf-8')
+
+
+def test_msgpack_keeps_bytes_and_text_apart():
+    msgpack = pytest.importorskip('msgpack')
+    body, content_type = pack(dict(RESPONSE, note='fallback'), 'msgpack')
+    assert content_type == MSGPACK_TYPES[0]
+    unpacked = msgpack.unpackb(body, raw=False)
+    assert unpacked['content'] == RESPONSE['content']
+    assert isinstance(unpacked['content'], bytes)
+    assert unpacked['note'] == 'fallback'
+    assert unpacked['headers'] == RESPONSE['headers']
+
+
+def test_json_envelope():
+    body, content_type = pack(dict(RESPONSE, content='text'), 'json')
+    assert content_type == JSON_TYPE
+    assert json.loads(body)['content'] == 'text'
@@ -0,0 +1,22 @@
+import pytest
+
+from proxy_manager.services.hedging import parse_hedge
+
+
+@pytest.mark.parametrize('delay', ['p-5', 'p0', 'p150', 'pnan', 'pinf', 'p', 'nan', 'inf', '-inf', '-1', 'soon'])
+def test_bad_hedge_delays_are_rejected(delay):
+    with pytest.raises(ValueError):
+        parse_hedge('2', delay)
+
+
+@pytest.mark.parametrize('delay, seconds', [('250', 0.25), ('0', 0.0), ('p95', 1.0), ('P100', 1.0), ('p0.5', 1.0)])
+def test_hedge_delays(delay, seconds):
+    # Percentiles use the fallback delay until enough latencies are recorded
+    assert parse_hedge('2', delay) == (2, seconds)
+
+
+def test_bad_hedge_delay_is_a_400(app):
+    response = app.test_client().get('/api/proxy/request?url=http://example.com/',
+                                     headers={'X-API-Key': 'test-key', 'X-Proxy-Hedge': '2',
+                                              'X-Proxy-Hedge-Delay': 'p150'})
+    assert response.status_code == 400
@@ -0,0 +1,71 @@
+import pytest
+
+from proxy_manager import db
+from proxy_manager.models.proxy import Proxy
+from proxy_manager.services.listing import encode_cursor, list_proxies
+from proxy_manager.services.proxy_service import ProxyService
+
+
+@pytest.fixture
+def listed(app):
+    """
+    Ten residential and two datacenter proxies; residential 4 and 8 are inactive.
+    Latencies repeat so a sort on them has ties, and one proxy was never measured.
+    """
+    with app.app_context():
+        for i in range(1, 11):
+            proxy = ProxyService.add_proxy(f"10.0.5.{i}", 8000, 'u', 'p', 'residential')
+            proxy.is_active = i not in (4, 8)
+            proxy.ttfb_ms = None if i == 5 else (i % 3) * 100
+        for i in range(11, 13):
+            ProxyService.add_proxy(f"10.0.5.{i}", 8000, 'u', 'p', 'datacenter')
+        db.session.commit()
+        yield
+
+
+def pages(fetch, **kwargs):
+    cursor = None
+    result = []
+    while True:
+        rows, cursor = fetch(cursor=cursor, **kwargs)
+        result.append([proxy.id for proxy in rows])
+        if cursor is None:
+            return result
+
+
+def test_proxy_pages_walk_active_proxies_by_id(listed):
+    assert pages(ProxyService.get_proxy_page, proxy_type='residential', limit=3) == [[1, 2, 3], [5, 6, 7], [9, 10]]
+    assert pages(ProxyService.get_proxy_page, limit=5) == [[1, 2, 3, 5, 6], [7, 9, 10, 11, 12]]
+    assert pages(ProxyService.get_proxy_page, proxy_type='residential', limit=5, active_only=False) == \
+        [[1, 2, 3, 4, 5], [6, 7, 8, 9, 10]]
+    assert ProxyService.get_proxy_page(proxy_type='datacenter', cursor=12) == ([], None)
+
+
+def test_proxy_pages_hold_still_when_rows_change(listed):
+    first, cursor = ProxyService.get_proxy_page(limit=4)
+    assert [proxy.id for proxy in first] == [1, 2, 3, 5]
+    # Deleting a row already served and adding one doesn't shift the next page
+    db.session.delete(db.session.get(Proxy, 2))
+    db.session.commit()
+    ProxyService.add_proxy('10.0.5.13', 8000, 'u', 'p', 'residential')
+    rows, _ = ProxyService.get_proxy_page(cursor=cursor, limit=4)
+    assert [proxy.id for proxy in rows] == [6, 7, 9, 10]
+
+
+@pytest.mark.parametrize('order, expected', [
+    # (ttfb, id): 0ms for 3, 6, 9; 100ms for 1, 7, 10; 200ms for 2; unmeasured 5 last
+    ('asc', [[3, 6, 9], [1, 7, 10], [2, 5]]),
+    ('desc', [[5, 2, 10], [7, 1, 9], [6, 3]]),
+])
+def test_listing_pages_break_ties_by_id(listed, order, expected):
+    assert pages(list_proxies, proxy_type='residential', active=True, sort='latency', order=order, limit=3) == expected
+
+
+def test_listing_cursor_must_match_the_sort(listed):
+    _, cursor = list_proxies(sort='latency', limit=2)
+    with pytest.raises(ValueError, match='Cursor does not match the requested sort'):
+        list_proxies(sort='latency', order='desc', cursor=cursor)
+    with pytest.raises(ValueError, match='Cursor does not match the requested sort'):
+        list_proxies(sort='id', cursor=encode_cursor('id', 'asc', 3, '3'))
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        list_proxies(cursor='not-a-cursor')
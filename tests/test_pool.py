@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+from proxy_manager import db
+from proxy_manager.models.proxy import Proxy
+from proxy_manager.services.health import ProbeResult, health_checker
+from proxy_manager.services.pool import ProxyPool, proxy_pool
+from proxy_manager.services.proxy_service import ProxyService
+
+
+def test_health_batches_patch_the_snapshot_without_a_reload(app, monkeypatch):
+    with app.app_context():
+        ids = [ProxyService.add_proxy(f"10.0.1.{i}", 8000, 'u', 'p', 'residential').id for i in range(1, 5)]
+        proxy_pool.invalidate()
+        proxy_pool.snapshot()
+
+        full_loads = []
+        load = ProxyPool._load
+
+        def counting_load(*criteria):
+            if not criteria:
+                full_loads.append(1)
+            return load(*criteria)
+
+        monkeypatch.setattr(ProxyPool, '_load', staticmethod(counting_load))
+
+        # Two batches back to back, the second within the same clock tick as the first
+        health_checker.apply([ProbeResult(ids[0], True, 5.0, 20.0), ProbeResult(ids[1], False, error='x')])
+        proxy_pool.snapshot()
+        health_checker.apply([ProbeResult(ids[2], True, 7.0, 30.0)])
+        snapshot = proxy_pool.snapshot()
+
+        assert full_loads == []
+        assert snapshot.count == 4
+        assert [snapshot.by_id[i].is_healthy for i in ids] == [True, False, True, None]
+        assert snapshot.by_id[ids[2]].ttfb_ms == 30.0
+        assert snapshot.checked_at == snapshot.by_id[ids[2]].last_checked
+        # Checked rows stay in place, so health runs don't reorder the round-robin buckets
+        assert [r.id for r in snapshot.records] == ids
+        assert [r.id for r in snapshot.by_type['residential']] == ids
+
+
+def test_patched_rows_keep_the_snapshot_in_id_order(app):
+    with app.app_context():
+        ids = [ProxyService.add_proxy(f"10.0.1.{i}", 8000, 'u', 'p', 'residential').id for i in range(1, 6)]
+        proxy_pool.invalidate()
+        proxy_pool.snapshot()
+
+        # A provider sync changes a row in the middle
+        proxy = db.session.get(Proxy, ids[2])
+        proxy.country_code = 'DE'
+        proxy.updated_at = datetime.now(timezone.utc)
+        db.session.commit()
+        proxy_pool.invalidate()
+        snapshot = proxy_pool.snapshot()
+
+        assert snapshot.by_id[ids[2]].country_code == 'DE'
+        assert [r.id for r in snapshot.records] == ids
+        assert [r.id for r in snapshot.by_type['residential']] == ids
@@ -0,0 +1,149 @@
+import time
+
+import pytest
+
+from proxy_manager.services.affinity import session_affinity
+from proxy_manager.services.hedging import latency_tracker
+from proxy_manager.services.limits import proxy_limiter
+from proxy_manager.services.pool import proxy_pool
+from proxy_manager.services.proxy_service import ProxyService
+from proxy_manager.services.shared import shared_state
+from proxy_manager.services.usage import usage_recorder
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b'ok'):
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'text/plain'}
+        self.content = content
+        self.text = content.decode()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def proxies(app):
+    with app.app_context():
+        records = [ProxyService.add_proxy(f"10.0.3.{i}", 8000, 'u', 'p', 'residential') for i in range(1, 4)]
+        return [r.id for r in records]
+
+
+def test_hedged_request_survives_a_pool_refresh_mid_flight(app, proxies, monkeypatch):
+    def send(cls, proxy, *args, **kwargs):
+        # The pool falls due while the attempt is on a hedge thread, outside the app context
+        proxy_pool.invalidate()
+        return FakeResponse()
+
+    monkeypatch.setattr(ProxyService, '_send', classmethod(send))
+    monkeypatch.setattr(proxy_pool, 'refresh_interval', 0)
+    usage_recorder._pending.clear()
+
+    with app.app_context():
+        response, status_code = ProxyService.make_request('http://example.com/', hedge=2, hedge_delay=0)
+
+    assert status_code == 200
+    assert response['content'] == 'ok'
+    assert all(failures == 0 for _, failures, _ in usage_recorder._pending.values())
+
+
+def test_streamed_attempt_holds_its_limiter_slot_until_closed(app, proxies, monkeypatch):
+    monkeypatch.setattr(ProxyService, '_send', classmethod(lambda cls, proxy, *args, **kwargs: FakeResponse()))
+
+    with app.app_context():
+        (response, proxy, _), error = ProxyService.stream_request('http://example.com/')
+    assert error is None
+    assert shared_state.inflight(proxy.id) == 1
+    response.close()
+    assert shared_state.inflight(proxy.id) == 0
+    response.close()
+    assert shared_state.inflight(proxy.id) == 0
+
+
+def test_hedged_attempts_free_their_slots_once_read(app, proxies, monkeypatch):
+    monkeypatch.setattr(ProxyService, '_send', classmethod(lambda cls, proxy, *args, **kwargs: FakeResponse()))
+
+    with app.app_context():
+        _, status_code = ProxyService.make_request('http://example.com/', hedge=2, hedge_delay=0)
+    assert status_code == 200
+    # The losing attempt is closed when it finishes on its hedge thread
+    deadline = time.monotonic() + 2
+    while any(shared_state.inflight(proxy_id) for proxy_id in proxies) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert all(shared_state.inflight(proxy_id) == 0 for proxy_id in proxies)
+
+
+def test_last_resort_goes_through_the_limiter_and_accounting(app, monkeypatch):
+    with app.app_context():
+        residential = ProxyService.add_proxy('10.0.3.10', 8000, 'u', 'p', 'residential')
+        datacenter = ProxyService.add_proxy('10.0.3.11', 8000, 'u', 'p', 'datacenter')
+        residential_id, datacenter_id = residential.id, datacenter.id
+
+    def send(cls, proxy, *args, **kwargs):
+        if proxy.id == residential_id:
+            raise ConnectionError('refused')
+        return FakeResponse()
+
+    monkeypatch.setattr(ProxyService, '_send', classmethod(send))
+    usage_recorder._pending.clear()
+    acquired = proxy_limiter.acquired
+    latencies = latency_tracker._added
+
+    with app.app_context():
+        response, status_code = ProxyService.make_request('http://example.com/', max_retries=1)
+
+    assert status_code == 200 and response['proxy_used'] == '10.0.3.11:8000'
+    assert proxy_limiter.acquired == acquired + 2
+    assert usage_recorder._pending[datacenter_id][:2] == [1, 0]
+    assert latency_tracker._added == latencies + 1
+
+
+def test_sticky_session_keeps_its_proxy(app, proxies, monkeypatch):
+    monkeypatch.setattr(ProxyService, '_send', classmethod(lambda cls, proxy, *args, **kwargs: FakeResponse()))
+    repinned = session_affinity.repinned
+
+    with app.app_context():
+        used = {ProxyService.make_request('http://example.com/', session='keeps-its-proxy')[0]['proxy_used']
+                for _ in range(5)}
+        (response, proxy, _), _ = ProxyService.stream_request('http://example.com/', session='keeps-its-proxy')
+        response.close()
+
+    assert len(used) == 1
+    assert proxy.address in used
+    assert session_affinity.pinned('keeps-its-proxy') == proxy.id
+    assert session_affinity.repinned == repinned
+
+
+def test_last_resort_does_not_repin_a_session(app, monkeypatch):
+    with app.app_context():
+        residential = ProxyService.add_proxy('10.0.3.20', 8000, 'u', 'p', 'residential')
+        ProxyService.add_proxy('10.0.3.21', 8000, 'u', 'p', 'datacenter')
+        residential_id = residential.id
+
+    down = []
+
+    def send(cls, proxy, *args, **kwargs):
+        if proxy.id == residential_id and down:
+            raise ConnectionError('refused')
+        return FakeResponse()
+
+    monkeypatch.setattr(ProxyService, '_send', classmethod(send))
+
+    def request(stream=False):
+        with app.app_context():
+            if stream:
+                (response, proxy, _), _ = ProxyService.stream_request('http://example.com/', max_retries=1,
+                                                                      session='no-repin')
+                response.close()
+                return proxy.address
+            return ProxyService.make_request('http://example.com/', max_retries=1, session='no-repin')[0]['proxy_used']
+
+    assert request() == '10.0.3.20:8000'
+    down.append(True)
+    # The residential proxy is down for a moment: both requests are served by the datacenter one
+    assert request() == '10.0.3.21:8000'
+    assert request(stream=True) == '10.0.3.21:8000'
+    assert session_affinity.pinned('no-repin') == residential_id
+    down.clear()
+    assert request() == '10.0.3.20:8000'
@@ -0,0 +1,170 @@
+import random
+
+import pytest
+
+from proxy_manager.services import selection
+from proxy_manager.services.pool import ProxyRecord
+from proxy_manager.services.selection import ProxySelector, WeightedSampler
+from proxy_manager.services.shared import SharedState
+
+
+def records(n, **kwargs):
+    return tuple(ProxyRecord(i, None, f"10.0.4.{i}", 8000, 'u', 'p', 'residential', None, None, 0, 0, None, **kwargs)
+                 for i in range(1, n + 1))
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    """
+    Per-worker shared state, so inflight counts and cursors start empty
+    """
+    state = SharedState()
+    monkeypatch.setattr(selection, 'shared_state', state)
+    return state
+
+
+@pytest.fixture
+def seeded():
+    state = random.getstate()
+    random.seed(1234)
+    yield
+    random.setstate(state)
+
+
+def draw_at(monkeypatch, sampler, fraction):
+    monkeypatch.setattr(selection.random, 'random', lambda: fraction)
+    return sampler.records[sampler._draw()].id
+
+
+def test_fenwick_draw_maps_cumulative_weight(monkeypatch):
+    sampler = WeightedSampler(records(4), [1.0, 2.0, 3.0, 4.0])
+    # Cumulative weights 1, 3, 6, 10
+    assert [draw_at(monkeypatch, sampler, f) for f in (0.0, 0.09, 0.1, 0.29, 0.3, 0.59, 0.6, 0.999)] == \
+        [1, 1, 2, 2, 3, 3, 4, 4]
+
+    sampler.update(1, 6.0)
+    sampler.update(3, 0.0)
+    sampler.update(99, 5.0)
+    # Cumulative weights 6, 8, 8, 12: proxy 3 can no longer be drawn
+    assert sampler._total == pytest.approx(12.0)
+    assert [draw_at(monkeypatch, sampler, f) for f in (0.49, 0.5, 0.66, 0.67, 0.999)] == [1, 2, 2, 4, 4]
+
+
+def test_fenwick_prefix_sums_follow_updates(seeded):
+    n = 37
+    weights = [random.random() for _ in range(n)]
+    sampler = WeightedSampler(records(n), weights)
+    for _ in range(200):
+        i = random.randrange(n)
+        weights[i] = random.random() * 3
+        sampler.update(i + 1, weights[i])
+
+    for i in range(1, n + 1):
+        total, j = 0.0, i
+        while j:
+            total += sampler._tree[j]
+            j -= j & -j
+        assert total == pytest.approx(sum(weights[:i]))
+    assert sampler._total == pytest.approx(sum(weights))
+
+
+def test_weighted_sample_is_distinct_and_restores_weights(seeded):
+    sampler = WeightedSampler(records(6), [1.0, 2.0, 3.0, 0.0, 5.0, 8.0])
+    for _ in range(100):
+        picked = [r.id for r in sampler.sample(5)]
+        assert len(picked) == len(set(picked)) == 5
+        assert 4 not in picked
+    assert sampler._weights == [1.0, 2.0, 3.0, 0.0, 5.0, 8.0]
+    assert sampler._total == pytest.approx(19.0)
+
+
+def test_weighted_sample_prefers_heavy_proxies(seeded):
+    sampler = WeightedSampler(records(2), [1.0, 9.0])
+    firsts = [sampler.sample(1)[0].id for _ in range(1000)]
+    assert 850 < firsts.count(2) < 950
+
+
+@pytest.mark.parametrize('strategy', ['weighted', 'p2c', 'round_robin', 'random'])
+def test_select_returns_distinct_accepted_proxies(strategy, shared, seeded):
+    selector = ProxySelector(strategy=strategy)
+    candidates = records(8)
+    for _ in range(50):
+        picked = [r.id for r in selector.select(candidates, 4)]
+        assert len(picked) == len(set(picked)) == 4
+
+        rejected = []
+        picked = [r.id for r in selector.select(candidates, 3, accept=lambda i: i % 2 == 0 or rejected.append(i))]
+        assert len(picked) == len(set(picked)) == 3
+        assert all(i % 2 == 0 for i in picked)
+        assert not set(picked) & set(rejected)
+
+    assert selector.select(candidates, 2, accept=lambda i: False) == []
+    assert len({r.id for r in selector.select(candidates, 20)}) == 8
+
+
+def test_observe_updates_sampler_weights(shared):
+    selector = ProxySelector(strategy='weighted')
+    candidates = records(3)
+    sampler = selector._sampler(candidates)
+    before = list(sampler._weights)
+
+    for _ in range(20):
+        selector.observe(2, False)
+        selector.observe(3, True, latency=0.1)
+    assert sampler._weights[0] == before[0]
+    assert sampler._weights[1] < before[1]
+    assert sampler._weights[2] > before[2]
+    assert sampler._weights[1] == pytest.approx(selector.weight(candidates[1]))
+    assert sampler._total == pytest.approx(sum(sampler._weights))
+
+
+def test_p2c_picks_the_healthier_and_less_busy_of_two(shared, seeded):
+    selector = ProxySelector(strategy='p2c')
+    candidates = records(2)
+    for _ in range(20):
+        selector.observe(1, False)
+
+    # Two candidates for one pick: every pair but (1, 1) goes to proxy 2
+    picks = [selector.pick(candidates).id for _ in range(400)]
+    assert 250 < picks.count(2) < 350
+
+    # Now proxy 2 is swamped with requests from other workers
+    for _ in range(1000):
+        shared.acquire(2)
+    picks = [selector.pick(candidates).id for _ in range(400)]
+    assert 250 < picks.count(1) < 350
+
+
+def test_p2c_orders_a_small_bucket_by_weight(shared):
+    selector = ProxySelector(strategy='p2c')
+    candidates = records(3)
+    selector.observe(1, False)
+    selector.observe(3, True, latency=0.1)
+    assert [r.id for r in selector.select(candidates, 3)] == [3, 2, 1]
+    assert [r.id for r in selector.select(candidates, 3, accept=lambda i: i != 3)] == [2, 1]
+
+
+def test_round_robin_walks_the_bucket_in_order(shared):
+    selector = ProxySelector(strategy='round_robin')
+    candidates = records(4)
+    assert [selector.pick(candidates).id for _ in range(6)] == [1, 2, 3, 4, 1, 2]
+    assert [r.id for r in selector.select(candidates, 3)] == [3, 4, 1]
+    # Rejected proxies are stepped over, and the cursor moves past them
+    assert [r.id for r in selector.select(candidates, 1, accept=lambda i: i != 2)] == [3]
+    assert selector.pick(candidates).id == 4
+
+    # Each bucket keeps its own cursor, and a new snapshot starts over
+    other = records(2)
+    assert selector.pick(other).id == 1
+    selector.reset_buckets()
+    assert selector.pick(candidates).id == 1
+
+
+def test_round_robin_uses_the_shared_cursor(shared, tmp_path):
+    from proxy_manager.services.shared import MemoryBackend
+
+    shared.backend = MemoryBackend(str(tmp_path / 'state'), slots=64, cursors=16)
+    first, second = ProxySelector(strategy='round_robin'), ProxySelector(strategy='round_robin')
+    candidates = records(3)
+    picks = [worker.pick(candidates, key='residential').id for worker in (first, second, first, second)]
+    assert picks == [1, 2, 3, 1]
@@ -0,0 +1,59 @@
+from proxy_manager.services.shared import MemoryBackend, SharedState
+
+
+def backend(tmp_path):
+    return MemoryBackend(str(tmp_path / 'state'), slots=1024, cursors=16)
+
+
+def test_stale_inflight_counts_are_ignored(tmp_path):
+    state = backend(tmp_path)
+    assert state.acquire(7) == 1
+    assert state.acquire(7) == 2
+    state.INFLIGHT_TTL = 0.0
+    # The worker that held them is gone: nothing is in flight, and the next request starts from zero
+    assert state.inflight(7) == 0
+    assert state.acquire(7) == 1
+
+
+def test_reset_inflight_survives_reopening(tmp_path):
+    state = backend(tmp_path)
+    state.acquire(1)
+    state.acquire(2)
+    state.failure(2)
+
+    shared = SharedState()
+    shared.backend = backend(tmp_path)
+    assert shared.inflight(1) == 1
+    shared.reset_inflight()
+    assert shared.inflight(1) == 0 and shared.inflight(2) == 0
+    # Breaker state is kept
+    assert shared.failure(2) == 2
+
+
+def test_p2c_reads_inflight_once_per_selection(tmp_path, monkeypatch):
+    from proxy_manager.services import selection
+    from proxy_manager.services.pool import ProxyRecord
+    from proxy_manager.services.selection import ProxySelector
+
+    shared = SharedState()
+    shared.backend = backend(tmp_path)
+    for _ in range(3):
+        shared.backend.acquire(1)
+    assert shared.inflight_many([1, 2, 3]) == {1: 3, 2: 0, 3: 0}
+
+    calls = []
+    inflight_many = shared.inflight_many
+    monkeypatch.setattr(shared, 'inflight', lambda proxy_id: calls.append('inflight'))
+    monkeypatch.setattr(shared, 'inflight_many', lambda ids: calls.append('many') or inflight_many(ids))
+    monkeypatch.setattr(selection, 'shared_state', shared)
+
+    selector = ProxySelector(strategy='p2c')
+    candidates = tuple(ProxyRecord(i, None, f"10.0.2.{i}", 8000, 'u', 'p', None, None, None, 0, 0, None)
+                       for i in (1, 2))
+    picks = []
+    for _ in range(200):
+        calls.clear()
+        picks += [r.id for r in selector.select(candidates, 1)]
+        assert calls == ['many']
+    # The busy proxy only wins a pair drawn as (1, 1)
+    assert picks.count(2) > picks.count(1)
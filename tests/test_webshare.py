@@ -0,0 +1,70 @@
+from proxy_manager import db
+from proxy_manager.models.proxy import Proxy
+from proxy_manager.services.pool import proxy_pool
+from proxy_manager.services.webshare import WebshareSync
+
+
+class ListClient:
+    """
+    Serves a fixed proxy list; `between` runs before each item is yielded
+    """
+
+    def __init__(self, items, between=None):
+        self.items = items
+        self.between = between
+
+    def proxies(self):
+        for i, item in enumerate(self.items):
+            if self.between:
+                self.between(i)
+            yield item
+
+
+def listing(password, ids=('a', 'b', 'c', 'd')):
+    return [{'id': webshare_id, 'proxy_address': f"10.0.0.{i + 1}", 'port': 8000, 'username': 'u',
+             'password': password, 'country_code': 'us', 'valid': True} for i, webshare_id in enumerate(ids)]
+
+
+def pool_passwords():
+    proxy_pool.invalidate()
+    return sorted(r.password for r in proxy_pool.snapshot().records)
+
+
+def test_pool_refreshed_between_batches_sees_every_batch(app):
+    sync = WebshareSync(batch_size=2)
+    with app.app_context():
+        sync.sync(ListClient(listing('old')))
+        assert pool_passwords() == ['old'] * 4
+
+        def refresh(i):
+            # Item 3 is read once the first batch of two updates is committed
+            if i == 3:
+                assert pool_passwords() == ['new', 'new', 'old', 'old']
+
+        counts = sync.sync(ListClient(listing('new'), between=refresh))
+        assert counts['updated'] == 4
+        assert sorted(p.password for p in Proxy.query) == ['new'] * 4
+        assert pool_passwords() == ['new'] * 4
+        db.session.rollback()
+
+
+def test_reused_address_takes_over_the_unlisted_row(app):
+    sync = WebshareSync()
+    with app.app_context():
+        sync.sync(ListClient(listing('pw', ids=('a', 'b'))))
+        # 'a' is gone and its address now belongs to 'c'
+        reused = listing('pw', ids=('c', 'b'))
+        for _ in range(2):
+            counts = sync.sync(ListClient(reused))
+            assert counts['conflicts'] == 0 and counts['deactivated'] == 0
+        rows = sorted((p.webshare_id, p.ip, p.is_active) for p in Proxy.query)
+        assert rows == [('b', '10.0.0.2', True), ('c', '10.0.0.1', True)]
+
+        # A proxy moving away frees its address for a new id in the same sync
+        moved = listing('pw', ids=('d', 'b'))
+        moved.append(dict(moved[0], id='c', proxy_address='10.0.0.9'))
+        counts = sync.sync(ListClient(moved))
+        assert counts['added'] == 1 and counts['conflicts'] == 0
+        rows = sorted((p.webshare_id, p.ip, p.is_active) for p in Proxy.query)
+        assert rows == [('b', '10.0.0.2', True), ('c', '10.0.0.9', True), ('d', '10.0.0.1', True)]
+        db.session.rollback()